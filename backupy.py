@@ -6,16 +6,31 @@
     Features:
 
     * backup sets are separatable in unique config files
-    * multiple config files as parameters - able to execute them in one batch (in sequence)
+    * multiple config files as parameters - able to execute them in one batch (in sequence or in parallel: --jobs)
     * unique backup tasks in backup sets
+    * independent backup tasks (no shared source/target device) can run in parallel: workers
     * global exclude lists (file, dir, filetype) for entire backup set
     * handling broken symlinks for "tar+follow syms+broken syms" use case
     * validate mode: only config file validation, no execution
-    * create md5sum from archive file
+    * create md5/sha256/blake2b checksum of archive file (computed while writing)
+    * sidecar index of every archive (<archive>.idx): fast listing with --list
+    * selective restore of archives (--restore ARCHIVE --path PATTERN --to DIR), seeking via the index
+    * pre-calculate estimated archive size → predict if free space will be enough (warn / skip / fail)
+    * source trees are walked once per task (parallel scan shared by pre-flight checks and archiving)
+    * include dirs listed by several tasks of a backup set are walked once per run (each task applies its own excludes)
+    * fan-out: tasks with the same include dirs read every file once, feeding all their archives (meta: fanout, opt-in)
+    * persistent file state cache (SQLite, ~/.config/backupy/filestate.sqlite): cas skips reading unchanged files (meta: filestate_cache)
+    * per-task counters and phase times (scan, estimate, read, compress, hash, write, index): --stats FILE (JSON)
+    * profiling of backup tasks (cProfile, tracemalloc): --profile DIR
+    * progress of running tasks with throughput and ETA (key=value lines if not on a terminal): --progress
+    * buffered log output, floods of similar warnings summarized per task, JSON lines log: --log-json FILE
     * every backup task is customizable
         * enabled / disabled
         * archive file name
-        * compression method (tar, targz, tarbz2, zip)
+        * compression method (tar, targz, targz-seekable, tarbz2, tarxz, tarzst, zip, cas)
+        * compression level
+        * incremental backups (snapshot manifest, deleted file list, periodic full backup)
+        * deduplicated content-addressed storage ('cas' method) with restore and garbage collection
         * store files/directories with/without full path
         * follow symlinks (true/false)
         * include directories (multiple entries)
@@ -26,30 +41,80 @@
         * result dir
         * skip task if permission fail
         * skip task if directory is non-existent
+        * checksum algorithm (md5, sha256, blake2b)
+        * multi-threaded compression for targz, tarbz2, tarxz (block-parallel) and tarzst
+        * zip: already compressed files are stored (by extension or a deflated sample), compression level 0-9
+        * multi-threaded zip: entries are deflated on a thread pool and written in order (deterministic archive)
+        * tar and stored zip entries: large files are read into one reused buffer, hashed and written from it
 """
 
+import io
 import os
 import sys
 import csv
+import gzip
+import json
 import time
+import re
+import stat
+import struct
+import bisect
+import marshal
+import mmap
 import errno
 import shutil
+import tempfile
+import fnmatch
 import hashlib
 import tarfile
 import zipfile
+import pstats
+import cProfile
 import datetime
+import tracemalloc
+import atexit
 import argparse
+import threading
+import collections
+import contextlib
+import functools
+import concurrent.futures
 try:
     import tomllib
 except ModuleNotFoundError:
     print("ERROR: Python 3.12+ is required (tomllib not available).")
     sys.exit(1)
 from pathlib import Path
+try:
+    import pwd
+    import grp
+except ImportError:
+    pwd = grp = None
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 try:
     import zlib
     zcompression = zipfile.ZIP_DEFLATED
 except ImportError:
     zcompression = zipfile.ZIP_STORED
+try:
+    import bz2
+except ImportError:
+    bz2 = None
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+try:
+    import lzma
+except ImportError:
+    lzma = None
+try:
+    from compression import zstd    # python 3.14+
+except ImportError:
+    zstd = None
 
 # Globals
 __author__ = 'Balint Fekete'
@@ -60,6 +125,10 @@ __maintainer__ = 'Balint Fekete'
 __email__ = 'kaktusztea at_ protonmail dot_ com'
 __status__ = 'Production'
 
+# .prefix: per-thread log line prefix (parallel tasks), .stats: Taskstats,
+# .backupset / .task: names for --log-json, .warnings: Logger counts
+log_context = threading.local()
+
 
 def strip_dash_string_end(line):
     while line.endswith("/"):
@@ -116,58 +185,214 @@ def create_dir(path):
     return True
 
 
-def check_if_file_is_unreadable(path):
-    return not os.access(path, os.R_OK)
-
-
-def get_unreadable_files_in_recursive_subdir(subdir, followsym):
-    lista = []
-    for root, dirs, files in os.walk(subdir):
-        for file in files:
-            ffile = os.path.join(root, file)
-            if not followsym and os.path.islink(ffile):
-                continue
-            if check_if_file_is_unreadable(ffile):
-                lista.append(ffile)
-    return lista
-
-
 def get_date():
     return datetime.datetime.now().strftime('%Y-%m-%d')
 
 
-def get_time():
-    return datetime.datetime.now().strftime('[%H:%M:%S]')
-
-
 def get_time_short():
     return datetime.datetime.now().strftime('%H%M')
 
 
+class Logger:
+    """ Leveled, buffered log output behind printLog / printOK / printWarning / printError / printDebug.
+
+        Messages are formatted only if they get logged: 'msg % args', or msg() if it's
+        a callable. Info and error lines are written at once (with the buffered lines
+        before them), debug and warning lines are buffered: written in one go every
+        FLUSH_LINES lines, FLUSH_SECONDS after the first buffered line (a timer thread,
+        also if nothing else gets logged), at the end of a task and at exit.
+        Warnings with a key (e.g. 'Skip file (permission error)') are logged WARNING_LIMIT
+        times per task, the rest is counted and summarized at the end of the task
+        (log_context.warnings); outside of tasks at the end of the backup set and at
+        exit. --log-json FILE: every logged line as a JSON record too.
+    """
+    DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+    LEVEL_NAMES = {DEBUG: "debug", INFO: "info", WARNING: "warning", ERROR: "error"}
+    FLUSH_LINES = 1000
+    FLUSH_SECONDS = 1.0
+    WARNING_LIMIT = 100
+    ANSI_CODES = re.compile(r"\033\[[0-9;]*m")
+
+    def __init__(self):
+        self.level = self.INFO
+        self.json_path = None
+        self._json_file = None
+        self._json_records = []
+        self._lock = threading.RLock()
+        self._buffer = []
+        self._stream = None    # sys.stdout when the buffered lines were logged
+        self._buffered_at = 0.0
+        self._timer = None    # threading.Timer: flushes the lines buffered FLUSH_SECONDS ago
+        self._warnings = collections.Counter()    # outside of tasks
+        self._stamp_second = None
+        self._stamp = ""
+
+    def open_json(self, path):
+        """ JSON-lines sink (appended: --jobs worker processes share it) """
+        with self._lock:
+            self.close_json()
+            self._json_file = open(path, "a", encoding="utf-8", errors="surrogateescape")
+            self.json_path = path
+
+    def close_json(self):
+        with self._lock:
+            self.summarize()
+            self.flush()
+            if self._json_file is not None:
+                self._json_file.close()
+            self._json_file = self.json_path = None
+
+    def _timestamp(self, now):
+        second = int(now)
+        if second != self._stamp_second:    # one strftime per second, not per line
+            self._stamp_second, self._stamp = second, time.strftime("[%H:%M:%S]", time.localtime(second))
+        return self._stamp
+
+    def log(self, level, msg, args=(), color="", key=None, pre_empty_lines=0):
+        if level < self.level:
+            return
+        if key is not None:
+            counts = getattr(log_context, "warnings", None)
+            with self._lock:
+                if counts is None:
+                    counts = self._warnings
+                counts[key] += 1
+                if counts[key] > self.WARNING_LIMIT:
+                    return
+        text = msg() if callable(msg) else msg % args if args else str(msg)
+        prefix = Backupy.log_prefix + getattr(log_context, "prefix", "")
+        now = time.time()
+        with self._lock:
+            stream = sys.stdout
+            if stream is not self._stream:
+                self.flush(stdout=True)
+                self._stream = stream
+            if not self._buffer:
+                self._buffered_at = now
+            line = f"{self._timestamp(now)} {prefix}{color}{text}{Colors.colorreset if color else ''}\n"
+            self._buffer.append("\n" * pre_empty_lines + line)
+            if self._json_file is not None:
+                self._json_records.append(json.dumps({
+                    "time": datetime.datetime.fromtimestamp(now).isoformat(timespec="milliseconds"),
+                    "level": self.LEVEL_NAMES[level], "set": getattr(log_context, "backupset", None),
+                    "task": getattr(log_context, "task", None), "message": self.ANSI_CODES.sub("", text)},
+                    ensure_ascii=False) + "\n")
+            if level in (self.INFO, self.ERROR) or len(self._buffer) >= self.FLUSH_LINES \
+                    or now - self._buffered_at >= self.FLUSH_SECONDS:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.FLUSH_SECONDS - (now - self._buffered_at), self._timed_flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+            self.flush()
+
+    def summarize(self, counts=None):
+        """ Warnings over WARNING_LIMIT (per key) that were only counted (default: outside of tasks) """
+        if counts is None:
+            counts = self._warnings
+        for key, count in sorted(counts.items()):
+            if count > self.WARNING_LIMIT:
+                self.log(self.WARNING, "%s: %d more not logged (%d in total)",
+                         (key, count - self.WARNING_LIMIT, count), Colors.coloryellow)
+        counts.clear()
+
+    def flush(self, stdout=False):
+        """ Writes the buffered lines (one write: lines of parallel tasks don't get interleaved),
+            stdout: also flushes the stream
+        """
+        with self._lock:
+            stream = self._stream
+            if stream is None or stream.closed:    # e.g. a redirected stdout that's gone
+                stream = self._stream = sys.stdout
+            if self._buffer:
+                stream.write("".join(self._buffer))
+                self._buffer = []
+            if stdout:
+                stream.flush()
+            if self._json_records:
+                self._json_file.write("".join(self._json_records))
+                self._json_records = []
+                self._json_file.flush()
+
+
+logger = Logger()
+atexit.register(logger.close_json)
+
+
 def printLog(log, pre_empty_lines=0):
-    pp = "\n" * pre_empty_lines + get_time() + " " + str(log)
-    print(pp)
+    logger.log(Logger.INFO, log, pre_empty_lines=pre_empty_lines)
 
 
-def printWarning(log):
+def printWarning(log, key=None):
+    """ log: line or list of lines, key: see Logger (flood of similar warnings) """
     if isinstance(log, str):
-        printLog(Colors.coloryellow + log + Colors.colorreset)
+        logger.log(Logger.WARNING, log, color=Colors.coloryellow, key=key)
     if isinstance(log, list):
         for line in log:
-            printLog(" " + Colors.coloryellow + line + Colors.colorreset)
+            logger.log(Logger.WARNING, " " + line, color=Colors.coloryellow, key=key)
+
+
+def printSkip(what, reason, path):
+    """ 'Skip <what> (<reason>): <path>' warning, counted by reason in the running task's Taskstats """
+    logger.log(Logger.WARNING, "Skip %s (%s): %s", (what, reason, path), Colors.coloryellow, key=f"Skip {what} ({reason})")
+    stats = getattr(log_context, "stats", None)
+    if stats is not None:
+        stats.skip(reason)
+
+
+def with_log_context(func):
+    """ func for a pool thread: runs with the log context (prefix, stats) of the submitting thread """
+    context = dict(log_context.__dict__)
+
+    def run(*args, **kwargs):
+        log_context.__dict__.update(context)
+        return func(*args, **kwargs)
+    return run
 
 
 def printError(log):
-    printLog(Colors.colorred + str(log) + Colors.colorreset)
+    logger.log(Logger.ERROR, log, color=Colors.colorred)
 
 
-def printDebug(log):
-    if Backupy.debug:
-        printLog(Colors.coloryellow + str(log) + Colors.colorreset)
+def printDebug(log, *args):
+    """ Formatted only in debug mode: printDebug("%s: %s", reason, path) """
+    logger.log(Logger.DEBUG, log, args, Colors.coloryellow)
 
 
 def printOK(log):
-    printLog(Colors.colorgreen + str(log) + Colors.colorreset)
+    logger.log(Logger.INFO, log, color=Colors.colorgreen)
+
+
+def profile_call(func, path_base):
+    """ --profile: runs func under cProfile and tracemalloc, writes '<path_base>.prof' (pstats dump)
+        and '<path_base>.txt' (functions by cumulative time, top allocating lines)
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        if not tracing:
+            tracemalloc.stop()
+        try:
+            profiler.dump_stats(f"{path_base}.prof")
+            with open(f"{path_base}.txt", "w") as f:
+                f.write(f"Peak traced memory: {sizeof_fmt(peak)}\n\n")
+                pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+                f.write("Top allocating lines:\n")
+                for statistic in snapshot.statistics("lineno")[:20]:
+                    f.write(f"{statistic}\n")
+            printLog(f"Profile: {path_base}.prof, {path_base}.txt")
+        except OSError as err:
+            printWarning(f"Cannot write profile: {err.strerror} ({path_base})")
 
 
 def exit_config_error(config_file, section, comment, exitnow=True):
@@ -182,6 +407,12 @@ def exit_config_error(config_file, section, comment, exitnow=True):
         sys.exit(1)
 
 
+def format_elapsed(seconds):
+    hours, rem = divmod(seconds, 3600)
+    minutes, seconds = divmod(rem, 60)
+    return f"{int(hours):0>2}:{int(minutes):0>2}:{seconds:02.0f}"
+
+
 def sizeof_fmt(num, suffix='B'):
     """ returns with human readable byte size format """
     for unit in ['', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi']:
@@ -191,10 +422,50 @@ def sizeof_fmt(num, suffix='B'):
     return f"{num:.1f}Yi{suffix}"
 
 
+def get_dir_free_bytes(dirname):
+    st = os.statvfs(dirname)
+    return st.f_bavail * st.f_frsize
+
+
 def get_dir_free_space(dirname):
     """ returns directory's free space in human readable format """
-    st = os.statvfs(dirname)
-    return sizeof_fmt(st.f_bavail * st.f_frsize)
+    return sizeof_fmt(get_dir_free_bytes(dirname))
+
+
+def available_cpu_count(cgroup_root="/sys/fs/cgroup"):
+    """ usable CPUs: affinity mask limited by the cgroup (v2 or v1) CPU quota """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    quota = period = None
+    try:
+        with open(os.path.join(cgroup_root, "cpu.max")) as f:
+            quota, period = f.read().split()[:2]
+    except (OSError, ValueError):
+        try:
+            with open(os.path.join(cgroup_root, "cpu", "cpu.cfs_quota_us")) as f:
+                quota = f.read().strip()
+            with open(os.path.join(cgroup_root, "cpu", "cpu.cfs_period_us")) as f:
+                period = f.read().strip()
+        except OSError:
+            pass
+    if quota not in (None, "max", "-1") and period and int(period) > 0:
+        count = min(count, -(-int(quota) // int(period)))
+    return max(count, 1)
+
+
+def get_device_id(path):
+    """ st_dev of path, or of its nearest existing parent (eg. result dir not created yet) """
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return None
 
 
 class Colors:
@@ -206,6 +477,146 @@ class Colors:
     colorbold = "\033[1m"
 
 
+class Taskresult:
+    def __init__(self, name):
+        self.name = name
+        self.status = "skipped"
+        self.exit_code = 0    # status "failed": the code the task exited with
+        self.elapsed = 0.0
+        self.size = 0
+        self.stats = {}    # Taskstats.as_dict()
+
+
+class Taskstats:
+    """ Counters and phase times of one backup task run (task summary, --stats).
+
+        'archive' contains 'read' (source files), 'hash' and 'write' (archive output)
+        and 'index'; what remains is reported as 'compress' (archiver and compressor).
+        Reads on parallel compression threads are summed, so 'compress' is only
+        meaningful for single-threaded runs.
+    """
+    PHASES = ("scan", "estimate", "read", "compress", "hash", "write", "index", "archive")
+
+    def __init__(self):
+        self.entries = 0
+        self.files = 0
+        self.bytes_in = 0    # size of the archived files
+        self.bytes_read = 0    # read from the source (cas: unchanged files are not read)
+        self.bytes_out = 0
+        self.files_read = 0
+        self.skipped = collections.Counter()
+        self.phases = collections.defaultdict(float)
+        self.progress = None    # Progressmeter: --progress
+        self._lock = threading.Lock()
+
+    def __getstate__(self):    # --jobs: tasks are pickled into the worker processes
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.phases[name] += seconds
+
+    def add_read(self, seconds, size):
+        with self._lock:
+            self.phases["read"] += seconds
+            self.bytes_read += size
+            if self.progress is not None:
+                self.progress.update(self.bytes_read, self.files_read)
+
+    def add_file(self):
+        with self._lock:
+            self.files_read += 1
+
+    def skip(self, reason):
+        with self._lock:
+            self.skipped[reason] += 1
+
+    def count_index(self, entries):
+        """ entries / files / bytes_in from the archive index entries """
+        self.entries = len(entries)
+        files = [entry for entry in entries if entry[1] in (tarfile.REGTYPE, tarfile.AREGTYPE)]
+        self.files = len(files)
+        self.bytes_in = sum(entry[3] for entry in files)
+
+    def phase_times(self):
+        phases = dict(self.phases)
+        if "archive" in phases:
+            inner = sum(phases.get(name, 0.0) for name in ("read", "hash", "write", "index"))
+            phases["compress"] = max(0.0, phases["archive"] - inner)
+        return {name: phases[name] for name in self.PHASES if name in phases}
+
+    def format_phases(self):
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phase_times().items())
+
+    def as_dict(self):
+        return {"entries": self.entries, "files": self.files, "bytes_in": self.bytes_in,
+                "bytes_read": self.bytes_read, "bytes_out": self.bytes_out,
+                "skipped": dict(sorted(self.skipped.items())),
+                "phases": {name: round(seconds, 6) for name, seconds in self.phase_times().items()}}
+
+
+class Progressmeter:
+    """ --progress: a progress line of a running task at most every 'interval' seconds,
+        driven by the read counters of Taskstats (bytes, files).
+
+        With the totals of the pre-scan (size estimation) the line has percentage
+        and ETA, otherwise throughput and elapsed time only. On a terminal the line
+        is human readable, otherwise it is 'progress key=value ...' for log parsers.
+    """
+    def __init__(self, task_name, interval=1.0, total_bytes=None, total_files=None, tty=None):
+        self.task_name = task_name
+        self.interval = interval
+        self.total_bytes = total_bytes
+        self.total_files = total_files
+        self.tty = sys.stdout.isatty() if tty is None else tty
+        self.start = self._last_time = time.monotonic()
+        self._last_bytes = 0
+        self._next = self.start + interval
+
+    def update(self, done_bytes, done_files):
+        """ Called on every read: cheap unless the interval is over """
+        now = time.monotonic()
+        if now < self._next:
+            return
+        self._next = now + self.interval
+        rate = (done_bytes - self._last_bytes) / (now - self._last_time)
+        self._last_time, self._last_bytes = now, done_bytes
+        printLog(self.format(done_bytes, done_files, rate, now - self.start))
+
+    def format(self, done_bytes, done_files, rate, elapsed):
+        eta = None
+        if self.total_bytes and done_bytes:
+            eta = max(0.0, (self.total_bytes - done_bytes) * elapsed / done_bytes)
+        if not self.tty:
+            fields = {"task": json.dumps(self.task_name), "bytes": done_bytes, "total_bytes": self.total_bytes,
+                      "files": done_files, "total_files": self.total_files, "rate": int(rate),
+                      "elapsed": round(elapsed, 1), "eta": None if eta is None else round(eta, 1)}
+            return "progress " + " ".join(f"{key}={value}" for key, value in fields.items() if value is not None)
+        line = f"Progress: {sizeof_fmt(done_bytes)}"
+        if self.total_bytes:
+            line = f"Progress: {min(100.0, 100.0 * done_bytes / self.total_bytes):.1f}% " \
+                   f"{sizeof_fmt(done_bytes)} / {sizeof_fmt(self.total_bytes)}"
+        files = f"{done_files}/{self.total_files}" if self.total_files else f"{done_files}"
+        line += f", {files} files, {sizeof_fmt(rate)}/s, elapsed {format_elapsed(elapsed)}"
+        if eta is not None:
+            line += f", ETA {format_elapsed(eta)}"
+        return line
+
+
 class Configglobal:
     def __init__(self):
         self.exclude_files = []
@@ -213,74 +624,1931 @@ class Configglobal:
         self.exclude_dir_names = []
 
 
-class BackupyTarfile(tarfile.TarFile):
-    """ Override default built-in python tarfile library's add method
-        to handle permission read errors and be able to skip intead of
-        immediate exception.
+class Hashingwriter:
+    """ Write-only archive output: hashes the bytes on their way to disk,
+        so the finished archive never has to be read back for its checksum.
+        Deliberately not seekable: zipfile then writes data descriptors
+        instead of seeking back to patch local file headers.
+        Content stored as is (plain tar, stored zip entries) can be appended
+        with copy_from: read into a reused buffer, hashed and written from there.
     """
-    def add(self, name, arcname=None, recursive=True, exclude=None, *, filter=None):
-        self._check("aw")
+    COPY_FROM_SIZE = 256 * 1024    # below: the copy through python objects is as fast
+    COPY_WINDOW = 8 * 2 ** 20
+
+    def __init__(self, path, algorithm, stats=None):
+        self.name = path
+        self.hash = hashlib.new(algorithm)
+        self.size = 0
+        self.stats = stats    # Taskstats: 'hash' and 'write' times
+        self._file = open(path, "wb")
+        self._window = None    # copy_from buffer
+
+    def write(self, data):
+        if self.stats is None:
+            self.hash.update(data)
+            written = self._file.write(data)
+        else:
+            start = time.perf_counter()
+            self.hash.update(data)
+            hashed = time.perf_counter()
+            written = self._file.write(data)
+            self.stats.add_time("hash", hashed - start)
+            self.stats.add_time("write", time.perf_counter() - hashed)
+        self.size += written
+        return written
+
+    def can_copy_from(self, src, size):
+        """ True if copy_from can append size bytes of the file object src: a regular file, at least that long """
+        if size < self.COPY_FROM_SIZE:
+            return False
+        try:
+            statres = os.fstat(src.fileno())
+        except (AttributeError, OSError, ValueError):    # io.UnsupportedOperation is an OSError and a ValueError
+            return False
+        return stat.S_ISREG(statres.st_mode) and statres.st_size >= size
+
+    def copy_from(self, src, size):
+        """ Appends the first size bytes of the regular file src (whatever its position) without
+            passing them through python objects: window by window read (os.preadv) into one reused
+            buffer, hashed (and crc32) and written (os.write) from that buffer - the archive holds
+            exactly the bytes that were hashed, even if the file changes meanwhile. A file that
+            shrank is padded with zeros (like GNU tar does), the archive stays consistent.
+            Returns the crc32 of the data.
+        """
+        self._file.flush()
+        src_fd, out_fd = src.fileno(), self._file.fileno()
+        window_size = min(size, self.COPY_WINDOW)
+        if self._window is None or len(self._window) < window_size:
+            self._window = bytearray(window_size)
+        crc = done = 0
+        with memoryview(self._window) as buffer:
+            while done < size:
+                count = min(size - done, window_size)
+                start = time.perf_counter()
+                read = os.preadv(src_fd, [buffer[:count]], done)
+                if not read:
+                    break    # shrank
+                with buffer[:read] as window:
+                    self.hash.update(window)
+                    crc = zlib.crc32(window, crc)
+                    hashed = time.perf_counter()
+                    written = 0
+                    while written < read:
+                        written += os.write(out_fd, window[written:])
+                if self.stats is not None:
+                    self.stats.add_time("hash", hashed - start)
+                    self.stats.add_time("write", time.perf_counter() - hashed)
+                    self.stats.add_read(0.0, read)
+                done += read
+        if done < size:
+            printWarning(f"File shrank while archiving, padded with {size - done} zero bytes: {src.name}")
+            padding = bytes(min(size - done, window_size))
+            while done < size:
+                chunk = padding[:size - done]
+                self.hash.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+                self._file.write(chunk)
+                done += len(chunk)
+            self._file.flush()
+        self.size += size
+        return crc
+
+    def tell(self):
+        return self.size
+
+    def seekable(self):
+        return False
 
-        if arcname is None:
-            arcname = name
+    def seek(self, offset, whence=os.SEEK_SET):
+        raise io.UnsupportedOperation("Hashingwriter is not seekable")
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
-        # Exclude pathnames.
-        if exclude is not None:
-            import warnings
-            warnings.warn("use the filter argument instead", DeprecationWarning, 2)
-            if exclude(name):
-                self._dbg(2, f"tarfile: Excluded {name!r}")
-                return
 
-        # Skip if somebody tries to archive the archive...
-        if self.name is not None and os.path.abspath(name) == self.name:
-            self._dbg(2, f"tarfile: Skipped {name!r}")
+class Parallelcompressor:
+    """ pigz / pbzip2 style block-parallel compression stream.
+
+        The written byte stream is cut into blocks, every block is compressed
+        on a thread pool (zlib, bz2 and lzma release the GIL) into an
+        independent gzip member / bzip2 stream / xz stream, and the results
+        are written to fileobj in order. Concatenated members are read back
+        by gzip, bzip2, xz and python's tarfile as one stream.
+        blocks: (uncompressed offset, compressed offset) of every block -
+        a block can be decompressed on its own (see Seekablegzipreader).
+    """
+    BLOCK_SIZES = {'gz': 2 ** 20, 'bz2': 900 * 1000, 'xz': 8 * 2 ** 20}
+    DEFAULT_LEVELS = {'gz': 9, 'bz2': 9, 'xz': 6}
+
+    def __init__(self, fileobj, codec, threads, level=None, blocksize=None):
+        self.fileobj = fileobj
+        self.codec = codec
+        self.level = self.DEFAULT_LEVELS[codec] if level is None else level
+        self.blocksize = blocksize or self.BLOCK_SIZES[codec]
+        self.size = 0    # uncompressed bytes written
+        self.compressed_size = 0
+        self.blocks = []
+        self._block_start = 0
+        self._buffer = bytearray()
+        self._pending = collections.deque()
+        self._max_pending = threads * 2    # bounds memory: at most this many blocks in flight
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
+    def _compress_block(self, block):
+        match self.codec:
+            case 'gz':
+                compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)    # 31: gzip member
+                return compressor.compress(block) + compressor.flush()
+            case 'bz2':
+                return bz2.compress(block, self.level)
+            case 'xz':
+                return lzma.compress(block, format=lzma.FORMAT_XZ, preset=self.level)
+
+    def _write_next(self):
+        block_start, future = self._pending.popleft()
+        data = future.result()
+        self.blocks.append((block_start, self.compressed_size))
+        self.fileobj.write(data)
+        self.compressed_size += len(data)
+
+    def _submit(self, block):
+        if len(self._pending) >= self._max_pending:
+            self._write_next()
+        self._pending.append((self._block_start, self._pool.submit(self._compress_block, block)))
+        self._block_start += len(block)
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self.blocksize:
+            self._submit(bytes(self._buffer[:self.blocksize]))
+            del self._buffer[:self.blocksize]
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        pass    # a partial block is only compressed at close()
+
+    def close(self):
+        if self._pool is None:
             return
+        if self._buffer or not self.size:
+            self._submit(bytes(self._buffer))
+            self._buffer.clear()
+        while self._pending:
+            self._write_next()
+        self._pool.shutdown()
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
 
-        self._dbg(1, name)
 
-        # Create a TarInfo object from the file.
+def probe_zipfile_internals():
+    """ The fast zip paths set private zipfile attributes (CPython 3.11-3.14): probed once at startup,
+        a path whose attributes are missing falls back to the public ZipFile API
+    """
+    with zipfile.ZipFile(io.BytesIO(), "w") as archive, archive.open("probe", "w") as member:
+        return {
+            "append": all(hasattr(archive, name) for name in ("_lock", "_writecheck", "_didModify", "start_dir")),
+            # ZipInfo attribute of the level ZipFile.open(zinfo, 'w') compresses with (public from 3.13)
+            "level": next((name for name in ("compress_level", "_compresslevel")
+                           if hasattr(zipfile.ZipInfo(), name)), None),
+            # content of a stored entry copied past the writer: its crc and sizes are set on the writer
+            "copy": all(hasattr(member, name) for name in ("_crc", "_file_size", "_compress_size")),
+        }
+
+
+ZIPFILE_INTERNALS = probe_zipfile_internals()
+
+
+class Parallelzipwriter:
+    """ Parallel deflate of zip entries: whole files are read and compressed on a
+        thread pool (zlib releases the GIL), the caller's thread appends them to
+        the ZipFile in submission order - the archive is the same for any thread
+        count. Entries are written with their CRC and sizes in the local header
+        (no data descriptor). At most max_inflight bytes of source files are in
+        flight, files above STREAM_SIZE are left to the caller to stream.
+        Needs ZIPFILE_INTERNALS["append"]: ZipFile has no public call to append pre-compressed data.
+    """
+    STREAM_SIZE = 16 * 2 ** 20
+    MAX_INFLIGHT = 64 * 2 ** 20
+
+    def __init__(self, archive, threads, max_inflight=None):
+        self.archive = archive
+        self.max_inflight = max_inflight or max(self.MAX_INFLIGHT, threads * 2 * self.STREAM_SIZE)
+        self._inflight = 0
+        self._pending = collections.deque()    # (item, size, future)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
+    def compress(self, zinfo, data):
+        """ Fills in the CRC and sizes of zinfo, returns the entry's data as it goes to the archive """
+        zinfo.file_size = len(data)
+        zinfo.CRC = zlib.crc32(data)
+        if zinfo.compress_type == zipfile.ZIP_DEFLATED:
+            level = zlib.Z_DEFAULT_COMPRESSION if self.archive.compresslevel is None else self.archive.compresslevel
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)    # -15: raw deflate, as zipfile does
+            data = compressor.compress(data) + compressor.flush()
+        zinfo.compress_size = len(data)
+        return data
+
+    def submit(self, item, size, job, *args):
+        """ Queues job(*args) -> (ZipInfo, data), yields the (item, future) pairs due to be appended """
+        self._pending.append((item, size, self._pool.submit(job, *args)))
+        self._inflight += size
+        while self._pending and self._inflight > self.max_inflight:
+            yield self._next()
+
+    def drain(self):
+        """ Yields every queued (item, future) pair """
+        while self._pending:
+            yield self._next()
+
+    def _next(self):
+        item, size, future = self._pending.popleft()
+        self._inflight -= size
+        return item, future
+
+    def append(self, zinfo, data):
+        """ Writes a compressed entry (ZipFile.writestr without the ZipFile.open round trip),
+            returns its compress type
+        """
+        archive = self.archive
+        zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or zinfo.compress_size > zipfile.ZIP64_LIMIT
+        with archive._lock:
+            archive._writecheck(zinfo)
+            zinfo.header_offset = archive.fp.tell()
+            archive._didModify = True
+            archive.fp.write(zinfo.FileHeader(zip64))
+            archive.fp.write(data)
+            archive.filelist.append(zinfo)
+            archive.NameToInfo[zinfo.filename] = zinfo
+            archive.start_dir = archive.fp.tell()
+        return zinfo.compress_type
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Seekablegzipreader:
+    """ Random access read of a 'targz-seekable' archive: a seek decompresses from the
+        start of the gzip member holding the target offset, looked up in the block table
+        ((uncompressed offset, compressed offset) pairs) of the archive index.
+    """
+    def __init__(self, path, blocks):
+        self.name = path
+        self._file = open(path, "rb")
+        self._blocks = blocks
+        self._starts = [start for start, _ in blocks]
+        self._stream = None
+        self._pos = 0
+
+    def _open_block(self, offset):
+        i = max(bisect.bisect_right(self._starts, offset) - 1, 0)
+        start, compressed_start = self._blocks[i]
+        self._file.seek(compressed_start)
+        self._stream = gzip.GzipFile(fileobj=self._file, mode="rb")
+        self._pos = start
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence != os.SEEK_SET:
+            raise io.UnsupportedOperation("Seekablegzipreader can't seek from the end")
+        # a new block is opened unless the target is ahead in the current one
+        i = bisect.bisect_right(self._starts, offset) - 1
+        if self._stream is None or offset < self._pos or (i >= 0 and self._starts[i] > self._pos):
+            self._open_block(offset)
+        while self._pos < offset:
+            data = self._stream.read(min(offset - self._pos, 2 ** 20))
+            if not data:
+                break
+            self._pos += len(data)
+        return self._pos
+
+    def read(self, size=-1):
+        if self._stream is None:
+            self._open_block(0)
+        data = self._stream.read(size)
+        self._pos += len(data)
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Snapshotmanifest:
+    """ File state manifest of an incremental backup task.
+
+        Maps source path -> packed (size, mtime_ns, inode, ctime_ns). It is
+        stored with marshal, which loads 10M+ entries fast, and a file is
+        unchanged if one dict lookup + one bytes comparison says so.
+    """
+    VERSION = 1
+    STATE = struct.Struct("<qqqq")
+
+    def __init__(self, path):
+        self.path = path
+        self.old = {}
+        self.new = {}
+        self.full = True
+        self.incrementals = 0    # incremental runs since the last full one
+
+    def load(self, full_every):
+        """ full_every: force a full backup every Nth run (0: never) """
         try:
-            tarinfo = self.gettarinfo(name, arcname)
+            with open(self.path, "rb") as f:
+                version, incrementals, entries = marshal.load(f)
         except FileNotFoundError:
-            printWarning(f"Skip file (broken symlink): {name}")
             return
+        except (OSError, EOFError, ValueError, TypeError) as err:
+            printWarning(f"Cannot read snapshot manifest ({err}), doing a full backup: {self.path}")
+            return
+        if version != self.VERSION:
+            printWarning(f"Unknown snapshot manifest version ({version}), doing a full backup: {self.path}")
+            return
+        if full_every and incrementals + 1 >= full_every:
+            return
+        self.full = False
+        self.incrementals = incrementals + 1
+        self.old = entries
+
+    def unchanged(self, path, statres):
+        """ Records the file's state, returns True if it's the same as in the previous run """
+        state = self.STATE.pack(statres.st_size, statres.st_mtime_ns, statres.st_ino, statres.st_ctime_ns)
+        self.new[path] = state
+        return self.old.get(path) == state
+
+    def forget(self, path):
+        """ File could not be archived: it must count as new in the next run """
+        self.new.pop(path, None)
+
+    def deleted(self):
+        return [path for path in self.old if path not in self.new]
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            marshal.dump((self.VERSION, self.incrementals, self.new), f)
+        os.replace(tmp_path, self.path)
+
+
+class Filestatecache:
+    """ Per-file state kept between runs: ~/.config/backupy/filestate.sqlite
+
+        A row belongs to (st_dev, st_ino) and is valid while size, mtime_ns and
+        ctime_ns are the same, it holds the content hash of the file (its
+        chunk id list in a cas store) and when it was last archived. Lookups
+        read the database (WAL mode: parallel backup sets read while one
+        writes), updates are collected and written in one transaction when
+        the cache is closed. Above MAX_ENTRIES the least recently used rows
+        are evicted, the file is vacuumed if more than a quarter of it is free.
+    """
+    MAX_ENTRIES = 1000000
+    SCHEMA = ("CREATE TABLE IF NOT EXISTS filestate (dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+              "ctime_ns INTEGER, chunks TEXT, archived REAL, used REAL, PRIMARY KEY (dev, ino)) WITHOUT ROWID",
+              "CREATE INDEX IF NOT EXISTS filestate_used ON filestate (used)")
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self._db = None
+        self._now = time.time()
+        self._updates = {}    # (dev, ino): row
+        self._used = set()
+
+    @staticmethod
+    def default_path():
+        return os.path.join(os.path.expanduser("~"), ".config/backupy", "filestate.sqlite")
+
+    def open(self):
+        """ Returns self, or None if the cache can't be used (the run goes on without it) """
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            for statement in self.SCHEMA:
+                self._db.execute(statement)
+            self._db.commit()
+        except (OSError, sqlite3.Error) as err:
+            printWarning(f"Cannot open file state cache ({err}): {self.path}")
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            return None
+        return self
+
+    def lookup(self, statres):
+        """ The cached row of an unchanged file as a dict (chunks: list, archived), or None """
+        key = (statres.st_dev, statres.st_ino)
+        row = self._updates.get(key)
+        if row is None:
+            try:
+                row = self._db.execute("SELECT size, mtime_ns, ctime_ns, chunks, archived FROM filestate "
+                                       "WHERE dev = ? AND ino = ?", key).fetchone()
+            except sqlite3.Error as err:
+                printWarning(f"Cannot read file state cache ({err}): {self.path}")
+                return None
+        if row is None or row[:3] != (statres.st_size, statres.st_mtime_ns, statres.st_ctime_ns):
+            return None
+        self._used.add(key)
+        self.hits += 1
+        return {"chunks": row[3].split() if row[3] is not None else None, "archived": row[4]}
+
+    def store(self, statres, chunks=None):
+        """ Records a file that was just archived """
+        self._updates[(statres.st_dev, statres.st_ino)] = (
+            statres.st_size, statres.st_mtime_ns, statres.st_ctime_ns,
+            " ".join(chunks) if chunks is not None else None, self._now)
+
+    def close(self):
+        if self._db is None:
+            return
+        try:
+            with self._db:
+                self._db.executemany("UPDATE filestate SET used = ? WHERE dev = ? AND ino = ?",
+                                     ((self._now,) + key for key in self._used - self._updates.keys()))
+                self._db.executemany("INSERT OR REPLACE INTO filestate VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (key + row + (self._now,) for key, row in self._updates.items()))
+            self.evict()
+        except sqlite3.Error as err:
+            printWarning(f"Cannot update file state cache ({err}): {self.path}")
+        finally:
+            self._db.close()
+            self._db = None
+            self._updates.clear()
+            self._used.clear()
+
+    def evict(self):
+        """ LRU eviction down to MAX_ENTRIES, then compaction if it's worth it """
+        (count,) = self._db.execute("SELECT COUNT(*) FROM filestate").fetchone()
+        if count <= self.MAX_ENTRIES:
+            return
+        with self._db:
+            self._db.execute("DELETE FROM filestate WHERE (dev, ino) IN "
+                             "(SELECT dev, ino FROM filestate ORDER BY used LIMIT ?)", (count - self.MAX_ENTRIES,))
+        self.compact()
+
+    def compact(self):
+        (pages,) = self._db.execute("PRAGMA page_count").fetchone()
+        (free,) = self._db.execute("PRAGMA freelist_count").fetchone()
+        if free * 4 > pages:
+            self._db.execute("VACUUM")
+        self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+Planstat = collections.namedtuple("Planstat", "st_mode st_ino st_dev st_nlink st_uid st_gid st_size "
+                                              "st_mtime st_mtime_ns st_ctime_ns st_rdev")
+
+
+def readable_by_mode(statres, uid, gids):
+    """ Read permission from the stat mode bits (owner / group / other class, no ACLs) """
+    if uid == 0:
+        return True
+    if statres.st_uid == uid:
+        return bool(statres.st_mode & stat.S_IRUSR)
+    if statres.st_gid in gids:
+        return bool(statres.st_mode & stat.S_IRGRP)
+    return bool(statres.st_mode & stat.S_IROTH)
+
+
+class Scanplan:
+    """ File list of a backup task: the include dirs are walked once, every consumer
+        (permission pre-flight, size estimation, archiver) iterates this list.
+
+        Directories are scanned with os.scandir on a thread pool (stat releases
+        the GIL), excluded subtrees are pruned, readability is decided from the
+        mode bits. Entries are (include dir index, path, Planstat), in a breadth-first
+        order that does not depend on the threads (directories in submission order,
+        their entries sorted by name in chunks of SCAN_CHUNK, a bigger directory keeps
+        its listing order between the chunks): a directory always comes before its
+        content. At most 2 * SCAN_WORKERS scanned chunks wait for the consumer. Above SPILL_ENTRIES entries the list is
+        spilled to an unnamed temp file in marshal batches.
+    """
+    SCAN_WORKERS = 8
+    SCAN_CHUNK = 10000    # entries of a directory per scan job: huge directories are not held in memory
+    SPILL_ENTRIES = 100000
+
+    def __init__(self, include_dirs, followsym):
+        self.include_dirs = include_dirs
+        self.followsym = followsym
+        self.count = 0
+        self.unreadable = []
+        self.unlistable = []    # dirs that could not be scanned (also in unreadable)
+        self._entries = []
+        self._spill = None
+        self._spill_lock = threading.Lock()
+        self._uid = os.geteuid()
+        self._gids = set(os.getgroups()) | {os.getegid()}
+
+    @staticmethod
+    def _planstat(statres):
+        return Planstat(statres.st_mode, statres.st_ino, statres.st_dev, statres.st_nlink, statres.st_uid,
+                        statres.st_gid, statres.st_size, statres.st_mtime, statres.st_mtime_ns,
+                        statres.st_ctime_ns, statres.st_rdev)
+
+    def _append(self, entry):
+        self._entries.append(entry)
+        self.count += 1
+        if len(self._entries) >= self.SPILL_ENTRIES:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(prefix="backupy-plan-")
+            marshal.dump([(i, path, tuple(st)) for i, path, st in self._entries], self._spill)
+            self._entries = []
+
+    def _check_readable(self, path, statres):
+        if stat.S_ISREG(statres.st_mode) and not readable_by_mode(statres, self._uid, self._gids):
+            self.unreadable.append(path)
+
+    def _scan_dir(self, index, path, exclude_file, exclude_dir, listing=None):
+        """ Up to SCAN_CHUNK entries of one directory: returns (index, path, entries, subdirs, listing) -
+            listing: the open os.scandir iterator if there is more (the next job goes on with it),
+            subdirs are walked by the caller
+        """
+        entries, subdirs = [], []
+        try:
+            if listing is None:
+                listing = os.scandir(path)
+            chunk = [entry for _, entry in zip(range(self.SCAN_CHUNK), listing)]
+            if len(chunk) < self.SCAN_CHUNK:
+                listing.close()
+                listing = None
+            for entry in sorted(chunk, key=lambda entry: entry.name):    # same member order on every run
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=self.followsym)
+                    if (exclude_dir if is_dir else exclude_file)(entry.path, index):
+                        continue
+                    statres = entry.stat(follow_symlinks=self.followsym)
+                except FileNotFoundError:
+                    printSkip("file", "broken symlink", entry.path)
+                    continue
+                except OSError as err:
+                    printSkip("file", err.strerror, entry.path)
+                    continue
+                if is_dir and self.followsym and entry.is_symlink() and BackupyTarfile._is_symlink_loop(entry.path):
+                    printSkip("directory", "symlink loop", entry.path)
+                    continue
+                entries.append((index, entry.path, self._planstat(statres)))
+                if is_dir:
+                    subdirs.append(entry.path)
+        except PermissionError:
+            printSkip("directory", "permission error", path)
+            self.unreadable.append(path)
+            self.unlistable.append(path)
+        return index, path, entries, subdirs, listing
+
+    def _add_walk(self, index, walk, exclude_file, exclude_dir):
+        """ Entries of a shared unfiltered walk (see Scancache), with this plan's exclusions:
+            an entry whose parent dir was excluded goes with it (pruning after the fact)
+        """
+        dropped, kept_dirs = set(), set()
+        for _, path, statres in walk:
+            is_dir = stat.S_ISDIR(statres.st_mode)
+            is_root = path == self.include_dirs[index]
+            if os.path.dirname(path) in dropped or (exclude_dir if is_dir or is_root else exclude_file)(path, index):
+                if is_dir:
+                    dropped.add(path)
+                continue
+            if not is_root:
+                self._check_readable(path, statres)
+            self._append((index, path, statres))
+            if is_dir:
+                kept_dirs.add(path)
+        unlistable = [path for path in walk.unlistable if path in kept_dirs]
+        self.unreadable += unlistable
+        self.unlistable += unlistable
+
+    def build(self, exclude_file, exclude_dir, cache=None):
+        """ exclude_file / exclude_dir(path, include dir index): True if excluded (dirs: with their subtree)
+            cache: Scancache, include dirs shared with other tasks come from there
+        """
+        shared = {}
+        if cache is not None:
+            shared = {index: (path, self.followsym) for index, path in enumerate(self.include_dirs)
+                      if cache.shared((path, self.followsym))}
+        for index, key in shared.items():
+            self._add_walk(index, cache.get(key), exclude_file, exclude_dir)
+        scan_dir = with_log_context(self._scan_dir)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.SCAN_WORKERS) as pool:
+            pending = collections.deque()    # in submission order: the plan does not depend on thread timing
+            waiting = collections.deque()    # (index, path, listing) of the jobs not submitted yet
+
+            def submit():    # a bounded number of scanned chunks waits for the consumer
+                while waiting and len(pending) < 2 * self.SCAN_WORKERS:
+                    index, path, listing = waiting.popleft()
+                    pending.append(pool.submit(scan_dir, index, path, exclude_file, exclude_dir, listing))
+
+            for index, path in enumerate(self.include_dirs):
+                if index in shared:
+                    continue
+                try:
+                    statres = os.stat(path) if self.followsym else os.lstat(path)
+                except FileNotFoundError:
+                    printSkip("file", "broken symlink", path)
+                    continue
+                if exclude_dir(path, index):
+                    continue
+                self._append((index, path, self._planstat(statres)))
+                if stat.S_ISDIR(statres.st_mode):
+                    waiting.append((index, path, None))
+            submit()
+            while pending:
+                index, path, entries, subdirs, listing = pending.popleft().result()
+                for entry in entries:
+                    self._check_readable(entry[1], entry[2])
+                    self._append(entry)
+                if listing is not None:
+                    waiting.appendleft((index, path, listing))    # the rest of the directory goes first
+                waiting.extend((index, subdir, None) for subdir in subdirs)
+                submit()
+        return self
+
+    def __iter__(self):
+        if self._spill is not None:
+            position = 0    # own position: a shared plan may be iterated from several threads
+            while True:
+                with self._spill_lock:
+                    self._spill.seek(position)
+                    try:
+                        batch = marshal.load(self._spill)
+                    except EOFError:
+                        break
+                    position = self._spill.tell()
+                for index, path, st in batch:
+                    yield index, path, Planstat._make(st)
+        yield from self._entries
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        self._entries = []
+
+
+class Scancache:
+    """ Directory walks shared by the tasks of a backup set (one run).
+
+        Keys are (include dir, followsym). Tasks register their keys before the
+        run; a key registered by more than one task is walked once, unfiltered
+        (a Scanplan without exclusions), and every task filters that walk with its
+        own exclusions. The walk is dropped when the last registered task releases it.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._registered = collections.Counter()
+        self._users = collections.Counter()
+        self._walks = {}    # key: Future of the unfiltered Scanplan
+
+    def register(self, key):
+        with self._lock:
+            self._registered[key] += 1
+            self._users[key] += 1
+
+    def shared(self, key):
+        return self._registered[key] > 1
+
+    def get(self, key):
+        """ The unfiltered walk of key: the first caller walks, the others wait for it """
+        with self._lock:
+            future = self._walks.get(key)
+            owner = future is None
+            if owner:
+                future = self._walks[key] = concurrent.futures.Future()
+        if owner:
+            try:
+                start = time.time()
+                walk = Scanplan([key[0]], key[1]).build(lambda path, i: False, lambda path, i: False)
+                printLog(f"Scanned {key[0]} for {self._registered[key]} tasks: {len(walk)} entries "
+                         f"({format_elapsed(time.time() - start)})")
+                future.set_result(walk)
+            except BaseException as err:
+                future.set_exception(err)
+                raise
+        return future.result()
+
+    def release(self, key):
+        with self._lock:
+            self._users[key] -= 1
+            future = self._walks.pop(key, None) if self._users[key] <= 0 else None
+        if future is not None and future.done() and future.exception() is None:
+            future.result().close()
+
+
+class Fanoutstream:
+    """ Content of one file on its way from the Fanout reader to one writer (a read-only file object) """
+    def __init__(self, feed, path, error=None):
+        self.feed = feed
+        self.path = path
+        self.error = error    # OSError of the reader: raised by Fanoutfeed.open or by read
+        self.eof = False
+        self.abandoned = False    # the writer moved on: the rest is dropped
+        self._chunks = collections.deque()
+        self._pos = 0    # in the first chunk
+
+    def read(self, size=-1):
+        out = bytearray()
+        with self.feed.cond:
+            while size < 0 or len(out) < size:
+                while not self._chunks and not self.eof and self.error is None:
+                    self.feed.cond.wait()
+                if not self._chunks:
+                    if self.error is not None and not out:
+                        raise self.error
+                    break
+                chunk = self._chunks[0]
+                take = len(chunk) - self._pos if size < 0 else min(size - len(out), len(chunk) - self._pos)
+                out += chunk[self._pos:self._pos + take]
+                self._pos += take
+                if self._pos == len(chunk):
+                    self._chunks.popleft()
+                    self._pos = 0
+                    self.feed.buffered -= len(chunk)
+                    self.feed.cond.notify_all()
+        return bytes(out)
+
+    def peek(self, size):
+        """ Up to size bytes of the buffered content (waits for the first chunk only), nothing is consumed """
+        out = bytearray()
+        with self.feed.cond:
+            while not self._chunks and not self.eof and self.error is None:
+                self.feed.cond.wait()
+            pos = self._pos
+            for chunk in self._chunks:
+                out += chunk[pos:pos + size - len(out)]
+                pos = 0
+                if len(out) >= size:
+                    break
+        return bytes(out)
+
+    def close(self):
+        with self.feed.cond:
+            self.abandoned = True
+            self.feed.buffered -= sum(len(chunk) for chunk in self._chunks)
+            self._chunks.clear()
+            self.feed.cond.notify_all()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Fanoutfeed:
+    """ A task's side of a Fanout: iterated like its Scanplan, open() hands out what the reader read """
+    ENTRY_COST = 512    # buffer budget of a queued entry without content
+
+    def __init__(self, plan, limit):
+        self.plan = plan
+        self.include_dirs = plan.include_dirs
+        self.limit = limit
+        self.cond = threading.Condition()
+        self.buffered = 0
+        self.closed = False    # the writer is gone
+        self._items = collections.deque()    # (plan entry, Fanoutstream or None)
+        self._done = False
+        self._error = None
+        self._current = None
+
+    def wait_room(self, stream=None):
+        """ Reader side: blocks while the writer is behind, False if nobody will read any more """
+        with self.cond:
+            while self.buffered >= self.limit and not self.closed and not (stream and stream.abandoned):
+                self.cond.wait()
+            return not self.closed and not (stream and stream.abandoned)
+
+    def put(self, entry, stream):
+        with self.cond:
+            self._items.append((entry, stream))
+            self.buffered += self.ENTRY_COST
+            self.cond.notify_all()
+
+    def put_chunk(self, stream, chunk):
+        with self.cond:
+            if stream.abandoned or self.closed:
+                return
+            stream._chunks.append(chunk)
+            self.buffered += len(chunk)
+            self.cond.notify_all()
+
+    def end_stream(self, stream, error=None):
+        with self.cond:
+            stream.eof = True
+            stream.error = error
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self._done = True
+            self._error = error
+            self.cond.notify_all()
+
+    def close(self):
+        """ Writer side: no more reading (task finished or failed) """
+        with self.cond:
+            self.closed = True
+            for _, stream in self._items:
+                if stream is not None:
+                    stream.abandoned = True
+            self._items.clear()
+            self.buffered = 0
+            self.cond.notify_all()
+
+    def __iter__(self):
+        while True:
+            if self._current is not None:
+                self._current.close()
+                self._current = None
+            with self.cond:
+                while not self._items and not self._done:
+                    self.cond.wait()
+                if not self._items:
+                    if self._error is not None:
+                        raise self._error
+                    return
+                entry, self._current = self._items.popleft()
+                self.buffered -= self.ENTRY_COST
+                self.cond.notify_all()
+            yield entry
+
+    def open(self, path):
+        """ The content of the current entry, read by the Fanout (or from disk if it was not) """
+        stream = self._current
+        if stream is None or stream.path != path:
+            return open(path, "rb")
+        if stream.error is not None and stream.eof and not stream._chunks:
+            raise stream.error
+        return stream
+
+
+class Fanout:
+    """ Single-read fan-out: tasks with the same include dirs (and symlink handling)
+        read every file once, its content is fed to the writer of each task.
+
+        The tasks run on their own threads and report in after their pre-flight
+        checks (Backuptask.execute). The reader then goes through the shared
+        unfiltered walk of the Scancache: the task plans are filtered from it,
+        so they list their entries in the same order, an entry goes to the tasks
+        whose plan holds it. Every task has a Fanoutfeed with a bounded buffer:
+        the reader runs at the pace of the slowest writer.
+    """
+    CHUNK_SIZE = 2 ** 20
+    BUFFER_BYTES = 16 * 2 ** 20    # per task
+
+    def __init__(self, tasks, scan_cache):
+        self.tasks = tasks
+        self.scan_cache = scan_cache
+        self.feeds = []
+        self.files = 0
+        self.bytes = 0
+        self._cond = threading.Condition()
+        self._arrived = set()
+        for task in tasks:
+            task.fanout = self
+
+    @staticmethod
+    def key(task):
+        return tuple(task.include_dirs), task.plan_followsym
+
+    def join(self, task, proceed):
+        """ Called by each task after its pre-flight checks: returns its Fanoutfeed (None: read on its own) """
+        with self._cond:
+            feed = None
+            if proceed and task not in self._arrived:
+                feed = Fanoutfeed(task.plan, self.BUFFER_BYTES)
+                self.feeds.append(feed)
+            self._arrived.add(task)
+            self._cond.notify_all()
+            while len(self._arrived) < len(self.tasks):
+                self._cond.wait()
+            return feed if len(self.feeds) > 1 else None
+
+    def leave(self, task, feed):
+        """ Called by each task when it ends (also on failure) """
+        if feed is not None:
+            feed.close()
+        with self._cond:
+            self._arrived.add(task)
+            self._cond.notify_all()
+
+    def run(self):
+        """ The reader: returns when every task has its input """
+        with self._cond:
+            while len(self._arrived) < len(self.tasks):
+                self._cond.wait()
+        if len(self.feeds) < 2:
+            return
+        error = None
+        try:
+            self._read()
+        except Exception as err:
+            error = err
+            raise
+        finally:
+            for feed in self.feeds:
+                feed.finish(error)
+        printLog(f"Fan-out: {self.files} files ({sizeof_fmt(self.bytes)}) read once for {len(self.feeds)} tasks")
+
+    def _read(self):
+        plan = self.feeds[0].plan
+        iterators = [iter(feed.plan) for feed in self.feeds]
+        heads = [next(entries, None) for entries in iterators]
+        for index, root in enumerate(plan.include_dirs):
+            for _, path, statres in self.scan_cache.get((root, plan.followsym)):
+                takers = []
+                for i, head in enumerate(heads):
+                    if head is not None and head[0] == index and head[1] == path:
+                        takers.append((self.feeds[i], head))
+                        heads[i] = next(iterators[i], None)
+                if takers and stat.S_ISREG(statres.st_mode):
+                    self._read_file(path, takers)
+                else:
+                    for feed, entry in takers:
+                        feed.wait_room()
+                        feed.put(entry, None)
+        for feed, entries, head in zip(self.feeds, iterators, heads):    # not in the walk: read by the writer
+            while head is not None:
+                feed.wait_room()
+                feed.put(head, None)
+                head = next(entries, None)
+
+    def _read_file(self, path, takers):
+        try:
+            f = open(path, "rb")
+        except OSError as err:
+            for feed, entry in takers:
+                stream = Fanoutstream(feed, path, err)
+                stream.eof = True
+                feed.wait_room()
+                feed.put(entry, stream)
+            return
+        streams = []
+        with f:
+            for feed, entry in takers:
+                stream = Fanoutstream(feed, path)
+                feed.wait_room()
+                feed.put(entry, stream)
+                streams.append(stream)
+            error = None
+            try:
+                while chunk := f.read(self.CHUNK_SIZE):
+                    self.bytes += len(chunk)
+                    live = [stream for stream in streams if stream.feed.wait_room(stream)]
+                    if not live:
+                        break    # every writer skipped the file
+                    for stream in live:
+                        stream.feed.put_chunk(stream, chunk)
+            except OSError as err:
+                error = err
+            for stream in streams:
+                stream.feed.end_stream(stream, error)
+        self.files += 1
+
+
+class Sizeestimator:
+    """ Archive size prediction of a backup task, before anything is written.
+
+        The input is totalled per file extension from the task's Scanplan
+        (a parallel stat scan), the per-extension compression ratios come
+        from a default table, refined by what previous runs produced:
+        '<result_dir>/backupy-estimate.json' keeps a model per task (archive
+        name) and method: a correction factor (real / predicted archive size,
+        the same size that goes to the .sum file) and per-extension ratios,
+        measured from zip members, or for tar from the first bytes of the
+        archived files (compressed with the codec, SAMPLE_BYTES per extension).
+        Tasks sharing the result dir update the file under a lock.
+    """
+    INCOMPRESSIBLE = frozenset((".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".mp3", ".ogg", ".flac", ".m4a",
+                                ".mp4", ".mkv", ".avi", ".mov", ".webm", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst",
+                                ".7z", ".rar", ".jar", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".epub"))
+    TEXT = frozenset((".txt", ".log", ".csv", ".json", ".xml", ".html", ".htm", ".md", ".rst", ".py", ".c", ".h",
+                      ".cpp", ".java", ".js", ".ts", ".css", ".sql", ".toml", ".yaml", ".yml", ".ini", ".conf", ".sh"))
+    TEXT_RATIOS = {'gz': 0.3, 'bz2': 0.25, 'xz': 0.22, 'zst': 0.25}
+    OTHER_RATIO = 0.6
+    MEMBER_OVERHEAD = {'tar': 1024, 'zip': 200}    # header + padding bytes per member
+    LEARNING_RATE = 0.5
+    SAMPLE_BYTES = 2 ** 20    # per extension and run
+    _update_lock = threading.Lock()    # tasks of this process (other processes: flock)
+
+    def __init__(self, path, method, key):
+        self.path = path
+        self.method = method
+        self.key = key    # the task's archive name
+        self.codec = {'targz': 'gz', 'targz-seekable': 'gz', 'zip': 'gz', 'tarbz2': 'bz2', 'tarxz': 'xz',
+                      'tarzst': 'zst'}.get(method)
+        self.model = {"factor": 1.0, "runs": 0, "ratios": {}}
+        self.ext_sizes = {}
+        self.file_count = 0
+        self.raw_prediction = 0
+        self.samples = {}    # extension: [sampled bytes, compressed]
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.model.update(json.load(f).get(self.key, {}).get(self.method, {}))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError) as err:
+            printWarning(f"Cannot read size estimation model ({err}): {self.path}")
+
+    def ratio(self, ext):
+        if self.codec is None:
+            return 1.0
+        learned = self.model["ratios"].get(ext)
+        if learned is not None:
+            return learned
+        if ext in self.INCOMPRESSIBLE:
+            return 1.0
+        return self.TEXT_RATIOS[self.codec] if ext in self.TEXT else self.OTHER_RATIO
+
+    def scan(self, plan):
+        """ Totals the input bytes per extension (regular files of a Scanplan) """
+        ext_sizes = collections.Counter()
+        for _, path, statres in plan:
+            if stat.S_ISREG(statres.st_mode):
+                ext_sizes[os.path.splitext(path)[1].lower()] += statres.st_size
+                self.file_count += 1
+        self.ext_sizes = dict(ext_sizes)
+        return sum(ext_sizes.values())
+
+    def predict(self):
+        """ Predicted archive size in bytes (after scan) """
+        overhead = self.MEMBER_OVERHEAD['zip' if self.method == 'zip' else 'tar'] * self.file_count
+        self.raw_prediction = sum(size * self.ratio(ext) for ext, size in self.ext_sizes.items()) + overhead
+        return int(self.raw_prediction * self.model["factor"])
+
+    def sample(self, name, data):
+        """ The first bytes of an archived file (tar): compressed with the codec for the extension's ratio """
+        if self.codec is None:
+            return
+        total = self.samples.setdefault(os.path.splitext(name)[1].lower(), [0, 0])
+        if total[0] >= self.SAMPLE_BYTES:
+            return
+        match self.codec:
+            case 'gz':
+                compressed = zlib.compress(data, 6)
+            case 'bz2':
+                compressed = bz2.compress(data)
+            case 'xz':
+                compressed = lzma.compress(data)
+            case _:
+                compressed = zstd.compress(data)
+        total[0] += len(data)
+        total[1] += len(compressed)
+
+    def learn(self, archive_size, members=()):
+        """ Updates the model with the real archive size (members: (name, size, compressed size) of zip
+            members) and the samples, saves it
+        """
+        if self.raw_prediction:
+            rate = self.LEARNING_RATE
+            measured = {ext: list(total) for ext, total in self.samples.items()}
+            for name, size, compressed in members:
+                ext = os.path.splitext(name)[1].lower()
+                total = measured.setdefault(ext, [0, 0])
+                total[0] += size
+                total[1] += compressed
+            for ext, (size, compressed) in measured.items():
+                if size:
+                    old = self.model["ratios"].get(ext, compressed / size)
+                    self.model["ratios"][ext] = round((1 - rate) * old + rate * compressed / size, 4)
+            if measured:    # the factor corrects what the ratios don't explain
+                self.predict()
+            self.model["factor"] = round((1 - rate) * self.model["factor"] + rate * archive_size / self.raw_prediction, 4)
+            self.model["runs"] += 1
+        # read-modify-write of the models of every task: serialized, the file is replaced at once
+        with self._update_lock, open(f"{self.path}.lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    models = json.load(f)
+            except (OSError, ValueError):
+                models = {}
+            if not isinstance(models.get(self.key), dict):
+                models[self.key] = {}
+            models[self.key][self.method] = self.model
+            tmp_path = f"{self.path}.tmp{os.getpid()}-{threading.get_ident()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(models, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+class Chunkstore:
+    """ Content-addressed chunk store of the 'cas' method.
+
+        Files are split into content-defined chunks, every unique chunk is
+        stored once, zlib compressed, as
+        chunks/<id[:2]>/<id> where id is the chunk's sha256. A run writes a
+        small snapshot object (gzipped JSON lines) referencing the chunks, so
+        a daily snapshot only costs the new data. Snapshot pathes are
+        registered in snapshots.list for the garbage collector: a snapshot is
+        only released when it's deleted and forgotten (gc prune), a moved result
+        dir keeps its chunks.
+    """
+    MIN_CHUNK = 512 * 1024
+    MAX_CHUNK = 4 * 2 ** 20
+    # Cut point candidates are found by the regex engine (bytes with low nibble 0xA: ~1/16 of random
+    # data, newlines, 'j', 'z', ':' in text), a candidate is a cut if the crc32 of the CUT_WINDOW bytes
+    # before it matches CUT_MASK: content defined, so an insertion only changes the chunks around it.
+    CUT_CANDIDATES = re.compile(b"[" + re.escape(bytes(range(0x0a, 0x100, 0x10))) + b"]")
+    CUT_WINDOW = 48
+    CUT_MASK = (1 << 15) - 1    # ~512 KiB average after MIN_CHUNK on random data
+    READ_SIZE = 16 * 2 ** 20
+
+    def __init__(self, path):
+        self.path = path
+        self.chunks_dir = os.path.join(path, "chunks")
+        self.path_snapshot_list = os.path.join(path, "snapshots.list")
+
+    @classmethod
+    def find(cls, path):
+        """ Store of a result dir, or the store itself """
+        if os.path.isdir(os.path.join(path, "chunks")):
+            return cls(path)
+        return cls(os.path.join(path, "backupy-cas"))
+
+    def chunk_path(self, chunk_id):
+        return os.path.join(self.chunks_dir, chunk_id[:2], chunk_id)
+
+    def _find_cut(self, buf, start, end):
+        pos = start + self.MIN_CHUNK
+        if pos >= end:
+            return end
+        window, mask, crc32 = self.CUT_WINDOW, self.CUT_MASK, zlib.crc32
+        for match in self.CUT_CANDIDATES.finditer(buf, pos, end):
+            cut = match.end()
+            if not crc32(buf[cut - window:cut]) & mask:
+                return cut
+        return end
+
+    def iter_chunks(self, f):
+        """ Content-defined chunks of a binary file object """
+        buf, pos, eof = b"", 0, False
+        while True:
+            while not eof and len(buf) - pos < self.MAX_CHUNK:
+                data = f.read(self.READ_SIZE)
+                buf, pos, eof = buf[pos:] + data, 0, not data
+            if pos >= len(buf):
+                return
+            cut = self._find_cut(buf, pos, min(len(buf), pos + self.MAX_CHUNK))
+            yield buf[pos:cut]
+            pos = cut
+
+    def put(self, data):
+        """ Stores the chunk if it's new, returns (chunk id, stored bytes) """
+        chunk_id = hashlib.sha256(data).hexdigest()
+        path = self.chunk_path(chunk_id)
+        if os.path.exists(path):
+            return chunk_id, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        packed = zlib.compress(data, 6)
+        tmp_path = f"{path}.tmp{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(packed)
+        os.replace(tmp_path, path)
+        return chunk_id, len(packed)
+
+    def has_chunks(self, chunk_ids):
+        return all(os.path.exists(self.chunk_path(chunk_id)) for chunk_id in chunk_ids)
+
+    def get(self, chunk_id):
+        with open(self.chunk_path(chunk_id), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != chunk_id:
+            raise ValueError(f"Corrupt chunk: {self.chunk_path(chunk_id)}")
+        return data
+
+    @contextlib.contextmanager
+    def lock(self, exclusive=False):
+        """ flock of '<store>/lock', yields the time it was taken. Backup runs hold it shared from
+            their first chunk until their snapshot is registered, gc exclusively: gc never sees
+            the chunks of a snapshot in the making. exclusive doesn't wait: BlockingIOError.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, "lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH)
+            yield time.time()
+
+    def register_snapshot(self, path):
+        os.makedirs(self.path, exist_ok=True)    # a snapshot of empty files stores no chunk
+        with open(self.path_snapshot_list, "a", encoding="utf-8", errors="surrogateescape") as f:
+            f.write(os.path.abspath(path) + "\n")
+
+    def snapshot_paths(self):
+        """ Registered snapshot paths, without duplicates """
+        try:
+            with open(self.path_snapshot_list, encoding="utf-8", errors="surrogateescape") as f:
+                paths = dict.fromkeys(line.rstrip("\n") for line in f)
+        except FileNotFoundError:
+            return []
+        return [path for path in paths if path]
+
+    def locate_snapshot(self, path):
+        """ Where a registered snapshot is now: its path, or next to the store / in a date dir
+            next to it if the result dir was moved with the store (see Backupy.cas_restore), None if gone
+        """
+        if os.path.exists(path):
+            return path
+        result_dir = os.path.dirname(os.path.abspath(self.path))
+        name = os.path.basename(path)
+        candidates = (os.path.join(result_dir, name),
+                      os.path.join(result_dir, os.path.basename(os.path.dirname(path)), name))
+        return next((candidate for candidate in candidates if os.path.exists(candidate)), None)
+
+    def gc(self, prune=False):
+        """ Removes chunks not referenced by any registered snapshot, returns (removed chunks, freed bytes,
+            snapshots not found). Registered snapshots that are not found keep every chunk (nothing is
+            removed) unless prune: then they are forgotten.
+        """
+        with self.lock(exclusive=True) as locked_at:
+            snapshots, missing = [], []
+            for path in self.snapshot_paths():
+                found = self.locate_snapshot(path)
+                if found is None:
+                    missing.append(path)
+                else:
+                    snapshots.append(found)
+            if missing and not prune:
+                return 0, 0, missing
+            referenced = set()
+            for path in snapshots:
+                for entry in iter_cas_snapshot(path):
+                    referenced.update(entry.get("chunks", ()))
+            removed = freed = 0
+            for subdir in os.scandir(self.chunks_dir) if os.path.isdir(self.chunks_dir) else ():
+                for chunk in os.scandir(subdir.path):
+                    if chunk.name in referenced:
+                        continue
+                    statres = chunk.stat()
+                    if ".tmp" in chunk.name and statres.st_mtime >= locked_at:
+                        continue    # a writer that doesn't lock (other host on a network share)
+                    freed += statres.st_size
+                    os.remove(chunk.path)    # also leftover .tmp files of interrupted runs
+                    removed += 1
+            tmp_path = self.path_snapshot_list + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8", errors="surrogateescape") as f:
+                f.writelines(path + "\n" for path in snapshots)    # moved snapshots: their new path
+            os.replace(tmp_path, self.path_snapshot_list)
+        return removed, freed, missing
+
+    def restore(self, snapshot_path, target_dir, patterns=None):
+        """ Restores the entries of a snapshot (selected by restore path patterns) below target_dir,
+            returns the number of restored entries.
+            Symlinks (restored ones or already in target_dir) are not followed out of target_dir:
+            the resolved parent dir is checked, an existing file or symlink is replaced, not written through
+        """
+        target_dir = os.path.abspath(target_dir)
+        real_target = os.path.realpath(target_dir)
+        restored = 0
+        dir_times = []
+        for entry in iter_cas_snapshot(snapshot_path):
+            if "path" not in entry or not match_restore_path(entry["path"], patterns):
+                continue    # header / not selected
+            dest = os.path.normpath(os.path.join(target_dir, entry["path"]))
+            real_parent = os.path.realpath(dest if entry["type"] == "dir" else os.path.dirname(dest))
+            if not dest.startswith(target_dir + "/") or \
+                    not (real_parent == real_target or real_parent.startswith(real_target + "/")):
+                printWarning(f"Skip entry (path outside of target dir): {entry['path']}")
+                continue
+            match entry["type"]:
+                case "dir":
+                    os.makedirs(dest, exist_ok=True)
+                    os.chmod(dest, entry["mode"])
+                    dir_times.append((dest, entry["mtime"]))
+                case "symlink":
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    if os.path.lexists(dest):
+                        os.remove(dest)
+                    os.symlink(entry["target"], dest)
+                case "file":
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    if os.path.islink(dest):
+                        os.remove(dest)
+                    fd = os.open(dest, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+                    with open(fd, "wb") as f:
+                        for chunk_id in entry["chunks"]:
+                            f.write(self.get(chunk_id))
+                        f.flush()
+                        os.chmod(f.fileno(), entry["mode"])
+                        os.utime(f.fileno(), (entry["mtime"], entry["mtime"]))
+            restored += 1
+        for dest, mtime in reversed(dir_times):    # after their content is written
+            os.utime(dest, (mtime, mtime))
+        return restored
+
+
+def match_restore_path(name, patterns):
+    """ True if the member or one of its parent dirs matches a restore path pattern (no patterns: all) """
+    if not patterns:
+        return True
+    parts = name.strip("/").split("/")
+    for i in range(1, len(parts) + 1):
+        prefix = "/".join(parts[:i])
+        if any(fnmatch.fnmatchcase(prefix, pattern) for pattern in patterns):
+            return True
+    return False
+
+
+def iter_cas_snapshot(path):
+    """ Entries of a 'cas' snapshot object, header first """
+    with gzip.open(path, "rt", encoding="utf-8", errors="surrogateescape") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+Indexentry = collections.namedtuple("Indexentry", "name type mode size mtime offset crc")
+
+
+class Archiveindex:
+    """ Sidecar index of an archive ('<archive>.idx'): its content without reading the archive.
+
+        Layout: header, fixed size records sorted by member name, then the
+        member names (utf-8). The file is mmap-ed and searched by bisection,
+        so a lookup or the listing of a subtree costs the same for any
+        archive size. offset: position of the member's header in the
+        uncompressed tar stream / of its zip local header (-1: none, 'cas').
+        crc: crc32 of a regular member's content (None if not available).
+        blocks: block table of a 'targz-seekable' archive (see Parallelcompressor),
+        stored after the names.
+    """
+    MAGIC = b"BKPYIDX2"
+    HEADER = struct.Struct("<8sQQQQ")    # magic, record count, names offset, blocks offset, block count
+    BLOCK = struct.Struct("<qq")    # uncompressed offset, compressed offset
+    RECORD = struct.Struct("<QIIIcB2xqqq")    # name offset, name length, mode, crc32, type, flags, size, mtime, offset
+    FLAG_CRC = 1
+    TYPE_MODES = {tarfile.REGTYPE: stat.S_IFREG, tarfile.AREGTYPE: stat.S_IFREG, tarfile.LNKTYPE: stat.S_IFREG,
+                  tarfile.DIRTYPE: stat.S_IFDIR, tarfile.SYMTYPE: stat.S_IFLNK, tarfile.FIFOTYPE: stat.S_IFIFO,
+                  tarfile.CHRTYPE: stat.S_IFCHR, tarfile.BLKTYPE: stat.S_IFBLK}
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, self.count, self._names_offset, self._blocks_offset, self._block_count = \
+                self.HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = None
+        if magic != self.MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a backupy archive index: {path}")
+
+    @classmethod
+    def write(cls, path, entries, blocks=()):
+        """ entries: iterable of (name, type, mode, size, mtime, offset, crc or None)
+            blocks: (uncompressed offset, compressed offset) pairs
+        """
+        records = sorted((name.encode("utf-8", "surrogateescape"), *rest) for name, *rest in entries)
+        names_offset = cls.HEADER.size + len(records) * cls.RECORD.size
+        blocks_offset = names_offset + sum(len(record[0]) for record in records)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, len(records), names_offset, blocks_offset, len(blocks)))
+            name_pos = 0
+            for name, ftype, mode, size, mtime, offset, crc in records:
+                flags = 0 if crc is None else cls.FLAG_CRC
+                f.write(cls.RECORD.pack(name_pos, len(name), stat.S_IMODE(mode), crc or 0, ftype, flags,
+                                        size, int(mtime), offset))
+                name_pos += len(name)
+            for record in records:
+                f.write(record[0])
+            for block in blocks:
+                f.write(cls.BLOCK.pack(*block))
+        os.replace(tmp_path, path)
+
+    @property
+    def blocks(self):
+        """ Block table: [(uncompressed offset, compressed offset)], empty if the archive has none """
+        end = self._blocks_offset + self._block_count * self.BLOCK.size
+        return list(self.BLOCK.iter_unpack(self._map[self._blocks_offset:end]))
+
+    def _record(self, i):
+        return self.RECORD.unpack_from(self._map, self.HEADER.size + i * self.RECORD.size)
+
+    def _name(self, i):
+        name_pos, name_len = self._record(i)[:2]
+        start = self._names_offset + name_pos
+        return self._map[start:start + name_len]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        name_pos, name_len, mode, crc, ftype, flags, size, mtime, offset = self._record(i)
+        start = self._names_offset + name_pos
+        name = self._map[start:start + name_len].decode("utf-8", "surrogateescape")
+        return Indexentry(name, ftype, mode, size, mtime, offset, crc if flags & self.FLAG_CRC else None)
+
+    def _bisect(self, key):
+        """ Position of the first member whose name is >= key (bytes) """
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name):
+        """ Indexentry of a member, None if it's not in the archive """
+        key = name.encode("utf-8", "surrogateescape")
+        i = self._bisect(key)
+        return self[i] if i < self.count and self._name(i) == key else None
+
+    def iter_prefix(self, prefix=""):
+        """ Members whose name starts with prefix, in name order """
+        key = prefix.encode("utf-8", "surrogateescape")
+        for i in range(self._bisect(key), self.count):
+            if not self._name(i).startswith(key):
+                return
+            yield self[i]
+
+    def select(self, patterns=None):
+        """ Members matching restore path patterns (see match_restore_path), in name order.
+            Only the name ranges of the patterns' literal prefixes are searched.
+        """
+        patterns = [pattern.strip("/") for pattern in patterns or ()]
+        entries = {}
+        for pattern in patterns or [""]:
+            literal = re.split(r"[*?[]", pattern, maxsplit=1)[0]
+            for entry in self.iter_prefix(literal):
+                if match_restore_path(entry.name, patterns):
+                    entries[entry.name] = entry
+        return [entries[name] for name in sorted(entries)]
+
+    @staticmethod
+    def format_entry(entry):
+        """ 'tar tv' style listing line """
+        filemode = stat.filemode(Archiveindex.TYPE_MODES.get(entry.type, 0) | entry.mode)
+        mtime = datetime.datetime.fromtimestamp(entry.mtime).strftime("%Y-%m-%d %H:%M")
+        name = entry.name.encode("utf-8", "surrogateescape").decode("utf-8", "backslashreplace")
+        return f"{filemode} {entry.size:>12} {mtime} {name}"
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Archiverestorer:
+    """ Selective restore of tar / zip archives (restore path patterns are fnmatch style,
+        a matching directory selects its whole subtree).
+
+        zip: members are read directly (central directory).
+        tar with index: the selected members' headers are read at their
+        indexed offsets - uncompressed tar, or 'targz-seekable' where only the
+        gzip blocks holding them are decompressed.
+        Otherwise one sequential pass, which stops as soon as every selected
+        member (known from the index) is extracted. It's not a stream ('r|*'):
+        the threaded compressors write multi-member gzip / bz2 / xz files.
+    """
+    EXTRACT_ARGS = {'filter': 'tar'} if hasattr(tarfile, 'tar_filter') else {}
+
+    def __init__(self, archive_path, patterns=None):
+        self.path = archive_path
+        self.patterns = [pattern.strip("/") for pattern in patterns or ()]
+        self.index = None
+        try:
+            self.index = Archiveindex(f"{archive_path}.idx")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as err:
+            printWarning(f"Archive index is not usable ({err}), reading the whole archive")
+
+    def restore(self, target_dir):
+        """ Returns the number of restored members """
+        os.makedirs(target_dir, exist_ok=True)
+        try:
+            if zipfile.is_zipfile(self.path):
+                return self._restore_zip(target_dir)
+            if self.index is not None and self.path.endswith(".tar"):
+                return self._restore_tar_indexed(target_dir)
+            blocks = self.index.blocks if self.index is not None else None
+            if blocks:
+                with Seekablegzipreader(self.path, blocks) as fileobj:
+                    return self._restore_tar_indexed(target_dir, fileobj)
+            return self._restore_tar_stream(target_dir)
+        finally:
+            if self.index is not None:
+                self.index.close()
+
+    def _restore_zip(self, target_dir):
+        restored = 0
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                if not match_restore_path(info.filename, self.patterns):
+                    continue
+                dest = archive.extract(info, target_dir)
+                mode = stat.S_IMODE(info.external_attr >> 16)
+                if mode and not info.is_dir():
+                    os.chmod(dest, mode)
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                os.utime(dest, (mtime, mtime))
+                restored += 1
+        return restored
+
+    def _restore_tar_indexed(self, target_dir, fileobj=None):
+        with tarfile.open(self.path, "r:", fileobj=fileobj) as archive:
+            members = {}
+            pending = self.index.select(self.patterns)
+            while pending:
+                entry = pending.pop()
+                archive.fileobj.seek(entry.offset)
+                member = tarfile.TarInfo.fromtarfile(archive)
+                members[member.name] = member
+                # a hardlink needs its target member, even if it's not selected
+                if member.islnk() and member.linkname not in members:
+                    target = self.index.find(member.linkname)
+                    if target is not None:
+                        pending.append(target)
+            archive.extractall(target_dir, members=sorted(members.values(), key=lambda m: m.offset),
+                               **self.EXTRACT_ARGS)
+        return len(members)
+
+    def _restore_tar_stream(self, target_dir):
+        remaining = {entry.name for entry in self.index.select(self.patterns)} if self.index is not None else None
+        extracted = set()
+
+        def selected_members(archive, stream):
+            if remaining is not None and not remaining:
+                return
+            for member in archive:
+                if not match_restore_path(member.name, self.patterns):
+                    continue
+                if stream and member.islnk() and member.linkname not in extracted:
+                    # the stream can't go back for the hardlink's target
+                    printWarning(f"Skip hardlink (target is not restored): {member.name} -> {member.linkname}")
+                else:
+                    yield member
+                    extracted.add(member.name)
+                if remaining is not None:
+                    remaining.discard(member.name)
+                    if not remaining:
+                        return    # everything is extracted: the rest of the archive is not read
+
+        if self.path.endswith(".tar.zst"):
+            if zstd is None:
+                raise tarfile.ReadError("zstd archive: python 3.14+ (compression.zstd) is required")
+            with zstd.ZstdFile(self.path) as stream, tarfile.open(fileobj=stream, mode="r|") as archive:
+                archive.extractall(target_dir, members=selected_members(archive, True), **self.EXTRACT_ARGS)
+        else:
+            # members are read one after the other, a hardlink's target can be read back
+            with tarfile.open(self.path, "r:*") as archive:
+                archive.extractall(target_dir, members=selected_members(archive, False), **self.EXTRACT_ARGS)
+        return len(extracted)
+
+
+class Excludematcher:
+    """ Compiled form of a backup task's exclude lists (global + task).
+
+        Built once at config load time, so the per-file check is a single
+        str.endswith() call for endings, set lookups for file and dir names
+        and a walk in a path component trie for the excluded full paths.
+    """
+    def __init__(self, endings, files, global_dir_names, task_dir_names, dir_fullpaths):
+        self.endings = tuple(endings)
+        self.files = frozenset(files)
+        self.global_dir_names = frozenset(global_dir_names)
+        self.task_dir_names = frozenset(task_dir_names)
+        self.fullpath_trie = {}
+        for fullpath in dir_fullpaths:
+            node = self.fullpath_trie
+            for part in strip_dash_string_end(fullpath).split("/"):
+                node = node.setdefault(part, {})
+            node[None] = True    # end of an excluded path
+        self._root_depths = {}
+
+    def _rel_parts(self, filenamefull, root_dir):
+        """ Same components as getsub_dir_path(root_dir, filenamefull).split("/") """
+        depth = self._root_depths.get(root_dir)
+        if depth is None:
+            if not root_dir.startswith("/"):
+                raise ValueError(f"Excludematcher: root dir must be absolute (got {root_dir!r})")
+            depth = max(len(strip_dash_string_end(root_dir).split("/")) - 1, 1)
+            self._root_depths[root_dir] = depth
+        return strip_dash_string_end(filenamefull).split("/")[depth:]
+
+    def _match_fullpath(self, path):
+        node = self.fullpath_trie
+        for part in path.split("/"):
+            node = node.get(part)
+            if node is None:
+                return False
+            if None in node:
+                return True
+        return False
+
+    def match(self, filenamefull, root_dir):
+        """ Returns the reason of exclusion or None if the file is not excluded. """
+        if self.endings and filenamefull.endswith(self.endings):
+            return "Exclude ending matched"
+        if self.files and strip_dash_string_end(filenamefull).rpartition("/")[2] in self.files:
+            return "Exclude file matched"
+        return self.match_dir(filenamefull, root_dir)
+
+    def match_dir(self, dirpath, root_dir):
+        """ Dir name and fullpath rules only: if a directory matches,
+            every file below it is excluded as well.
+        """
+        if self.global_dir_names or self.task_dir_names:
+            parts = self._rel_parts(dirpath, root_dir)
+            if not self.global_dir_names.isdisjoint(parts):
+                return "Global exclude dir names matched at"
+            if not self.task_dir_names.isdisjoint(parts[1:]):
+                return "Task exclude dir names matched at"
+        if self.fullpath_trie and self._match_fullpath(dirpath):
+            return "Exclude dir fullpath matched at"
+        return None
+
+
+class Timedreader:
+    """ Read-only file wrapper of one source file: read time and bytes go to the task's Taskstats ('read' phase) """
+    def __init__(self, fileobj, stats):
+        self.fileobj = fileobj
+        self.stats = stats
+        stats.add_file()
+
+    def read(self, size=-1):
+        start = time.perf_counter()
+        data = self.fileobj.read(size)
+        self.stats.add_read(time.perf_counter() - start, len(data))
+        return data
+
+    def peek(self, size=0):
+        return self.fileobj.peek(size)
+
+
+class Crcreader:
+    """ Read-only file wrapper: crc32 of the data read through it (archive index checksums).
+        length: the member size in the tar header - a file that shrank meanwhile is padded
+        with zeros up to it (tarfile would fail on the short read)
+        sample: called with the first chunk read (Sizeestimator.sample)
+    """
+    def __init__(self, fileobj, length, sample=None):
+        self.fileobj = fileobj
+        self.crc = 0
+        self.remaining = length
+        self.padded = 0
+        self.sample = sample
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if self.sample is not None and data:
+            self.sample(data)
+            self.sample = None
+        if 0 <= len(data) < size <= self.remaining:
+            self.padded += size - len(data)
+            data += bytes(size - len(data))
+        self.remaining -= len(data)
+        self.crc = zlib.crc32(data, self.crc)
+        return data
 
+
+class BackupyTarfile(tarfile.TarFile):
+    """ Adds the entries of a Scanplan (add_plan) instead of the default built-in
+        python tarfile library's add method: permission read errors are skipped
+        intead of immediate exception, and TarInfo objects are built from the
+        stat results of the scan.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.snapshot = None    # Snapshotmanifest: incremental mode, unchanged files are skipped
+        self.index = None    # list: collects Archiveindex entries of the added members
+        self.source = None    # Fanoutfeed: file content comes from there
+        self.stats = None    # Taskstats: read times, unchanged files
+        self.estimator = None    # Sizeestimator: samples of the archived files
+        self._unames = {}
+        self._gnames = {}
+
+    def addfile(self, tarinfo, fileobj=None):
+        if self.index is None:
+            return super().addfile(tarinfo, fileobj)
+        offset = self.offset    # of the member's header in the uncompressed tar stream
+        if fileobj is not None and isinstance(self.fileobj, Hashingwriter) \
+                and self.fileobj.can_copy_from(fileobj, tarinfo.size):
+            crc = self._addfile_direct(tarinfo, fileobj)
+        else:
+            if fileobj is not None and self.stats is not None:
+                fileobj = Timedreader(fileobj, self.stats)
+            sample = None
+            if self.estimator is not None:
+                sample = functools.partial(self.estimator.sample, tarinfo.name)
+            reader = Crcreader(fileobj, tarinfo.size, sample) if fileobj is not None else None
+            super().addfile(tarinfo, reader)
+            crc = reader.crc if reader is not None else None
+            if reader is not None and reader.padded:
+                printWarning(f"File shrank while archiving, padded with {reader.padded} zero bytes: {tarinfo.name}")
+        self.index.append((tarinfo.name, tarinfo.type, tarinfo.mode, tarinfo.size, tarinfo.mtime, offset, crc))
+
+    def _addfile_direct(self, tarinfo, fileobj):
+        """ TarFile.addfile for an uncompressed archive: header and padding are written from python,
+            the content by Hashingwriter.copy_from. Returns the crc32 of the content.
+        """
+        buf = tarinfo.tobuf(self.format, self.encoding, self.errors)
+        self.fileobj.write(buf)
+        self.offset += len(buf)
+        if self.stats is not None:
+            self.stats.add_file()
+        crc = self.fileobj.copy_from(fileobj, tarinfo.size)
+        blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+        if remainder > 0:
+            self.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks += 1
+        self.offset += blocks * tarfile.BLOCKSIZE
+        self.members.append(tarinfo)
+        return crc
+
+    def add_plan(self, plan, arcnames):
+        """ Adds the entries of a Scanplan (already filtered and walked):
+            arcnames[i] is the member name of the plan's include dir i
+        """
+        self._check("aw")
+        archive_basename = os.path.basename(self.name) if self.name is not None else None
+        for index, path, statres in plan:
+            if os.path.basename(path) == archive_basename and os.path.abspath(path) == self.name:
+                self._dbg(2, f"tarfile: Skipped {path!r}")
+                continue
+            arcname = arcnames[index] + path[len(plan.include_dirs[index]):]
+            self._add_entry(path, arcname, statres)
+
+    def _add_entry(self, name, arcname, statres):
+        self._dbg(1, name)
+
+        tarinfo = self.tarinfo_from_stat(name, arcname, statres)
         if tarinfo is None:
             self._dbg(1, f"tarfile: Unsupported type {name!r}")
             return
 
-        # Change or exclude the TarInfo object.
-        if filter is not None:
-            tarinfo = filter(tarinfo)
-            if tarinfo is None:
-                self._dbg(2, f"tarfile: Excluded {name!r}")
-                return
+        if self.snapshot is not None and not tarinfo.isdir() and self.snapshot.unchanged(name, statres):
+            # not archived: later hardlinks to it must be stored as regular files
+            if self.stats is not None:
+                self.stats.skip("unchanged")
+            inode = (statres.st_ino, statres.st_dev)
+            if self.inodes.get(inode) == tarinfo.name:
+                del self.inodes[inode]
+            return
 
         # Append the tar header and data to the archive.
         if tarinfo.isreg():
             try:
-                with open(name, "rb") as f:
+                with open(name, "rb") if self.source is None else self.source.open(name) as f:
+                    tarinfo.size = self._current_size(f, tarinfo.size)
                     self.addfile(tarinfo, f)
             except PermissionError:
-                printWarning(f"Skip file (permission error): {name}")
-                return
+                printSkip("file", "permission error", name)
+                if self.snapshot is not None:
+                    self.snapshot.forget(name)
             except FileNotFoundError:
-                printWarning(f"Skip file (broken symlink): {name}")
-                return
+                printSkip("file", "broken symlink", name)
+                if self.snapshot is not None:
+                    self.snapshot.forget(name)
 
         elif tarinfo.isdir():
+            if self.dereference and os.path.islink(name) and self._is_symlink_loop(name):
+                printSkip("directory", "symlink loop", name)
+                return
             self.addfile(tarinfo)
-            if recursive:
-                try:
-                    for f in os.listdir(name):
-                        self.add(os.path.join(name, f), os.path.join(arcname, f), recursive, exclude, filter=filter)
-                except PermissionError as err:
-                    printWarning(f"Skip directory (permission error): {name}")
-                    return
         else:
             self.addfile(tarinfo)
 
+    @staticmethod
+    def _current_size(f, size):
+        """ Size of the opened file: it may have changed since the scan (fan-out streams keep the scanned one) """
+        try:
+            return os.fstat(f.fileno()).st_size
+        except (AttributeError, OSError, ValueError):
+            return size
+
+    @staticmethod
+    def _is_symlink_loop(path):
+        target = os.path.realpath(path)
+        parent = os.path.realpath(os.path.dirname(path))
+        return parent == target or parent.startswith(target + "/")
+
+    def tarinfo_from_stat(self, name, arcname, statres):
+        """ Same as TarFile.gettarinfo(), but takes an already available stat result
+            and caches the uid/gid -> user/group name lookups.
+        """
+        arcname = arcname.replace(os.sep, "/").lstrip("/")
+        tarinfo = self.tarinfo()
+        linkname = ""
+
+        stmd = statres.st_mode
+        if stat.S_ISREG(stmd):
+            inode = (statres.st_ino, statres.st_dev)
+            if not self.dereference and statres.st_nlink > 1 and \
+                    inode in self.inodes and arcname != self.inodes[inode]:
+                # hardlink to an already archived file
+                ftype = tarfile.LNKTYPE
+                linkname = self.inodes[inode]
+            else:
+                ftype = tarfile.REGTYPE
+                if inode[0]:
+                    self.inodes[inode] = arcname
+        elif stat.S_ISDIR(stmd):
+            ftype = tarfile.DIRTYPE
+        elif stat.S_ISFIFO(stmd):
+            ftype = tarfile.FIFOTYPE
+        elif stat.S_ISLNK(stmd):
+            ftype = tarfile.SYMTYPE
+            linkname = os.readlink(name)
+        elif stat.S_ISCHR(stmd):
+            ftype = tarfile.CHRTYPE
+        elif stat.S_ISBLK(stmd):
+            ftype = tarfile.BLKTYPE
+        else:
+            return None
+
+        tarinfo.name = arcname
+        tarinfo.mode = stmd
+        tarinfo.uid = statres.st_uid
+        tarinfo.gid = statres.st_gid
+        tarinfo.size = statres.st_size if ftype == tarfile.REGTYPE else 0
+        tarinfo.mtime = statres.st_mtime
+        tarinfo.type = ftype
+        tarinfo.linkname = linkname
+        tarinfo.uname = self._lookup_name(self._unames, pwd.getpwuid if pwd else None, tarinfo.uid)
+        tarinfo.gname = self._lookup_name(self._gnames, grp.getgrgid if grp else None, tarinfo.gid)
+        if ftype in (tarfile.CHRTYPE, tarfile.BLKTYPE):
+            tarinfo.devmajor = os.major(statres.st_rdev)
+            tarinfo.devminor = os.minor(statres.st_rdev)
+        return tarinfo
+
+    @staticmethod
+    def _lookup_name(cache, lookup, ident):
+        name = cache.get(ident)
+        if name is None:
+            name = ""
+            if lookup is not None:
+                try:
+                    name = lookup(ident)[0]
+                except KeyError:
+                    pass
+            cache[ident] = name
+        return name
+
 
 class Backupset:
     def __init__(self, config_file):
@@ -291,7 +2559,12 @@ class Backupset:
         self.name = ""
         self.description = ""
         self.enabled = False
+        self.workers = 1    # 0: auto (usable CPU count)
+        self.fanout = False    # tasks with the same include dirs read the files once (they run concurrently)
+        self.filestate_cache = False    # Filestatecache: unchanged files are not read again
+        self.scan_cache = None
         self.task_list = []
+        self.results = []
         self.g = Configglobal()
         # parse config
         self._load_config()
@@ -301,10 +2574,17 @@ class Backupset:
         METHOD_EXTENSIONS = {
             'tar': '.tar',
             'targz': '.tar.gz',
+            'targz-seekable': '.tar.gz',
             'tarbz2': '.tar.bz2',
             'tarxz': '.tar.xz',
+            'tarzst': '.tar.zst',
             'zip': '.zip',
+            'cas': '.cas',
         }
+        LEVEL_RANGES = {'targz': (0, 9), 'targz-seekable': (0, 9), 'tarbz2': (1, 9), 'tarxz': (0, 9), 'zip': (0, 9)}
+        if zstd is not None:
+            LEVEL_RANGES['tarzst'] = zstd.CompressionParameter.compression_level.bounds()
+        HASH_ALGORITHMS = ('md5', 'sha256', 'blake2b')
 
         try:
             with open(self.config_file, "rb") as f:
@@ -324,6 +2604,17 @@ class Backupset:
             self.name = meta["name"]
             self.description = meta.get("description", "")
             self.enabled = meta["enabled"]
+            self.workers = meta.get("workers", 1)
+            if not isinstance(self.workers, int) or isinstance(self.workers, bool) or self.workers < 0:
+                exit_config_error(self.config_file, "meta", "'workers' must be a non-negative integer (0: auto)")
+            self.fanout = meta.get("fanout", False)
+            if not isinstance(self.fanout, bool):
+                exit_config_error(self.config_file, "meta", "'fanout' must be true or false")
+            self.filestate_cache = meta.get("filestate_cache", False)
+            if not isinstance(self.filestate_cache, bool):
+                exit_config_error(self.config_file, "meta", "'filestate_cache' must be true or false")
+            if self.filestate_cache and sqlite3 is None:
+                exit_config_error(self.config_file, "meta", "'filestate_cache' needs the sqlite3 module")
 
             # [global_excludes]
             glb = cfg.get("global_excludes", {})
@@ -336,16 +2627,39 @@ class Backupset:
                 section_name = f"backup[{idx}]"
                 task = Backuptask(section_name, self.g, self.config_file)
                 task.section = section_name
+                task.filestate_cache = self.filestate_cache
                 task.enabled = section["enabled"]
                 task.name = section["name"]
                 task.archive_name = section["archive_name"]
+                task.archive_basename = task.archive_name
                 task.create_target_date_dir = section["create_target_date_dir"]
                 task.path_result_dir = section["result_dir"]
+                task.path_result_base = task.path_result_dir
                 task.method = section["method"]
                 task.followsym = section["followsym"]
                 task.withpath = section["withpath"]
                 task.skip_if_permission_fail = section["skip_if_permission_fail"]
                 task.skip_if_directory_nonexistent = section["skip_if_directory_nonexistent"]
+                task.hash_algorithm = section.get("hash_algorithm", "md5")
+                task.threads = section.get("threads", 1)
+                if not isinstance(task.threads, int) or isinstance(task.threads, bool) or task.threads < 0:
+                    exit_config_error(self.config_file, section_name, "'threads' must be a non-negative integer (0: auto)")
+                if task.threads == 0:
+                    task.threads = available_cpu_count()
+                task.compression_level = section.get("compression_level")
+                task.on_insufficient_space = section.get("on_insufficient_space", "warn")
+                if task.on_insufficient_space not in ("warn", "skip", "fail"):
+                    exit_config_error(self.config_file, section_name,
+                                      [f"Wrong on_insufficient_space value ({task.on_insufficient_space})",
+                                       "on_insufficient_space = { warn ; skip ; fail }"])
+                task.seek_block_size = section.get("seek_block_size", 4)
+                if not isinstance(task.seek_block_size, int) or isinstance(task.seek_block_size, bool) \
+                        or task.seek_block_size < 1:
+                    exit_config_error(self.config_file, section_name, "'seek_block_size' must be a positive integer (MiB)")
+                task.incremental = section.get("incremental", False)
+                task.full_every = section.get("full_every", 0)
+                if not isinstance(task.full_every, int) or isinstance(task.full_every, bool) or task.full_every < 0:
+                    exit_config_error(self.config_file, section_name, "'full_every' must be a non-negative integer (0: never)")
 
                 task.include_dirs = strip_enddash_on_list(list(section["include_dirs"]))
                 task.exclude_dir_fullpath = strip_enddash_on_list(list(section.get("exclude_dir_fullpaths", [])))
@@ -356,6 +2670,7 @@ class Backupset:
                 # precompute merged exclude lists (global + task)
                 task._all_endings = tuple(self.g.exclude_endings + task.exclude_endings)
                 task._all_files = self.g.exclude_files + task.exclude_files
+                task.compile_excludes()
 
                 # archive filename with timestamp + extension
                 if task.archive_name.strip() == '':
@@ -364,6 +2679,26 @@ class Backupset:
                     exit_config_error(self.config_file, section_name,
                                       [f"Wrong compression method declared ({task.method})",
                                        f"method = {{ {' ; '.join(METHOD_EXTENSIONS)} }}"])
+                if task.hash_algorithm not in HASH_ALGORITHMS:
+                    exit_config_error(self.config_file, section_name,
+                                      [f"Wrong hash algorithm declared ({task.hash_algorithm})",
+                                       f"hash_algorithm = {{ {' ; '.join(HASH_ALGORITHMS)} }}"])
+                if task.method == 'tarzst' and zstd is None:
+                    exit_config_error(self.config_file, section_name,
+                                      ["Method 'tarzst' is not supported by this python interpreter",
+                                       f"(compression.zstd module is missing: python 3.14+ is required, this is {sys.version.split()[0]})"])
+                if task.method == 'cas' and task.incremental:
+                    exit_config_error(self.config_file, section_name,
+                                      "'incremental' is not supported with method 'cas' (it's deduplicated anyway)")
+                if task.compression_level is not None:
+                    low, high = LEVEL_RANGES.get(task.method, (None, None))
+                    if low is None:
+                        exit_config_error(self.config_file, section_name,
+                                          f"'compression_level' is not supported with method '{task.method}'")
+                    if not isinstance(task.compression_level, int) or isinstance(task.compression_level, bool) \
+                            or not low <= task.compression_level <= high:
+                        exit_config_error(self.config_file, section_name,
+                                          f"'compression_level' must be an integer between {low} and {high} for method '{task.method}'")
                 task.archive_name += f"_{get_date()}_{get_time_short()}{METHOD_EXTENSIONS[task.method]}"
 
                 # result dir with optional date subdir
@@ -394,6 +2729,75 @@ class Backupset:
     def has_active_backuptask(self):
         return any(task.enabled for task in self.task_list)
 
+    def group_tasks_by_device(self, tasks):
+        """ Tasks sharing any source or target device end up in the same group
+            (run one after the other), independent groups can run in parallel.
+        """
+        groups = []    # [(device id set, task list)]
+        for task in tasks:
+            devices = task.device_ids()
+            merged_devices, merged_tasks = set(devices), []
+            for group in [g for g in groups if not g[0].isdisjoint(devices)]:
+                groups.remove(group)
+                merged_devices |= group[0]
+                merged_tasks += group[1]
+            merged_tasks.append(task)
+            groups.append((merged_devices, sorted(merged_tasks, key=tasks.index)))
+        return sorted((g[1] for g in groups), key=lambda g: tasks.index(g[0]))
+
+    def fanout_batches(self, tasks):
+        """ Splits a task group into batches run together: tasks with the same include dirs
+            and symlink handling share a Fanout (cas and incremental tasks always run alone)
+        """
+        batches = {}
+        for task in tasks:
+            shareable = self.fanout and not Backupy.profile_dir and task.method != "cas" and not task.incremental
+            batches.setdefault(Fanout.key(task) if shareable else task, []).append(task)
+        return list(batches.values())
+
+    def _execute_task(self, task, prefix):
+        """ prefix: the task runs on a pool thread next to other tasks - its log lines are prefixed
+            with its name, a failure (sys.exit) is returned as a 'failed' Taskresult
+        """
+        log_context.prefix = f"[{task.name}] " if prefix else ""
+        log_context.backupset, log_context.task = self.name, task.name
+        start = time.time()
+        try:
+            if Backupy.profile_dir:
+                name = re.sub(r"[^\w.-]+", "_", f"{self.name}-{task.name}")
+                return profile_call(task.execute, os.path.join(Backupy.profile_dir, name))
+            return task.execute()
+        except SystemExit as err:
+            if not prefix:
+                raise
+            result = Taskresult(task.name)
+            result.status = "failed"
+            result.exit_code = err.code if isinstance(err.code, int) else 1
+            result.elapsed = time.time() - start
+            result.stats = task.stats.as_dict()
+            printError(f"Backup task failed (exit code {result.exit_code})")
+            return result
+        finally:
+            log_context.prefix = ""
+            log_context.backupset = log_context.task = None
+
+    def _execute_fanout(self, tasks):
+        printLog(f"Fan-out: {', '.join(task.name for task in tasks)} read their include dirs once")
+        fanout = Fanout(tasks, self.scan_cache)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(tasks)) as pool:
+            futures = [pool.submit(self._execute_task, task, True) for task in tasks]
+            fanout.run()
+            return [future.result() for future in futures]
+
+    def _execute_task_group(self, tasks, prefix):
+        results = []
+        for batch in self.fanout_batches(tasks):
+            if len(batch) > 1:
+                results += self._execute_fanout(batch)
+            else:
+                results.append(self._execute_task(batch[0], prefix))
+        return results
+
     def execute(self):
         if not self.enabled:
             printLog(f"Backup set \"{self.name}\" is DISABLED --> SKIPPING")
@@ -404,17 +2808,45 @@ class Backupset:
             printLog(f"You don't have any active backup task entries in {self.config_file}")
             printLog("Exiting.")
             return False
-        for task in self.task_list:
-            if task.compress_pre():
-                printLog("Processing...")
-                if task.method == "zip":
-                    task.compress_zip()
-                else:
-                    task.compress_tar()
+
+        self.results = [task.execute() for task in self.task_list if not task.enabled]
+        enabled = [task for task in self.task_list if task.enabled]
+        # include dirs of several tasks are walked once (tasks sharing a source device run in one group)
+        self.scan_cache = Scancache()
+        for task in enabled:
+            task.attach_scan_cache(self.scan_cache)
+        groups = self.group_tasks_by_device(enabled)
+        workers = min(self.workers or available_cpu_count(), len(groups))
+        if Backupy.profile_dir:
+            workers = 1    # one profiler at a time: tasks run one after the other
+        if workers <= 1:
+            for group in groups:
+                self.results += self._execute_task_group(group, prefix=False)
+        else:
+            printLog(f"Running {len(groups)} independent task groups on {workers} workers")
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(self._execute_task_group, group, True) for group in groups]
+                for future in futures:
+                    self.results += future.result()
+        self.print_summary()
         printLog(Backupy.double_line)
+        failed = [result for result in self.results if result.status == "failed"]
+        if failed:
+            sys.exit(failed[0].exit_code)
+        return self.results
+
+    def print_summary(self):
+        printLog(Backupy.simple_line)
+        printLog("Task summary:")
+        order = [task.name for task in self.task_list]
+        for result in sorted(self.results, key=lambda r: order.index(r.name)):
+            size = sizeof_fmt(result.size) if result.status == "done" else "-"
+            printLog(f"  {result.status:<8} {format_elapsed(result.elapsed)}  {size:>10}  {result.name}")
 
 
 class Backuptask:
+    ZIP_SAMPLE_SIZE = 16 * 1024
+
     def __init__(self, section, cglobal, path_config_file):
         self.section = section
         self.configs_global = {}
@@ -429,59 +2861,178 @@ class Backuptask:
         self.create_target_date_dir = True
         self.skip_if_permission_fail = False
         self.skip_if_directory_nonexistent = False
+        self.hash_algorithm = 'md5'
+        self.threads = 1
+        self.compression_level = None    # None: method default
+        self.seek_block_size = 4    # MiB, targz-seekable
+        self.on_insufficient_space = 'warn'    # warn, skip, fail
+        self.size_estimator = None
+        self.plan = None    # Scanplan of the run
+        self.scan_cache = None    # Scancache of the backup set run
+        self.scan_keys = []
+        self.fanout = None    # Fanout: the files are read once for several tasks
+        self.filestate_cache = False
+        self.feed = None    # Fanoutfeed of the run, replaces the plan for the archiver
+        self.zip_members = []    # (name, size, compressed size): teaches the size estimator
+        self.stats = Taskstats()    # of the last run
+        self.incremental = False
+        self.full_every = 0
+        self.snapshot = None
+        self.archive_basename = ''
+        self.path_result_base = ''    # result_dir without the date subdir
         self.include_dirs = []
         self.exclude_dir_fullpath = []
         self.exclude_dir_names = []
         self.exclude_endings = []
         self.exclude_files = []
+        self.exclude_matcher = None
         self.configs_global = cglobal
 
         self.path_config_file = path_config_file
 
+    def device_ids(self):
+        """ st_dev of every include dir and of the result dir """
+        devices = {get_device_id(path) for path in self.include_dirs + [self.path_result_dir]}
+        devices.discard(None)
+        return devices
+
+    @property
+    def plan_followsym(self):
+        # zip walks into symlinked dirs and stores the targets of symlinks
+        return self.followsym or self.method == "zip"
+
+    def attach_scan_cache(self, cache):
+        """ Registers the include dirs in the backup set's Scancache, released when the task ends """
+        self.scan_cache = cache
+        self.scan_keys = [(path, self.plan_followsym) for path in self.include_dirs]
+        for key in self.scan_keys:
+            cache.register(key)
+
+    def execute(self):
+        """ Runs the backup task and returns its Taskresult """
+        result = Taskresult(self.name)
+        start = time.time()
+        self.stats = log_context.stats = Taskstats()
+        log_context.warnings = collections.Counter()
+        try:
+            proceed = self.compress_pre()
+            if self.fanout is not None:
+                self.feed = self.fanout.join(self, proceed)
+            if proceed:
+                if self.incremental:
+                    self.load_snapshot()
+                printLog("Processing...")
+                if Backupy.progress_interval:
+                    self.stats.progress = self.progressmeter()
+                with self.stats.phase("archive"):
+                    if self.method == "zip":
+                        self.compress_zip()
+                    elif self.method == "cas":
+                        self.compress_cas()
+                    else:
+                        self.compress_tar()
+        finally:
+            log_context.stats = None
+            logger.summarize(log_context.warnings)
+            logger.flush()
+            log_context.warnings = None
+            if self.fanout is not None:
+                self.fanout.leave(self, self.feed)
+                self.fanout = self.feed = None
+            if self.plan is not None:
+                self.plan.close()
+                self.plan = None
+            if self.scan_cache is not None:
+                for key in self.scan_keys:
+                    self.scan_cache.release(key)
+                self.scan_cache = None
+        if proceed:
+            result.status = "done"
+            result.size = self.stats.bytes_out = os.path.getsize(self.archivefullpath)
+            printLog(f"Time: {self.stats.format_phases()}")
+            if self.size_estimator is not None:
+                try:
+                    self.size_estimator.learn(result.size, self.zip_members)
+                except OSError as err:
+                    printWarning(f"Cannot save size estimation model: {err.strerror} ({self.size_estimator.path})")
+        elif not self.enabled:
+            result.status = "disabled"
+        result.elapsed = time.time() - start
+        result.stats = self.stats.as_dict()
+        return result
+
+    def progressmeter(self):
+        """ Progressmeter of the archive phase: the size estimation's scan gives the totals (not with cas / incremental) """
+        total_bytes = total_files = None
+        if self.size_estimator is not None:
+            total_bytes, total_files = sum(self.size_estimator.ext_sizes.values()), self.size_estimator.file_count
+        return Progressmeter(self.name, Backupy.progress_interval, total_bytes, total_files)
+
+    @property
+    def path_snapshot(self):
+        return os.path.join(self.path_result_base, f"{self.archive_basename}.snapshot")
+
+    def load_snapshot(self):
+        self.snapshot = Snapshotmanifest(self.path_snapshot)
+        self.snapshot.load(self.full_every)
+        if self.snapshot.full:
+            printLog(f"Full backup (snapshot manifest: {self.path_snapshot})")
+        else:
+            printLog(f"Incremental backup #{self.snapshot.incrementals} since the last full backup "
+                     f"({len(self.snapshot.old)} files in snapshot manifest)")
+
+    def save_snapshot(self):
+        """ After a successful archive: deleted files go to '<archive>.deleted', new manifest replaces the old """
+        if self.snapshot is None:
+            return
+        deleted = self.snapshot.deleted()
+        if deleted:
+            printLog(f"Deleted since the previous run: {len(deleted)} files ({self.archivefullpath}.deleted)")
+            with open(f"{self.archivefullpath}.deleted", "w", encoding="utf-8", errors="surrogateescape") as f:
+                f.writelines(path + "\n" for path in deleted)
+        self.snapshot.save()
+        self.snapshot = None
+
     @property
     def check_include_dir_dups(self):
         return len(self.include_dirs) == len(set(self.include_dirs))
 
-    @staticmethod
-    def check_if_symlink_broken(path):
-        return os.path.islink(path) and not os.path.exists(path)
-
-    def store_md5(self, filepath):
-        printLog("Generating hash")
-        hash_value = hashlib.md5()
-        with open(filepath, "rb") as f:
-            for chunk in iter(lambda: f.read(2 ** 20), b''):
-                hash_value.update(chunk)
-        hash_result = hash_value.hexdigest()
-        printLog(hash_result)
-
-        md5_path = os.path.join(self.path_result_dir, "md5.sum")
-        with open(md5_path, 'a') as f:
-            csv.writer(f, delimiter=";").writerow([hash_result, os.path.getsize(filepath), Path(filepath).name])
+    def store_hash(self, output):
+        """ Appends the archive's hash (computed while writing) to '<hash_algorithm>.sum' in result dir """
+        hash_result = output.hexdigest()
+        printLog(f"{self.hash_algorithm}: {hash_result}")
+
+        sum_path = os.path.join(self.path_result_dir, f"{self.hash_algorithm}.sum")
+        with open(sum_path, 'a') as f:
+            csv.writer(f, delimiter=";").writerow([hash_result, output.size, Path(output.name).name])
+
+    def write_index(self, entries, blocks=()):
+        """ Writes the archive's sidecar index: '<archive>.idx' """
+        with self.stats.phase("index"):
+            Archiveindex.write(f"{self.archivefullpath}.idx", entries, blocks)
+        self.stats.count_index(entries)
+        printLog(f"Index: {len(entries)} entries ({self.archivefullpath}.idx)")
+
+    def compile_excludes(self):
+        self.exclude_matcher = Excludematcher(self._all_endings, self._all_files,
+                                              self.configs_global.exclude_dir_names,
+                                              self.exclude_dir_names, self.exclude_dir_fullpath)
 
     def _is_excluded(self, filenamefull, root_dir):
         """Returns True if the file should be excluded."""
-        if self._all_endings and filenamefull.endswith(self._all_endings):
-            printDebug(f"Exclude ending matched: {filenamefull}")
-            return True
-        if Path(filenamefull).name in self._all_files:
-            printDebug(f"Exclude file matched: {filenamefull}")
-            return True
-        parts = getsub_dir_path(root_dir, filenamefull).split("/")
-        if any(d in parts for d in self.configs_global.exclude_dir_names):
-            printDebug(f"Global exclude dir names matched at: {filenamefull}")
-            return True
-        if any(d in parts[1:] for d in self.exclude_dir_names):
-            printDebug(f"Task exclude dir names matched at: {filenamefull}")
-            return True
-        if any(dirname in filenamefull for dirname in self.exclude_dir_fullpath):
-            printDebug(f"Exclude dir fullpath matched at: {filenamefull}")
+        reason = self.exclude_matcher.match(filenamefull, root_dir)
+        if reason:
+            printDebug("%s: %s", reason, filenamefull)
             return True
         return False
 
-    def filter_tar(self, item, root_dir):
-        """tarfile filter callback: returns TarInfo or None."""
-        return None if self._is_excluded(os.path.join(root_dir, item.name), root_dir) else item
+    def _is_excluded_dir(self, dirpath, root_dir):
+        """Returns True if the whole directory subtree should be excluded."""
+        reason = self.exclude_matcher.match_dir(dirpath, root_dir)
+        if reason:
+            printDebug("%s: %s", reason, dirpath)
+            return True
+        return False
 
     def compress_pre(self):
         """Pre-flight checks before compression. Returns True if task can proceed."""
@@ -515,36 +3066,103 @@ class Backuptask:
             printWarning(skip)
             return False
 
+        with self.stats.phase("scan"):
+            self.build_plan()
+
         if self.skip_if_permission_fail:
             printLog(f"Pre-flight permission checks (followsym: {self.followsym})")
-            unreadable_found = False
-            for include_dir in self.include_dirs:
-                unreadable_files = get_unreadable_files_in_recursive_subdir(include_dir, self.followsym)
-                if unreadable_files:
-                    printWarning(f"Unreadable files in {include_dir}:")
-                    printWarning(unreadable_files)
-                    unreadable_found = True
-            if unreadable_found:
+            if self.plan.unreadable:
+                printWarning("Unreadable files:")
+                printWarning(self.plan.unreadable, key="Unreadable file")
                 printWarning(skip)
                 return False
 
+        printLog(f"Free space in target dir: {get_dir_free_space(self.path_result_dir)}")
+        with self.stats.phase("estimate"):
+            enough_space = self.check_free_space()
+        if not enough_space:
+            printWarning(skip)
+            return False
+
         printLog(f"Creating archive: {self.archivefullpath}")
         printLog(f"Compressing method: {self.method}")
-        printLog(f"Free space in target dir: {get_dir_free_space(self.path_result_dir)}")
         return True
 
+    def build_plan(self):
+        """ Walks the include dirs once (see Scanplan), with the exclusions the archiver used to apply """
+        # dir names are matched from the include dir down (whatever withpath is): plan paths are real paths
+        roots = list(self.include_dirs)
+        # tar: every entry is filtered, dirs by the file rules too
+        exclude_dir = self._is_excluded_dir if self.method in ("zip", "cas") else self._is_excluded
+
+        def counted(excluded):
+            def check(path, i):
+                if excluded(path, roots[i]):
+                    self.stats.skip("excluded")
+                    return True
+                return False
+            return check
+        start = time.time()
+        self.plan = Scanplan(self.include_dirs, self.plan_followsym).build(
+            counted(self._is_excluded), counted(exclude_dir), self.scan_cache)
+        printLog(f"Scanned {len(self.plan)} entries ({format_elapsed(time.time() - start)})")
+
+    def check_free_space(self):
+        """ Predicts the archive size (see Sizeestimator), returns False if the task has to be skipped """
+        if self.method == 'cas' or self.incremental:
+            return True    # the new data can't be told from a stat scan
+        estimator = Sizeestimator(os.path.join(self.path_result_base, "backupy-estimate.json"), self.method,
+                                  self.archive_basename)
+        estimator.load()
+        input_size = estimator.scan(self.plan)
+        predicted = estimator.predict()
+        printLog(f"Input: {estimator.file_count} files, {sizeof_fmt(input_size)}, "
+                 f"estimated archive size: {sizeof_fmt(predicted)}")
+        self.size_estimator = estimator
+        free = get_dir_free_bytes(self.path_result_dir)
+        if predicted <= free:
+            return True
+        message = f"Estimated archive size ({sizeof_fmt(predicted)}) exceeds the free space ({sizeof_fmt(free)})"
+        match self.on_insufficient_space:
+            case "fail":
+                printError(message)
+                sys.exit(errno.ENOSPC)
+            case "skip":
+                printWarning(message)
+                return False
+            case _:
+                printWarning(message)
+                return True
+
     def compress_tar(self):
         """ Compressing with tar/targz method """
         TAR_MODES = {'tar': 'w', 'targz': 'w:gz', 'tarbz2': 'w:bz2', 'tarxz': 'w:xz'}
-        mode = TAR_MODES[self.method]
+        TAR_CODECS = {'targz': 'gz', 'tarbz2': 'bz2', 'tarxz': 'xz'}
+        blocks = ()
 
         try:
-            # http://stackoverflow.com/a/39321142/4325232
-            with BackupyTarfile.open(name=self.archivefullpath, mode=mode, dereference=self.followsym) as archive:
-                for entry in self.include_dirs:
-                    arcname = entry if self.withpath else os.path.basename(entry)
-                    root_dir = os.path.dirname(entry)
-                    archive.add(entry, arcname=arcname, filter=lambda x, r=root_dir: self.filter_tar(x, r))
+            with Hashingwriter(self.archivefullpath, self.hash_algorithm, self.stats) as output:
+                if self.method == 'targz-seekable':
+                    # independent gzip members every seek_block_size MiB, their offsets go to the index
+                    printLog(f"Seekable gzip: {self.seek_block_size} MiB blocks, {self.threads} threads")
+                    with Parallelcompressor(output, 'gz', self.threads, level=self.compression_level,
+                                            blocksize=self.seek_block_size * 2 ** 20) as stream:
+                        index = self._write_tar(stream, 'w')
+                    blocks = stream.blocks
+                elif self.method == 'tarzst':
+                    with self._open_zstd(output) as stream:
+                        index = self._write_tar(stream, 'w')
+                elif self.method in TAR_CODECS and self.threads > 1:
+                    printLog(f"Parallel compression on {self.threads} threads")
+                    with Parallelcompressor(output, TAR_CODECS[self.method], self.threads,
+                                            level=self.compression_level) as stream:
+                        index = self._write_tar(stream, 'w')
+                elif self.method in TAR_CODECS and self.compression_level is not None:
+                    level_arg = 'preset' if self.method == 'tarxz' else 'compresslevel'
+                    index = self._write_tar(output, TAR_MODES[self.method], **{level_arg: self.compression_level})
+                else:
+                    index = self._write_tar(output, TAR_MODES[self.method])
+            self.write_index(index, blocks)
 
         except OSError as err:
             match err.errno:
@@ -556,33 +3174,109 @@ class Backuptask:
                     printError(f"OSError: {err.strerror} ({self.archivefullpath})")
             sys.exit(err.errno or 99)
 
-        self.store_md5(self.archivefullpath)
+        self.store_hash(output)
+        self.save_snapshot()
         printOK(f"Done [{sizeof_fmt(os.path.getsize(self.archivefullpath))}]")
 
+    def _open_zstd(self, output):
+        workers = 0
+        if self.threads > 1:
+            workers = min(self.threads, zstd.CompressionParameter.nb_workers.bounds()[1])
+            if workers:
+                printLog(f"zstd compression on {workers} worker threads")
+            else:
+                printWarning("zstd library is built without multi-threading support, using 1 thread")
+        if not workers:
+            return zstd.ZstdFile(output, mode='w', level=self.compression_level)
+        # ZstdFile takes either level or options: the level goes into options too
+        options = {zstd.CompressionParameter.nb_workers: workers}
+        if self.compression_level is not None:
+            options[zstd.CompressionParameter.compression_level] = self.compression_level
+        return zstd.ZstdFile(output, mode='w', options=options)
+
+    def _write_tar(self, fileobj, mode, **kwargs):
+        """ Writes the include dirs into a tar stream, returns the archive index entries """
+        # http://stackoverflow.com/a/39321142/4325232
+        with BackupyTarfile.open(name=self.archivefullpath, mode=mode, fileobj=fileobj,
+                                 dereference=self.followsym, **kwargs) as archive:
+            archive.snapshot = self.snapshot
+            archive.index = []
+            archive.source = self.feed
+            archive.stats = self.stats
+            archive.estimator = self.size_estimator
+            archive.add_plan(self.feed or self.plan, [entry if self.withpath else os.path.basename(entry)
+                                                      for entry in self.include_dirs])
+        return archive.index
+
+    def zip_compress_type(self, path, statres, peek):
+        """ ZIP_STORED for data deflate can't shrink: known compressed formats, or a deflated sample
+            of the first ZIP_SAMPLE_SIZE bytes (peek(size) of the content) saving less than 5%
+        """
+        if zcompression == zipfile.ZIP_STORED or self.compression_level == 0:
+            return zipfile.ZIP_STORED
+        if os.path.splitext(path)[1].lower() in Sizeestimator.INCOMPRESSIBLE:
+            return zipfile.ZIP_STORED
+        if statres.st_size < 4 * self.ZIP_SAMPLE_SIZE:
+            return zcompression    # small file: sampling costs as much as deflating it
+        try:
+            sample = peek(self.ZIP_SAMPLE_SIZE)[:self.ZIP_SAMPLE_SIZE]
+        except OSError:
+            return zcompression    # reported when the file is archived
+        if sample and len(zlib.compress(sample, 1)) > 0.95 * len(sample):
+            return zipfile.ZIP_STORED
+        return zcompression
+
     def compress_zip(self):
         """ Compressing with zip method """
+        stored_count = 0
         try:
-            with zipfile.ZipFile(file=self.archivefullpath, mode="w", compression=zcompression) as archive:
-                for entry in self.include_dirs:
-                    for subdir, dirs, files in os.walk(top=entry, followlinks=True):
-                        for filename in files:
-                            file_fullpath = os.path.join(subdir, filename)
-
-                            if self._is_excluded(file_fullpath, entry):
-                                continue
-                            if self.check_if_symlink_broken(file_fullpath):
-                                printWarning(f"broken symlink (skip): {file_fullpath}")
-                                continue
-
-                            arcname = file_fullpath if self.withpath else os.path.join(getsub_dir_path(entry, subdir), filename)
+            with Hashingwriter(self.archivefullpath, self.hash_algorithm, self.stats) as output, \
+                    zipfile.ZipFile(file=output, mode="w", compression=zcompression,
+                                    compresslevel=self.compression_level) as archive:
+                zipper = contextlib.nullcontext()
+                if self.threads > 1 and zcompression == zipfile.ZIP_DEFLATED:
+                    if ZIPFILE_INTERNALS["append"]:
+                        printLog(f"Parallel zip compression on {self.threads} threads")
+                        zipper = Parallelzipwriter(archive, self.threads)
+                    else:
+                        printWarning("This python's zipfile module does not support parallel zip compression, "
+                                     "using 1 thread")
+                with zipper as zipper:
+                    for index, file_fullpath, statres in self.feed or self.plan:
+                        if not stat.S_ISREG(statres.st_mode):
+                            continue    # directories are implied by the member names
+                        if self.snapshot is not None and self.snapshot.unchanged(file_fullpath, statres):
+                            self.stats.skip("unchanged")
+                            continue
+
+                        entry = self.include_dirs[index]
+                        subdir, filename = os.path.split(file_fullpath)
+                        arcname = file_fullpath if self.withpath else os.path.join(getsub_dir_path(entry, subdir), filename)
+                        if zipper is None or statres.st_size > zipper.STREAM_SIZE:
+                            # one by one, large files streamed: the entries compressed so far go first
+                            for item, future in zipper.drain() if zipper is not None else ():
+                                stored_count += self._zip_add(*item, lambda: zipper.append(*future.result()))
+                            stored_count += self._zip_add(file_fullpath, subdir,
+                                                          lambda: self._zip_write(archive, file_fullpath, arcname, statres))
+                            continue
+                        data = None
+                        if self.feed is not None:    # the stream is only readable until the next entry
                             try:
-                                archive.write(filename=file_fullpath, arcname=arcname)
-                            except UnicodeEncodeError:
-                                printWarning(f"Skip file (name encoding problem): {subdir}")
-                            except PermissionError:
-                                printWarning(f"Skip file (permission error): {file_fullpath}")
+                                with self.feed.open(file_fullpath) as src:
+                                    data = Timedreader(src, self.stats).read()
                             except OSError as err:
-                                printWarning(f"Skip file ({err.strerror}): {file_fullpath}")
+                                self._zip_skip(file_fullpath, subdir, err)
+                                continue
+                        for item, future in zipper.submit((file_fullpath, subdir), statres.st_size,
+                                                          self._zip_compress_entry, zipper, file_fullpath,
+                                                          arcname, statres, data):
+                            stored_count += self._zip_add(*item, lambda: zipper.append(*future.result()))
+                    for item, future in zipper.drain() if zipper is not None else ():
+                        stored_count += self._zip_add(*item, lambda: zipper.append(*future.result()))
+            self.zip_members = [(info.filename, info.file_size, info.compress_size) for info in archive.infolist()]
+            self.write_index([(info.filename, tarfile.DIRTYPE if info.is_dir() else tarfile.REGTYPE,
+                               info.external_attr >> 16, info.file_size, time.mktime(info.date_time + (0, 0, -1)),
+                               info.header_offset, info.CRC) for info in archive.infolist()])
 
         except OSError as err:
             match err.errno:
@@ -594,13 +3288,152 @@ class Backuptask:
                     printError(f"OSError: {err.strerror} ({self.archivefullpath})")
             sys.exit(err.errno or 99)
 
-        self.store_md5(self.archivefullpath)
+        if stored_count and zcompression != zipfile.ZIP_STORED:
+            printLog(f"Stored without compression (already compressed data): {stored_count} files")
+        self.store_hash(output)
+        self.save_snapshot()
         printOK(f"Done [{sizeof_fmt(os.path.getsize(self.archivefullpath))}]")
 
+    def _zip_add(self, path, subdir, write):
+        """ Runs the write of one entry, returns True if it was stored without compression """
+        try:
+            return write() == zipfile.ZIP_STORED
+        except (UnicodeEncodeError, OSError) as err:
+            self._zip_skip(path, subdir, err)
+            return False
+
+    def _zip_skip(self, path, subdir, err):
+        if isinstance(err, UnicodeEncodeError):
+            printSkip("file", "name encoding problem", subdir)
+        elif isinstance(err, PermissionError):
+            printSkip("file", "permission error", path)
+        else:
+            printSkip("file", err.strerror, path)
+        if self.snapshot is not None:
+            self.snapshot.forget(path)
+
+    def _zip_compress_entry(self, zipper, path, arcname, statres, data=None):
+        """ Pool job of the parallel zip writer: returns (ZipInfo, data to append) """
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        if data is None:
+            with open(path, "rb", buffering=self.ZIP_SAMPLE_SIZE) as src:
+                zinfo.compress_type = self.zip_compress_type(path, statres, src.peek)
+                data = Timedreader(src, self.stats).read()
+        else:
+            zinfo.compress_type = self.zip_compress_type(path, statres, lambda size: data[:size])
+        return zinfo, zipper.compress(zinfo, data)
+
+    def _zip_write(self, archive, path, arcname, statres):
+        """ ZipFile.write: the file is opened once for the sample and the content (which may come
+            from the Fanout), returns the compression zip_compress_type chose
+        """
+        zinfo = zipfile.ZipInfo.from_file(path, arcname)
+        with open(path, "rb", buffering=self.ZIP_SAMPLE_SIZE) if self.feed is None else self.feed.open(path) as src:
+            zinfo.compress_type = self.zip_compress_type(path, statres, src.peek)
+            if archive.compresslevel is not None:
+                if ZIPFILE_INTERNALS["level"] is None:    # ZipFile.write is the only way to pass the level
+                    archive.write(path, arcname, zinfo.compress_type)
+                    return zinfo.compress_type
+                setattr(zinfo, ZIPFILE_INTERNALS["level"], archive.compresslevel)
+            with archive.open(zinfo, 'w') as dest:
+                if zinfo.compress_type == zipfile.ZIP_STORED and isinstance(archive.fp, Hashingwriter) \
+                        and ZIPFILE_INTERNALS["copy"] and archive.fp.can_copy_from(src, zinfo.file_size):
+                    # stored as is: the content bypasses the zip writer, which only writes the data descriptor
+                    self.stats.add_file()
+                    dest._crc = archive.fp.copy_from(src, zinfo.file_size)
+                    dest._file_size = dest._compress_size = zinfo.file_size
+                else:
+                    shutil.copyfileobj(Timedreader(src, self.stats), dest, 1024 * 8)
+        return zinfo.compress_type
+
+    def compress_cas(self):
+        """ Deduplicated, content-addressed storage (see Chunkstore) """
+        store = Chunkstore(os.path.join(self.path_result_base, "backupy-cas"))
+        printLog(f"Chunk store: {store.path}")
+        CAS_TYPES = {"dir": tarfile.DIRTYPE, "symlink": tarfile.SYMTYPE, "file": tarfile.REGTYPE}
+        stored_bytes = file_count = 0
+        index = []
+        cache = None
+        if self.filestate_cache:
+            cache = Filestatecache(Filestatecache.default_path()).open()
+        try:
+            with store.lock():    # no gc until the snapshot is registered
+                with Hashingwriter(self.archivefullpath, self.hash_algorithm, self.stats) as output, \
+                        gzip.GzipFile(filename=os.path.basename(self.archivefullpath), mode="wb", fileobj=output) as snapshot:
+                    header = {"backupy_cas": 1, "task": self.name, "created": datetime.datetime.now().isoformat(),
+                              "store": os.path.abspath(store.path)}
+                    snapshot.write((json.dumps(header) + "\n").encode())
+                    for dir_index, path, statres in self.plan:
+                        entry = self.include_dirs[dir_index]
+                        record = {"path": path.lstrip("/") if self.withpath else getsub_dir_path(entry, path),
+                                  "mode": stat.S_IMODE(statres.st_mode), "mtime": statres.st_mtime}
+                        if stat.S_ISDIR(statres.st_mode):
+                            record["type"] = "dir"
+                        elif stat.S_ISLNK(statres.st_mode):
+                            record["type"] = "symlink"
+                            record["target"] = os.readlink(path)
+                        elif stat.S_ISREG(statres.st_mode):
+                            record["type"] = "file"
+                            record["size"] = statres.st_size
+                            cached = cache.lookup(statres) if cache is not None else None
+                            if cached and cached["chunks"] is not None and store.has_chunks(cached["chunks"]):
+                                record["chunks"], stored = cached["chunks"], 0    # unchanged: not read again
+                            else:
+                                try:
+                                    record["chunks"], stored = self._store_file_chunks(store, path, self.stats)
+                                except OSError as err:
+                                    if err.errno in (errno.ENOSPC, errno.EDQUOT):
+                                        raise
+                                    printSkip("file", err.strerror, path)
+                                    continue
+                            if cache is not None:
+                                cache.store(statres, record["chunks"])
+                            stored_bytes += stored
+                            file_count += 1
+                        else:
+                            continue
+                        snapshot.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8", "surrogateescape"))
+                        index.append((record["path"], CAS_TYPES[record["type"]], record["mode"],
+                                      record.get("size", 0), record["mtime"], -1, None))
+                store.register_snapshot(self.archivefullpath)
+            self.write_index(index)
+
+        except OSError as err:
+            match err.errno:
+                case errno.ENOSPC:
+                    printError("No space on disk")
+                case errno.EACCES:
+                    printError(f"Permission denied: {err.filename or self.archivefullpath}")
+                case _:
+                    printError(f"OSError: {err.strerror} ({err.filename or self.archivefullpath})")
+            sys.exit(err.errno or 99)
+        finally:
+            if cache is not None:
+                cache.close()
+
+        self.store_hash(output)
+        if cache is not None:
+            printLog(f"Unchanged files (file state cache): {cache.hits}")
+        printLog(f"{file_count} files, new data in chunk store: {sizeof_fmt(stored_bytes)}")
+        printOK(f"Done [{sizeof_fmt(os.path.getsize(self.archivefullpath))}]")
+
+    @staticmethod
+    def _store_file_chunks(store, path, stats=None):
+        chunk_ids, stored_bytes = [], 0
+        with open(path, "rb") as f:
+            for chunk in store.iter_chunks(f if stats is None else Timedreader(f, stats)):
+                chunk_id, stored = store.put(chunk)
+                chunk_ids.append(chunk_id)
+                stored_bytes += stored
+        return chunk_ids, stored_bytes
+
 
 class Backupy:
     """ Backupy class """
     debug = False
+    log_prefix = ""    # backup set name when running with --jobs
+    profile_dir = None    # --profile: tasks run one by one under cProfile / tracemalloc
+    progress_interval = None    # --progress: seconds between progress lines of a running task
     simple_line = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
     double_line = "==========================================================="
 
@@ -612,22 +3445,79 @@ class Backupy:
         self.path_default_config_file = os.path.join(self.path_default_configdir, 'default.toml')
         self.backupset_list = []
         self.path_config_files = []
+        self.jobs = 1
+        self.path_stats_file = None
 
         argparser = argparse.ArgumentParser(prog='backupy')
         argparser.add_argument('--manual', action='store_true', help='show backupy short manual')
         argparser.add_argument('--debug', action='store_true', help='run backupy in debug mode')
         argparser.add_argument('--validate', action='store_true', help='validate config files only, do not execute')
         argparser.add_argument('-s', '--backupsets', nargs='+', help='list of (backupset) config file pathes')
+        argparser.add_argument('-j', '--jobs', type=int, default=1, metavar='N',
+                               help='execute up to N backup sets in parallel processes (default: 1)')
+        argparser.add_argument('--stats', metavar='FILE',
+                               help='write per-task counters and phase times to FILE (JSON)')
+        argparser.add_argument('--progress', metavar='SECONDS', nargs='?', type=float, const=1.0,
+                               help='log the progress of running tasks every SECONDS (default: 1), '
+                                    'key=value lines if the output is not a terminal')
+        argparser.add_argument('--log-json', metavar='FILE',
+                               help='append every log line to FILE as a JSON record (JSON lines)')
+        argparser.add_argument('--profile', metavar='DIR',
+                               help='profile every task (cProfile, tracemalloc) into DIR, tasks run one by one')
+
+        argparser.add_argument('--restore', metavar='ARCHIVE', help="restore an archive or a 'cas' snapshot (use with --to)")
+        argparser.add_argument('--to', metavar='DIR', help='target directory of --restore')
+        argparser.add_argument('--path', metavar='PATTERN', action='append',
+                               help='--restore / --list only these members or directories (fnmatch pattern, repeatable)')
+        argparser.add_argument('--gc', metavar='DIR', help="remove unreferenced chunks of a 'cas' chunk store (or its result dir)")
+        argparser.add_argument('--prune', action='store_true',
+                               help="with --gc: forget registered snapshots that no longer exist, releasing their chunks")
+        argparser.add_argument('--list', metavar='ARCHIVE', help="list the content of an archive (from its .idx index)")
 
         args = argparser.parse_args(pargs)
         self.path_config_files = args.backupsets
         self.validate = args.validate
+        self.jobs = args.jobs
+        if self.jobs < 1:
+            argparser.error("--jobs must be at least 1")
         Backupy.debug = args.debug
+        logger.level = Logger.DEBUG if args.debug else Logger.INFO
+        self.path_stats_file = args.stats
+        if args.log_json:
+            try:
+                logger.open_json(args.log_json)
+            except OSError as err:
+                argparser.error(f"cannot open --log-json file: {err.strerror} ({args.log_json})")
+        if args.progress is not None:
+            if args.progress <= 0:
+                argparser.error("--progress must be a positive number of seconds")
+            Backupy.progress_interval = args.progress
+        if args.profile:
+            if not create_dir(args.profile):
+                sys.exit(1)
+            Backupy.profile_dir = os.path.abspath(args.profile)
 
         if args.manual:
             self.show_manual()
             sys.exit(0)
 
+        if args.gc:
+            self.cas_gc(args.gc, args.prune)
+            sys.exit(0)
+
+        if args.list:
+            self.list_archive(args.list, args.path)
+            sys.exit(0)
+
+        if args.restore:
+            if not args.to:
+                argparser.error("--restore requires --to DIR")
+            if args.restore.endswith(".cas"):
+                self.cas_restore(args.restore, args.to, args.path)
+            else:
+                self.restore_archive(args.restore, args.to, args.path)
+            sys.exit(0)
+
         printLog("backupy v" + __version__ + " starting")
         if Backupy.debug:
             printWarning("DEBUG MODE")
@@ -658,6 +3548,24 @@ Start methods
                                        # starts with 3 config files for 3 different backup sets
    ./backupy.py --validate -s /foo/mybackup.toml /bar/second.toml
                                        # only validates config files, doesn't execute backup sets
+   ./backupy.py -j 4 -s /foo/my.toml /bar/second.toml /boo/third.toml
+                                       # executes up to 4 backup sets in parallel processes
+   ./backupy.py --stats /tmp/stats.json -s /foo/my.toml
+                                       # writes files, bytes, skipped files (by reason) and phase times per task
+   ./backupy.py --progress 10 -s /foo/my.toml
+                                       # logs the progress of running tasks every 10 seconds (ETA if the size is known)
+   ./backupy.py --log-json /var/log/backupy.jsonl -s /foo/my.toml
+                                       # appends every log line as a JSON record (time, level, set, task, message)
+   ./backupy.py --profile /tmp/prof -s /foo/my.toml
+                                       # profiles every task (one by one): <set>-<task>.prof (pstats) and .txt
+   ./backupy.py --restore /bar/docs_2026-01-01_1200.tar.gz --to /tmp/restore
+                                       # restores an archive or a 'cas' snapshot (.cas)
+   ./backupy.py --restore /bar/docs_2026-01-01_1200.tar --path "docs/novels" --path "*.odt" --to /tmp/restore
+                                       # restores only matching members / directories
+   ./backupy.py --gc /bar               # removes unreferenced chunks of the 'cas' chunk store in /bar
+   ./backupy.py --gc /bar --prune       # also forgets deleted snapshots (a snapshot not found keeps its chunks)
+   ./backupy.py --list /bar/docs_2026-01-01_1200.tar.gz
+                                       # lists an archive's content from its index (<archive>.idx)
    ./backupy.py --manual               # this short manual
 
 Summary:
@@ -670,6 +3578,13 @@ Example config file (TOML format)
    name = "My backup set"               # name of the backup set
    description = "For relaxed days :)"   # free text description
    enabled = true                        # is this backup set enabled
+   workers = 1                           # optional: parallel task workers (0: usable CPU count)
+                                         #   tasks sharing a source/target device always run in sequence
+   fanout = false                        # optional: tasks with the same include_dirs (and followsym) read
+                                         #   every file once, feeding all their archives (not cas/incremental)
+                                         #   these tasks run at the same time, on their own threads (also with workers = 1)
+   filestate_cache = false               # optional: remember file states between runs
+                                         #   (~/.config/backupy/filestate.sqlite): cas skips unchanged files
 
    [global_excludes]
    endings = ["~", ".swp"]               # globally excluded file extensions
@@ -682,11 +3597,27 @@ Example config file (TOML format)
    create_target_date_dir = true         # creates YYYY-MM-DD subdir in result_dir
    archive_name = "document_backup"      # archive file name without extension
    result_dir = "/home/joe/backup"       # where to create the archive file
-   method = "targz"                      # compression method: tar, targz, tarbz2, tarxz, zip
+   method = "targz"                      # compression method: tar, targz, targz-seekable, tarbz2, tarxz, tarzst, zip, cas
+                                         #   targz-seekable: gzip in independent blocks, fast --list / --restore
+                                         #   tarzst: python 3.14+ (compression.zstd)
+                                         #   cas: deduplicated chunk store in <result_dir>/backupy-cas,
+                                         #        every run writes a small .cas snapshot object
    followsym = true                      # should compressor follow symlinks
    withpath = false                      # compress files with or without full path
    skip_if_permission_fail = false       # skip task if file(s) are unreadable
    skip_if_directory_nonexistent = false  # skip task if include_dirs don't exist
+   hash_algorithm = "md5"                # optional: md5, sha256, blake2b  →  <hash_algorithm>.sum
+   threads = 1                           # optional: compression threads for targz(-seekable), tarbz2, tarxz, tarzst, zip (0: auto)
+   seek_block_size = 4                   # optional: targz-seekable block size in MiB
+   on_insufficient_space = "warn"        # optional: warn, skip or fail if the estimated archive size exceeds
+                                         #   the free space (estimate improves from run to run: backupy-estimate.json)
+   compression_level = 6                 # optional: gz: 0-9, bz2: 1-9, xz: 0-9, zst: zstd levels, zip: 0-9 (0: store only)
+                                         #   (default: method's default)
+                                         #   zip stores already compressed files (by extension or a deflated sample)
+   incremental = false                   # optional: archive only new/changed files since the previous run
+                                         #   state is kept in <result_dir>/<archive_name>.snapshot,
+                                         #   deleted files are listed in <archive>.deleted
+   full_every = 7                        # optional: with incremental, every Nth run is a full backup (0: never)
    include_dirs = ["/home/joe/humour", "/home/joe/novels"]  # at least one mandatory
    exclude_dir_names = ["garbage", "temp"]
    exclude_dir_fullpaths = ["/home/joe/humour/saskabare"]
@@ -694,6 +3625,7 @@ Example config file (TOML format)
    exclude_files = ["abc.log", "Thumbs.db"]
 
 Tips:
+   - The same warning (e.g. 'Skip file (permission error)') is logged 100 times per task, the rest is counted
    - Set 'enabled = true' for backup sets and tasks you want active
    - Comments with '#' are supported natively in TOML
    - 'exclude_endings' special case: '~' excludes files like 'myfile.doc~'
@@ -703,10 +3635,80 @@ Tips:
             printWarning("You did not run backupy init yet.")
             printWarning("Just run ./backupy.py and let it create default config for you.\n")
 
+    @staticmethod
+    def cas_gc(path, prune=False):
+        store = Chunkstore.find(path)
+        if not os.path.isdir(store.chunks_dir):
+            printError(f"No chunk store found: {path}")
+            sys.exit(1)
+        printLog(f"Garbage collection in chunk store: {store.path}")
+        try:
+            removed, freed, missing = store.gc(prune)
+        except BlockingIOError:
+            printError(f"The chunk store is in use by a running backup: {store.path}")
+            sys.exit(1)
+        if missing and not prune:
+            printError("Registered snapshots not found (deleted, or moved without the chunk store):")
+            printWarning(missing)
+            printError("Nothing is removed. Run with --prune to forget them and release their chunks.")
+            sys.exit(1)
+        if missing:
+            printLog(f"Forgotten snapshots (not found): {len(missing)}")
+        printOK(f"Removed {removed} unreferenced chunks, freed {sizeof_fmt(freed)}")
+
+    @staticmethod
+    def cas_restore(snapshot_path, target_dir, patterns=None):
+        try:
+            header = next(iter_cas_snapshot(snapshot_path))
+        except (OSError, ValueError, StopIteration) as err:
+            printError(f"Not a 'cas' snapshot: {snapshot_path} ({err})")
+            sys.exit(1)
+        # the store is next to the snapshot (or its date dir) if the whole result dir was moved
+        candidates = [header.get("store", ""), os.path.join(os.path.dirname(snapshot_path), "backupy-cas"),
+                      os.path.join(os.path.dirname(os.path.dirname(snapshot_path)), "backupy-cas")]
+        store = next((Chunkstore(path) for path in candidates if os.path.isdir(os.path.join(path, "chunks"))), None)
+        if store is None:
+            printError(f"Chunk store of the snapshot not found: {header.get('store')}")
+            sys.exit(1)
+        printLog(f"Restoring {snapshot_path} to {target_dir}")
+        restored = store.restore(snapshot_path, target_dir, patterns)
+        printOK(f"Restored {restored} entries")
+
+    @staticmethod
+    def restore_archive(archive_path, target_dir, patterns=None):
+        if not os.path.isfile(archive_path):
+            printError(f"Archive not found: {archive_path}")
+            sys.exit(1)
+        printLog(f"Restoring {archive_path} to {target_dir}")
+        try:
+            restored = Archiverestorer(archive_path, patterns).restore(target_dir)
+        except (tarfile.TarError, zipfile.BadZipFile, EOFError) as err:
+            printError(f"Cannot read archive: {archive_path} ({err or 'unexpected end of data'})")
+            sys.exit(1)
+        except OSError as err:
+            printError(f"OSError: {err.strerror} ({err.filename or target_dir})")
+            sys.exit(err.errno or 99)
+        if not restored:
+            printWarning("No archive member matched")
+        printOK(f"Restored {restored} entries")
+
+    @staticmethod
+    def list_archive(archive_path, patterns=None):
+        index_path = archive_path if archive_path.endswith(".idx") else f"{archive_path}.idx"
+        try:
+            index = Archiveindex(index_path)
+        except FileNotFoundError:
+            printError(f"Archive index not found: {index_path}")
+            sys.exit(1)
+        except (OSError, ValueError) as err:
+            printError(f"Cannot read archive index: {index_path} ({err})")
+            sys.exit(1)
+        with index:
+            for entry in index.select(patterns):
+                print(Archiveindex.format_entry(entry))
+
     def print_elapsed_time(self):
-        hours, rem = divmod(time.time() - self.start_time, 3600)
-        minutes, seconds = divmod(rem, 60)
-        printLog(f"Elapsed time: {int(hours):0>2}:{int(minutes):0>2}:{seconds:02.0f}", 1)
+        printLog(f"Elapsed time: {format_elapsed(time.time() - self.start_time)}", 1)
 
     def create_config_file(self):
         template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'default.toml')
@@ -742,18 +3744,92 @@ Tips:
             sys.exit(0)
 
     def execute_backupsets(self):
-        for backupset in self.backupset_list:
-            printLog(Backupy.double_line, 2)
-            printLog(f"{Colors.colorblue}Executing backup set: {backupset.name}{Colors.colorreset} ")
-            printLog(Backupy.double_line)
-            backupset.execute()
+        """ Executes backup sets (in parallel processes with --jobs), returns the combined exit code """
+        if self.jobs > 1 and len(self.backupset_list) > 1:
+            printLog(f"Executing {len(self.backupset_list)} backup sets in up to {self.jobs} parallel processes")
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(self.jobs, len(self.backupset_list))) as pool:
+                futures = [pool.submit(execute_backupset_process, backupset, Backupy.debug, Backupy.profile_dir,
+                                       Backupy.progress_interval, logger.json_path)
+                           for backupset in self.backupset_list]
+                reports = [future.result() for future in futures]
+        else:
+            reports = [run_backupset(backupset) for backupset in self.backupset_list]
+        self.print_backupset_report(reports)
         self.print_elapsed_time()
-        printOK("backupy finished")
+        if self.path_stats_file:
+            self.write_stats(reports)
+        exit_code = next((code for code, _, _ in reports if code), 0)
+        if exit_code:
+            printError("backupy finished with errors")
+        else:
+            printOK("backupy finished")
+        return exit_code
+
+    def print_backupset_report(self, reports):
+        printLog(Backupy.double_line, 1)
+        printLog("Backup set report:")
+        for backupset, (code, elapsed, _) in zip(self.backupset_list, reports):
+            status = "OK" if code == 0 else f"FAILED ({code})"
+            printLog(f"  {status:<12} {format_elapsed(elapsed)}  {backupset.name}")
+
+    def write_stats(self, reports):
+        """ --stats FILE: task counters and phase times of every backup set as JSON """
+        stats = {"backupy_stats": 1, "version": __version__, "created": datetime.datetime.now().isoformat(),
+                 "elapsed": round(time.time() - self.start_time, 6), "backup_sets": []}
+        for backupset, (code, elapsed, results) in zip(self.backupset_list, reports):
+            stats["backup_sets"].append({
+                "name": backupset.name, "config_file": backupset.config_file, "exit_code": code,
+                "elapsed": round(elapsed, 6),
+                "tasks": [{"name": result.name, "status": result.status, "elapsed": round(result.elapsed, 6),
+                           "size": result.size, **result.stats} for result in results]})
+        try:
+            with open(self.path_stats_file, "w") as f:
+                json.dump(stats, f, indent=2)
+                f.write("\n")
+        except OSError as err:
+            printError(f"Cannot write stats file: {err.strerror} ({self.path_stats_file})")
+            return
+        printLog(f"Stats: {self.path_stats_file}")
+
+
+def execute_backupset(backupset):
+    printLog(Backupy.double_line, 2)
+    printLog(f"{Colors.colorblue}Executing backup set: {backupset.name}{Colors.colorreset} ")
+    printLog(Backupy.double_line)
+    backupset.execute()
+
+
+def run_backupset(backupset):
+    """ Returns (exit code, elapsed seconds, Taskresults): a failing set does not stop the others """
+    start = time.time()
+    try:
+        execute_backupset(backupset)
+        code = 0
+    except SystemExit as err:
+        code = err.code if isinstance(err.code, int) else 1
+    logger.summarize()
+    return code, time.time() - start, backupset.results
+
+
+def execute_backupset_process(backupset, debug, profile_dir=None, progress_interval=None, log_json=None):
+    """ --jobs worker (child process): returns (exit code, elapsed seconds, Taskresults) """
+    Backupy.debug = debug
+    Backupy.profile_dir = profile_dir
+    Backupy.progress_interval = progress_interval
+    logger.level = Logger.DEBUG if debug else Logger.INFO
+    if log_json:
+        logger.open_json(log_json)    # spawned workers don't inherit the open file
+    Backupy.log_prefix = f"[{backupset.name}] "
+    if hasattr(sys.stdout, "reconfigure"):
+        sys.stdout.reconfigure(line_buffering=True)    # stream log lines, don't hold them until exit
+    report = run_backupset(backupset)
+    logger.flush(stdout=True)    # pool workers don't run atexit handlers
+    return report
 
 
 def main(args):
     backupy = Backupy(args)
-    backupy.execute_backupsets()
+    return backupy.execute_backupsets()
 
 
 if __name__ == '__main__':
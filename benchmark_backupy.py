@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    benchmark_backupy: performance measurement of backupy on synthetic source trees
+
+    Profiles (reproducible: fixed random seed, sizes scaled by --scale):
+
+    * tiny: many small files
+    * huge: a few large files (half text, half random data)
+    * deep: deeply nested directories
+    * excluded: most entries hit the exclude lists of the task
+    * symlinks: symlink farm (links to files and dirs, some of them broken)
+
+    Phases, each in a fresh process (peak RSS belongs to the phase):
+
+    * scan: Scanplan walk of the tree, no exclusions
+    * exclude: Backuptask._is_excluded on every scanned path
+    * <method>: the archiver of a method (compress_tar / compress_zip / compress_cas),
+      after the pre-flight checks
+    * hash: md5 / sha256 / blake2b of the tar archive (what Hashingwriter adds to writing)
+
+    Results go to stdout or --output as JSON: seconds, files/s, MB/s and peak RSS
+    of every phase. --compare BASELINE.json reports the phases that got slower.
+"""
+
+import os
+import sys
+import stat
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import datetime
+import platform
+import tempfile
+import contextlib
+import multiprocessing
+import concurrent.futures
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import backupy
+
+BENCHMARK_VERSION = 2    # 2: text corpus of 4096 distinct words (results not comparable to 1)
+SEED = 20260101
+
+
+def make_words(rng, count=4096):
+    """ Vocabulary of text_data: count random lowercase words of 2-10 letters """
+    return [bytes(rng.choices(b"abcdefghijklmnopqrstuvwxyz", k=rng.randrange(2, 11))) for _ in range(count)]
+
+
+WORDS = make_words(random.Random(SEED))
+DEFAULT_METHODS = ["tar", "targz", "tarzst", "zip"]
+HASH_ALGORITHMS = ("md5", "sha256", "blake2b")
+EXCLUDES = {"exclude_dir_names": ["node_modules", "cache"], "exclude_endings": [".tmp", ".o"],
+            "exclude_files": ["Thumbs.db"]}
+
+
+def text_data(rng, size):
+    """ Word soup: compresses like source code / documents """
+    out = bytearray()
+    while len(out) < size:
+        out += b" ".join(rng.choices(WORDS, k=512)) + b"\n"
+    return bytes(out[:size])
+
+
+def write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_tiny(path, rng, scale):
+    count = max(10, int(20000 * scale))
+    for i in range(count):
+        subdir = os.path.join(path, f"d{i // 100:04d}")
+        if i % 100 == 0:
+            os.makedirs(subdir)
+        size = rng.randrange(4097)
+        write_file(os.path.join(subdir, f"f{i:06d}.txt"), text_data(rng, size) if i % 4 else rng.randbytes(size))
+
+
+def make_huge(path, rng, scale):
+    size = max(2 ** 20, int(64 * 2 ** 20 * scale))
+    os.makedirs(path)
+    for i in range(4):
+        with open(os.path.join(path, f"huge{i}.{'txt' if i % 2 else 'bin'}"), "wb") as f:
+            for offset in range(0, size, 2 ** 20):
+                block = min(2 ** 20, size - offset)
+                f.write(text_data(rng, block) if i % 2 else rng.randbytes(block))
+
+
+def make_deep(path, rng, scale):
+    depth = max(10, int(100 * scale))
+    current = path
+    for level in range(depth):
+        current = os.path.join(current, f"level{level:03d}")
+        os.makedirs(os.path.join(current, "side"))
+        for i in range(5):
+            write_file(os.path.join(current, f"f{i}.txt"), text_data(rng, rng.randrange(2048)))
+        write_file(os.path.join(current, "side", "s.txt"), text_data(rng, 256))
+
+
+def make_excluded(path, rng, scale):
+    """ 70% of the files hit EXCLUDES: in excluded dirs (40%), by ending (30%) """
+    count = max(10, int(10000 * scale))
+    for i in range(count):
+        kind = i % 10
+        subdir = os.path.join(path, f"p{i // 200:03d}", ("node_modules", "cache", "src")[min(kind // 2, 2)])
+        os.makedirs(subdir, exist_ok=True)
+        name = f"f{i:06d}" + {4: ".tmp", 5: ".o", 6: ".tmp"}.get(kind, ".txt")
+        if i % 200 == 6:
+            name = "Thumbs.db"
+        write_file(os.path.join(subdir, name), text_data(rng, rng.randrange(1024)))
+
+
+def make_symlinks(path, rng, scale):
+    targets = os.path.join(path, "targets")
+    farm = os.path.join(path, "farm")
+    os.makedirs(os.path.join(targets, "dir"))
+    os.makedirs(farm)
+    for i in range(100):
+        write_file(os.path.join(targets, f"t{i:03d}.txt"), text_data(rng, rng.randrange(4096)))
+    for i in range(10):
+        write_file(os.path.join(targets, "dir", f"d{i}.txt"), text_data(rng, 512))
+    for i in range(max(10, int(5000 * scale))):
+        link = os.path.join(farm, f"l{i:05d}")
+        if i % 20 == 0:
+            os.symlink("../targets/missing", link)    # broken
+        elif i % 50 == 1:
+            os.symlink("../targets/dir", link)
+        else:
+            os.symlink(f"../targets/t{rng.randrange(100):03d}.txt", link)
+
+
+PROFILES = {
+    "tiny": make_tiny,
+    "huge": make_huge,
+    "deep": make_deep,
+    "excluded": make_excluded,
+    "symlinks": make_symlinks,
+}
+
+
+def generate_tree(path, profile, scale, seed=SEED):
+    """ Builds the source tree of a profile below path (same seed and scale: same tree) """
+    PROFILES[profile](path, random.Random(f"{seed}-{profile}"), scale)
+
+
+def toml_list(items):
+    return "[" + ", ".join(f'"{item}"' for item in items) + "]"
+
+
+def write_config(workdir, src, method, threads):
+    """ A one-task backup set of src, returns its path """
+    config = os.path.join(workdir, f"{method}.toml")
+    with open(config, "w") as f:
+        f.write(f'''[meta]
+name = "benchmark {method}"
+enabled = true
+
+[[backup]]
+name = "benchmark"
+enabled = true
+archive_name = "bench"
+result_dir = "{os.path.join(workdir, method)}"
+create_target_date_dir = false
+method = "{method}"
+followsym = false
+withpath = false
+threads = {threads}
+on_insufficient_space = "warn"
+skip_if_permission_fail = false
+skip_if_directory_nonexistent = false
+include_dirs = ["{src}"]
+exclude_dir_names = {toml_list(EXCLUDES["exclude_dir_names"])}
+exclude_dir_fullpaths = []
+exclude_endings = {toml_list(EXCLUDES["exclude_endings"])}
+exclude_files = {toml_list(EXCLUDES["exclude_files"])}
+''')
+    return config
+
+
+def peak_rss_kib():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _load_task(config):
+    return backupy.Backupset(config).task_list[0]
+
+
+def _source_stats(plan):
+    files = size = 0
+    for _, _, statres in plan:
+        if stat.S_ISREG(statres.st_mode):
+            files += 1
+            size += statres.st_size
+    return files, size
+
+
+def phase_scan(src, config):
+    start = time.perf_counter()
+    plan = backupy.Scanplan([src], False).build(lambda path, i: False, lambda path, i: False)
+    seconds = time.perf_counter() - start
+    files, size = _source_stats(plan)
+    result = {"seconds": seconds, "entries": len(plan), "files": files, "bytes": size}
+    plan.close()
+    return result
+
+
+def phase_exclude(src, config):
+    task = _load_task(config)
+    plan = backupy.Scanplan([src], False).build(lambda path, i: False, lambda path, i: False)
+    root = os.path.dirname(src)
+    paths = [path for _, path, _ in plan]
+    plan.close()
+    start = time.perf_counter()
+    excluded = sum(task._is_excluded(path, root) for path in paths)
+    return {"seconds": time.perf_counter() - start, "entries": len(paths), "excluded": excluded}
+
+
+def phase_method(src, config):
+    task = _load_task(config)
+    if not task.compress_pre():
+        raise RuntimeError(f"pre-flight checks failed: {config}")
+    files, size = _source_stats(task.plan)
+    start = time.perf_counter()
+    try:
+        match task.method:
+            case "zip":
+                task.compress_zip()
+            case "cas":
+                task.compress_cas()
+            case _:
+                task.compress_tar()
+    finally:
+        task.plan.close()
+    return {"seconds": time.perf_counter() - start, "files": files, "bytes": size,
+            "archive_bytes": os.path.getsize(task.archivefullpath), "archive": task.archivefullpath}
+
+
+def phase_hash(archive, config):
+    results = {}
+    for algorithm in HASH_ALGORITHMS:
+        digest = hashlib.new(algorithm)
+        start = time.perf_counter()
+        with open(archive, "rb") as f:
+            while block := f.read(2 ** 20):
+                digest.update(block)
+        results[algorithm] = {"seconds": time.perf_counter() - start, "bytes": os.path.getsize(archive)}
+    return results
+
+
+PHASES = {"scan": phase_scan, "exclude": phase_exclude, "method": phase_method, "hash": phase_hash}
+
+
+def run_phase(phase, path, config):
+    """ Runs a phase in this process (backupy's log output is dropped), adds the peak RSS """
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = PHASES[phase](path, config)
+    result["peak_rss_kib"] = peak_rss_kib()
+    return result
+
+
+def run_phase_isolated(phase, path, config):
+    """ run_phase in a fresh process: the peak RSS is the phase's own """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_phase, phase, path, config).result()
+
+
+def add_rates(result):
+    seconds = max(result["seconds"], 1e-9)
+    if "files" in result or "entries" in result:
+        result["files_per_s"] = round(result.get("files", result.get("entries")) / seconds, 1)
+    if "bytes" in result:
+        result["mb_per_s"] = round(result["bytes"] / 2 ** 20 / seconds, 2)
+    result["seconds"] = round(result["seconds"], 4)
+    return result
+
+
+def benchmark_profile(workdir, profile, scale, methods, threads, isolated=True):
+    run = run_phase_isolated if isolated else run_phase
+    src = os.path.join(workdir, "src")
+    start = time.perf_counter()
+    generate_tree(src, profile, scale)
+    report = {"generate_seconds": round(time.perf_counter() - start, 4), "phases": {}}
+    config = write_config(workdir, src, methods[0] if methods else "tar", threads)
+    phases = report["phases"]
+    phases["scan"] = add_rates(run("scan", src, config))
+    report.update(entries=phases["scan"]["entries"], files=phases["scan"]["files"], bytes=phases["scan"]["bytes"])
+    phases["exclude"] = add_rates(run("exclude", src, config))
+    tar_archive = None
+    for method in methods:
+        result = run("method", src, write_config(workdir, src, method, threads))
+        archive = result.pop("archive")
+        if method == "tar":
+            tar_archive = archive
+        phases[method] = add_rates(result)
+    if tar_archive is not None:
+        hashes = run("hash", tar_archive, config)
+        peak = hashes.pop("peak_rss_kib")
+        phases["hash"] = {algorithm: add_rates(dict(result, peak_rss_kib=peak)) for algorithm, result in hashes.items()}
+    return report
+
+
+def run_benchmark(profiles, scale, methods, threads, root=None, keep=False, isolated=True):
+    """ Returns the JSON-ready report of every profile """
+    report = {
+        "backupy_benchmark": BENCHMARK_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scale": scale,
+        "seed": SEED,
+        "threads": threads,
+        "methods": methods,
+        "profiles": {},
+    }
+    for profile in profiles:
+        workdir = tempfile.mkdtemp(prefix=f"backupy-bench-{profile}-", dir=root)
+        try:
+            print(f"{profile}...", file=sys.stderr, flush=True)
+            report["profiles"][profile] = benchmark_profile(workdir, profile, scale, methods, threads, isolated)
+        finally:
+            if keep:
+                print(f"Kept: {workdir}", file=sys.stderr)
+            else:
+                shutil.rmtree(workdir)
+    return report
+
+
+def compare(report, baseline, tolerance):
+    """ Phases slower than baseline by more than tolerance (0.1: 10%): [(profile, phase, old s, new s)] """
+    slower = []
+    for profile, result in report["profiles"].items():
+        old_phases = baseline.get("profiles", {}).get(profile, {}).get("phases", {})
+        for phase, new in result["phases"].items():
+            old = old_phases.get(phase)
+            if old is None:
+                continue
+            pairs = [(phase, old, new)] if "seconds" in new else \
+                [(f"{phase}.{name}", old.get(name), new[name]) for name in new]
+            for name, old_result, new_result in pairs:
+                if old_result and new_result["seconds"] > old_result["seconds"] * (1 + tolerance):
+                    slower.append((profile, name, old_result["seconds"], new_result["seconds"]))
+    return slower
+
+
+def main(argv=None):
+    argparser = argparse.ArgumentParser(prog="benchmark_backupy",
+                                        description="Performance measurement of backupy on synthetic source trees")
+    argparser.add_argument("--profile", action="append", choices=sorted(PROFILES), dest="profiles",
+                           help="source tree profile (repeatable, default: all)")
+    argparser.add_argument("--method", action="append", dest="methods",
+                           help=f"archive method (repeatable, default: {', '.join(DEFAULT_METHODS)})")
+    argparser.add_argument("--scale", type=float, default=1.0, help="tree size factor (default: 1.0)")
+    argparser.add_argument("--threads", type=int, default=1, help="'threads' of the backup task (default: 1)")
+    argparser.add_argument("--root", help="work dir of the generated trees (default: system temp dir)")
+    argparser.add_argument("--keep", action="store_true", help="keep the generated trees and archives")
+    argparser.add_argument("--in-process", action="store_true",
+                           help="run the phases in this process (faster, peak RSS is cumulative)")
+    argparser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    argparser.add_argument("--compare", metavar="BASELINE", help="JSON report of a previous run")
+    argparser.add_argument("--tolerance", type=float, default=0.1,
+                           help="with --compare: allowed slowdown (default: 0.1 = 10%%)")
+    args = argparser.parse_args(argv)
+
+    methods = args.methods or [m for m in DEFAULT_METHODS if m != "tarzst" or backupy.zstd is not None]
+    report = run_benchmark(args.profiles or list(PROFILES), args.scale, methods, args.threads,
+                           args.root, args.keep, not args.in_process)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            slower = compare(report, json.load(f), args.tolerance)
+        for profile, phase, old, new in slower:
+            print(f"SLOWER: {profile} {phase}: {old:.4f}s -> {new:.4f}s", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
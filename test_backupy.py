@@ -4,26 +4,62 @@
 # Execute manually:
 # python3 -m unittest test_backupy -v
 
+import io
 import os
 import sys
+import bz2
+import gzip
+import lzma
+import zlib
+import errno
+import random
+import time
 import shutil
+import hashlib
+import json
+import contextlib
 import tarfile
 import zipfile
 import tempfile
+import threading
 import unittest
+import unittest.mock
 
 sys.path.insert(0, os.path.dirname(__file__))
+import backupy
+import benchmark_backupy
 from backupy import (
     strip_dash_string_end,
     strip_enddash_on_list,
     add_dot_for_endings,
     getsub_dir_path,
     sizeof_fmt,
+    available_cpu_count,
     filter_nonexistent_include_dirs,
     Backupset,
+    BackupyTarfile,
+    Parallelcompressor,
+    Chunkstore,
+    Filestatecache,
+    Sizeestimator,
+    Scanplan,
+    readable_by_mode,
+    Archiveindex,
+    Archiverestorer,
+    Seekablegzipreader,
+    match_restore_path,
+    iter_cas_snapshot,
     Backuptask,
+    Backupy,
+    Taskstats,
+    Progressmeter,
+    Logger,
+    Hashingwriter,
     Configglobal,
+    execute_backupset_process,
+    Excludematcher,
 )
+from pathlib import Path
 
 
 class TestStripDashStringEnd(unittest.TestCase):
@@ -406,6 +442,7 @@ class TestIsExcluded(unittest.TestCase):
         task._all_endings = tuple(g.exclude_endings + task.exclude_endings)
         task._all_files = g.exclude_files + task.exclude_files
         task.configs_global = g
+        task.compile_excludes()
         return task
 
     # --- ending exclusions ---
@@ -488,33 +525,64 @@ class TestIsExcluded(unittest.TestCase):
         self.assertFalse(task._is_excluded("/path/good.txt", "/path"))
 
 
-class TestFilterTar(unittest.TestCase):
-    """Tests for Backuptask.filter_tar (tarfile callback adapter)."""
-
-    def _make_task(self, **kwargs):
-        return TestIsExcluded._make_task(self, **kwargs)
-
-    def _make_tarinfo(self, name):
-        info = tarfile.TarInfo(name=name)
-        return info
-
-    def test_returns_tarinfo_when_not_excluded(self):
-        task = self._make_task()
-        info = self._make_tarinfo("src/main.py")
-        result = task.filter_tar(info, "/project")
-        self.assertIs(result, info)
-
-    def test_returns_none_when_excluded(self):
-        task = self._make_task(global_endings=[".swp"])
-        info = self._make_tarinfo("src/editor.swp")
-        result = task.filter_tar(info, "/project")
-        self.assertIsNone(result)
-
-    def test_dir_name_filter_in_tar(self):
-        task = self._make_task(global_dirs=["__pycache__"])
-        info = self._make_tarinfo("src/__pycache__/module.pyc")
-        result = task.filter_tar(info, "/project")
-        self.assertIsNone(result)
+def legacy_is_excluded(task, filenamefull, root_dir):
+    """Reference: Backuptask._is_excluded as it was before Excludematcher."""
+    if task._all_endings and filenamefull.endswith(task._all_endings):
+        return True
+    if Path(filenamefull).name in task._all_files:
+        return True
+    parts = getsub_dir_path(root_dir, filenamefull).split("/")
+    if any(d in parts for d in task.configs_global.exclude_dir_names):
+        return True
+    if any(d in parts[1:] for d in task.exclude_dir_names):
+        return True
+    if any(dirname in filenamefull for dirname in task.exclude_dir_fullpath):
+        return True
+    return False
+
+
+class TestExcludematcher(unittest.TestCase):
+    """Excludematcher must give the same answers as the legacy per-file checks."""
+
+    def test_same_answers_as_legacy(self):
+        task = TestIsExcluded._make_task(
+            self,
+            global_endings=["~", ".swp"], global_files=["Thumbs.db"], global_dirs=["node_modules", "src"],
+            task_endings=[".bak"], task_files=["notes.md"], task_dirs=["build", "project"],
+            task_fullpaths=["/project/vendor", "/project/src/gen/", "/other"])
+        names = ["main.py", "x.swp", "doc~", "Thumbs.db", "notes.md", "a.bak", "build", "vendor", "ok.txt"]
+        dirs = ["", "src", "build", "vendor", "vendor/lib", "src/gen", "src/generated", "node_modules/pkg",
+                "a/b/c", "docs/build/x", "project"]
+        roots = ["/", "/project", "/project/src", "/other", "/project/"]
+        checked = 0
+        for root in roots:
+            for d in dirs:
+                for name in names:
+                    path = os.path.join(strip_dash_string_end(root) or "/", d, name)
+                    self.assertEqual(task._is_excluded(path, root), legacy_is_excluded(task, path, root),
+                                     f"path={path!r} root={root!r}")
+                    checked += 1
+        self.assertEqual(checked, len(roots) * len(dirs) * len(names))
+
+    def test_fullpath_matches_whole_components_only(self):
+        matcher = Excludematcher([], [], [], [], ["/project/vendor"])
+        self.assertTrue(matcher.match("/project/vendor/lib.so", "/project"))
+        self.assertTrue(matcher.match("/project/vendor", "/project"))
+        self.assertIsNone(matcher.match("/project/vendorx/lib.so", "/project"))
+
+    def test_match_dir_ignores_file_rules(self):
+        matcher = Excludematcher([".bak"], ["cache"], ["node_modules"], ["build"], [])
+        self.assertIsNone(matcher.match_dir("/project/cache", "/project"))
+        self.assertIsNone(matcher.match_dir("/project/old.bak", "/project"))
+        self.assertTrue(matcher.match_dir("/project/node_modules", "/project"))
+        self.assertTrue(matcher.match_dir("/project/src/build", "/project"))
+        # task dir names are active only below the root
+        self.assertIsNone(matcher.match_dir("/build", "/build"))
+
+    def test_relative_root_raises(self):
+        matcher = Excludematcher([], [], ["x"], [], [])
+        with self.assertRaises(ValueError):
+            matcher.match("/a/b", "relative")
 
 
 class _CompressTestBase(unittest.TestCase):
@@ -635,6 +703,19 @@ class TestCompressTar(_CompressTestBase):
         # should contain full path (starts with tmp/)
         self.assertTrue(any("tmp/" in n for n in names))
 
+    def test_tar_withpath_dir_names_not_matched_above_include_dir(self):
+        open(os.path.join(self.src, "file.txt"), "w").close()
+        os.makedirs(os.path.join(self.src, "skip"))
+        open(os.path.join(self.src, "skip", "gone.txt"), "w").close()
+        ancestor = os.path.basename(self.tmpdir)    # a dir name above the include dir
+        for dirs in ("task_dirs", "global_dirs"):
+            with self.subTest(dirs=dirs):
+                shutil.rmtree(self.out)
+                self._run_backup(self._make_config(withpath="true", **{dirs: f'["{ancestor}", "skip"]'}))
+                names = self._get_tar_contents()
+                self.assertTrue(any(n.endswith("src/file.txt") for n in names))
+                self.assertFalse(any("gone.txt" in n for n in names))
+
     def test_tar_broken_symlink_skipped(self):
         open(os.path.join(self.src, "real.txt"), "w").close()
         os.symlink("/nonexistent_target", os.path.join(self.src, "broken"))
@@ -659,6 +740,1515 @@ class TestCompressTar(_CompressTestBase):
         self.assertIn("out_", content)
 
 
+class TestBackupyTarfileWalker(_CompressTestBase):
+    """Iterative scandir walker of BackupyTarfile.add."""
+
+    def test_tree_deeper_than_recursion_limit(self):
+        depth = 200
+        deep = self.src
+        for _ in range(depth):
+            deep = os.path.join(deep, "d")
+            os.mkdir(deep)
+        open(os.path.join(deep, "bottom.txt"), "w").close()
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(depth)    # a recursive walker would need more frames than this
+        try:
+            self._run_backup(self._make_config(method="tar"))
+        finally:
+            sys.setrecursionlimit(limit)
+        names = self._get_tar_contents()
+        self.assertTrue(any(n.endswith("/bottom.txt") for n in names))
+
+    def test_no_extra_stat_per_entry(self):
+        for i in range(20):
+            open(os.path.join(self.src, f"f{i}.txt"), "w").close()
+        archive = os.path.join(self.out, "walk.tar")
+        plan = Scanplan([self.src], False).build(lambda path, index: False, lambda path, index: False)
+        with unittest.mock.patch("os.lstat", wraps=os.lstat) as lstat, \
+                unittest.mock.patch("os.stat", wraps=os.stat) as stat_:
+            with BackupyTarfile.open(name=archive, mode="w") as tf:
+                tf.add_plan(plan, ["src"])
+        self.assertEqual(lstat.call_count + stat_.call_count, 0)    # stat results come from the plan
+        with tarfile.open(archive) as tf:
+            self.assertEqual(len(tf.getnames()), 21)
+
+    def test_tarinfo_matches_gettarinfo(self):
+        path = os.path.join(self.src, "file.txt")
+        with open(path, "w") as f:
+            f.write("hello")
+        os.symlink("file.txt", os.path.join(self.src, "link"))
+        with BackupyTarfile.open(name=os.path.join(self.out, "a.tar"), mode="w") as tf:
+            for name in ("file.txt", "link"):
+                full = os.path.join(self.src, name)
+                expected = tf.gettarinfo(full, name)
+                tf.inodes.clear()
+                got = tf.tarinfo_from_stat(full, name, os.lstat(full))
+                self.assertEqual(got.get_info(), expected.get_info())
+
+    def test_symlink_loop_skipped(self):
+        open(os.path.join(self.src, "file.txt"), "w").close()
+        os.symlink(self.src, os.path.join(self.src, "loop"))
+        self._run_backup(self._make_config(method="tar", followsym="true"))
+        names = self._get_tar_contents()
+        self.assertTrue(any(n.endswith("src/file.txt") for n in names))
+        self.assertFalse(any("loop" in n for n in names))
+
+
+class TestArchiveHash(_CompressTestBase):
+    """Archive hash is computed while writing, without reading the archive back."""
+
+    def _archive_digest(self, algorithm):
+        archive = [f for f in os.listdir(self.out) if f.startswith("out_") and not f.endswith(".idx")][0]
+        with open(os.path.join(self.out, archive), "rb") as f:
+            return hashlib.new(algorithm, f.read()).hexdigest(), archive
+
+    def _sum_row(self, algorithm):
+        with open(os.path.join(self.out, f"{algorithm}.sum")) as f:
+            return f.read().strip().split(";")
+
+    def test_tar_hash_matches_file(self):
+        with open(os.path.join(self.src, "file.txt"), "w") as f:
+            f.write("data" * 1000)
+        self._run_backup(self._make_config(method="tarxz"))
+        digest, archive = self._archive_digest("md5")
+        self.assertEqual(self._sum_row("md5"),
+                         [digest, str(os.path.getsize(os.path.join(self.out, archive))), archive])
+
+    def test_zip_hash_matches_file(self):
+        with open(os.path.join(self.src, "file.txt"), "w") as f:
+            f.write("data" * 1000)
+        self._run_backup(self._make_config(method="zip"))
+        digest, archive = self._archive_digest("md5")
+        self.assertEqual(self._sum_row("md5")[0], digest)
+        with zipfile.ZipFile(os.path.join(self.out, archive)) as zf:
+            self.assertIsNone(zf.testzip())
+
+    def test_archive_not_read_back(self):
+        open(os.path.join(self.src, "file.txt"), "w").close()
+        real_open = open
+        opened_for_read = []
+
+        def recording_open(file, mode="r", *args, **kwargs):
+            if "out_" in str(file) and "r" in mode:
+                opened_for_read.append(file)
+            return real_open(file, mode, *args, **kwargs)
+
+        with unittest.mock.patch("builtins.open", recording_open):
+            self._run_backup(self._make_config(method="targz"))
+        self.assertEqual(opened_for_read, [])
+
+    def test_sha256_and_blake2b(self):
+        open(os.path.join(self.src, "file.txt"), "w").close()
+        for algorithm in ("sha256", "blake2b"):
+            with self.subTest(algorithm=algorithm):
+                for f in os.listdir(self.out):
+                    os.remove(os.path.join(self.out, f))
+                cfg = self._make_config().replace('method = "targz"',
+                                                  f'method = "targz"\nhash_algorithm = "{algorithm}"')
+                self._run_backup(cfg)
+                digest, _ = self._archive_digest(algorithm)
+                self.assertEqual(self._sum_row(algorithm)[0], digest)
+
+    def test_invalid_hash_algorithm_exits(self):
+        cfg = self._make_config().replace('method = "targz"', 'method = "targz"\nhash_algorithm = "crc"')
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(cfg))
+
+
+class TestCopyFrom(TestArchiveHash):
+    """Plain tar and stored zip entries: content read into a reused buffer, hashed and written from it."""
+
+    def setUp(self):
+        super().setUp()
+        self.big = os.urandom(3 * Hashingwriter.COPY_FROM_SIZE + 1234)
+        with open(os.path.join(self.src, "image.jpg"), "wb") as f:
+            f.write(self.big)
+        with open(os.path.join(self.src, "small.txt"), "w") as f:
+            f.write("small" * 100)
+
+    def _check_archive(self, method):
+        digest, archive = self._archive_digest("md5")
+        self.assertEqual(self._sum_row("md5")[0], digest)
+        path = os.path.join(self.out, archive)
+        if method == "zip":
+            with zipfile.ZipFile(path) as zf:
+                self.assertIsNone(zf.testzip())
+                self.assertEqual(zf.getinfo("src/image.jpg").compress_type, zipfile.ZIP_STORED)
+                self.assertEqual(zf.read("src/image.jpg"), self.big)
+        else:
+            with tarfile.open(path) as tf:
+                self.assertEqual(tf.extractfile("src/image.jpg").read(), self.big)
+                self.assertEqual(tf.extractfile("src/small.txt").read(), b"small" * 100)
+        with Archiveindex(path + ".idx") as index:
+            crcs = {entry.name: entry.crc for entry in index}
+        self.assertEqual(crcs["src/image.jpg"], zlib.crc32(self.big))
+
+    def test_copy_from_used(self):
+        for method in ("tar", "zip"):
+            with self.subTest(method=method):
+                with unittest.mock.patch.object(Hashingwriter, "copy_from", autospec=True,
+                                                side_effect=Hashingwriter.copy_from) as copy:
+                    bs = self._run_backup(self._make_config(method=method))
+                self.assertEqual([c.args[2] for c in copy.call_args_list], [len(self.big)])
+                self.assertEqual(bs.results[0].stats["bytes_read"], len(self.big) + 500)
+                self._check_archive(method)
+                shutil.rmtree(self.out)
+                os.makedirs(self.out)
+
+    def test_zip_without_zipfile_internals(self):
+        with unittest.mock.patch.dict(backupy.ZIPFILE_INTERNALS, copy=False), \
+                unittest.mock.patch.object(Hashingwriter, "copy_from", side_effect=AssertionError):
+            self._run_backup(self._make_config(method="zip"))
+        self._check_archive("zip")
+
+    def test_copy_from_windows(self):
+        path = os.path.join(self.tmpdir, "copy.bin")
+        with unittest.mock.patch.object(Hashingwriter, "COPY_WINDOW", 4096), \
+                Hashingwriter(path, "sha256") as output, open(os.path.join(self.src, "image.jpg"), "rb") as src:
+            output.write(b"head")
+            src.read(100)    # the position of src doesn't matter
+            self.assertTrue(output.can_copy_from(src, len(self.big)))
+            self.assertFalse(output.can_copy_from(src, len(self.big) + 1))
+            self.assertFalse(output.can_copy_from(io.BytesIO(self.big), len(self.big)))
+            crc = output.copy_from(src, len(self.big))
+            output.write(b"tail")
+        self.assertEqual(crc, zlib.crc32(self.big))
+        with open(path, "rb") as f:
+            data = f.read()
+        self.assertEqual(data, b"head" + self.big + b"tail")
+        self.assertEqual((output.size, output.hexdigest()), (len(data), hashlib.sha256(data).hexdigest()))
+
+    def test_copy_from_changing_file(self):
+        path = os.path.join(self.tmpdir, "copy.bin")
+        source = os.path.join(self.src, "image.jpg")
+        preadv = os.preadv
+
+        def changed_after_read(fd, buffers, offset):
+            read = preadv(fd, buffers, offset)
+            with open(source, "r+b") as f:    # a write to the range that was just read
+                f.seek(offset)
+                f.write(b"x" * 4096)
+            return read
+        for method in ("tar", "zip"):
+            with self.subTest(method=method):
+                with open(source, "wb") as f:
+                    f.write(self.big)
+                with unittest.mock.patch.object(os, "preadv", side_effect=changed_after_read):
+                    self._run_backup(self._make_config(method=method))
+                self._check_archive(method)    # the archive holds the data that was hashed
+                shutil.rmtree(self.out)
+                os.makedirs(self.out)
+
+    def test_copy_from_shrinking_file(self):
+        path = os.path.join(self.tmpdir, "copy.bin")
+        source = os.path.join(self.src, "image.jpg")
+        preadv = os.preadv
+
+        def truncating_preadv(fd, buffers, offset):
+            if offset:    # the file is cut after the first window was read
+                os.truncate(source, offset + 1000)
+            return preadv(fd, buffers, offset)
+        for truncate_before in (True, False):
+            with self.subTest(truncate_before=truncate_before):
+                with open(source, "wb") as f:
+                    f.write(self.big)
+                with unittest.mock.patch.object(Hashingwriter, "COPY_WINDOW", 65536), \
+                        unittest.mock.patch.object(os, "preadv", side_effect=truncating_preadv), \
+                        Hashingwriter(path, "md5") as output, open(source, "rb") as src:
+                    self.assertTrue(output.can_copy_from(src, len(self.big)))
+                    if truncate_before:
+                        os.truncate(source, 5000)
+                    crc = output.copy_from(src, len(self.big))
+                kept = 5000 if truncate_before else 65536 + 1000
+                expected = self.big[:kept] + bytes(len(self.big) - kept)
+                with open(path, "rb") as f:
+                    self.assertEqual(f.read(), expected)
+                self.assertEqual((crc, output.hexdigest()), (zlib.crc32(expected), hashlib.md5(expected).hexdigest()))
+
+    def test_tar_of_shrinking_file_stays_readable(self):
+        can_copy_from = Hashingwriter.can_copy_from
+
+        def checked_then_shrinks(output, src, size):
+            usable = can_copy_from(output, src, size)
+            if usable:
+                os.truncate(src.name, 100)
+            return usable
+        with unittest.mock.patch.object(Hashingwriter, "can_copy_from", checked_then_shrinks):
+            bs = self._run_backup(self._make_config(method="tar"))
+        self.assertEqual(bs.results[0].status, "done")
+        digest, archive = self._archive_digest("md5")
+        self.assertEqual(self._sum_row("md5")[0], digest)
+        with tarfile.open(os.path.join(self.out, archive)) as tf:
+            self.assertEqual(tf.extractfile("src/image.jpg").read(), self.big[:100] + bytes(len(self.big) - 100))
+
+    def test_file_shrunk_since_scan(self):
+        add_plan = BackupyTarfile.add_plan
+
+        def shrinks_then_add(tf, plan, arcnames):
+            os.truncate(os.path.join(self.src, "image.jpg"), 100)
+            return add_plan(tf, plan, arcnames)
+        for method in ("tar", "targz"):
+            with self.subTest(method=method):
+                shutil.rmtree(self.out)
+                os.makedirs(self.out)
+                with open(os.path.join(self.src, "image.jpg"), "wb") as f:
+                    f.write(self.big)
+                with unittest.mock.patch.object(BackupyTarfile, "add_plan", shrinks_then_add):
+                    bs = self._run_backup(self._make_config(method=method))
+                self.assertEqual(bs.results[0].status, "done")
+                archive = self._archive_digest("md5")[1]
+                with tarfile.open(os.path.join(self.out, archive)) as tf:
+                    self.assertEqual(tf.extractfile("src/image.jpg").read(), self.big[:100])
+
+    def test_file_shrinking_while_compressed(self):
+        current_size = BackupyTarfile._current_size
+
+        def opened_then_shrinks(f, size):
+            size = current_size(f, size)
+            if f.name.endswith("image.jpg"):
+                os.truncate(f.name, 100)
+            return size
+        with unittest.mock.patch.object(BackupyTarfile, "_current_size", staticmethod(opened_then_shrinks)):
+            bs = self._run_backup(self._make_config(method="targz"))
+        self.assertEqual(bs.results[0].status, "done")
+        archive = self._archive_digest("md5")[1]
+        with tarfile.open(os.path.join(self.out, archive)) as tf:
+            self.assertEqual(tf.extractfile("src/image.jpg").read(), self.big[:100] + bytes(len(self.big) - 100))
+        with Archiveindex(os.path.join(self.out, archive) + ".idx") as index:
+            crcs = {entry.name: entry.crc for entry in index}
+        self.assertEqual(crcs["src/image.jpg"], zlib.crc32(self.big[:100] + bytes(len(self.big) - 100)))
+
+
+class TestParallelcompressor(unittest.TestCase):
+    """Block-parallel compression must produce valid concatenated members."""
+
+    DATA = b"".join(b"line %d of some compressible text\n" % i for i in range(5000))
+
+    def _compress(self, codec, blocksize=4096, writes=1000):
+        out = io.BytesIO()
+        with Parallelcompressor(out, codec, threads=4, blocksize=blocksize) as stream:
+            for i in range(0, len(self.DATA), writes):
+                stream.write(self.DATA[i:i + writes])
+        return out.getvalue()
+
+    def test_gzip_members(self):
+        data = self._compress('gz')
+        self.assertGreater(data.count(b"\x1f\x8b\x08"), 1)
+        self.assertEqual(gzip.decompress(data), self.DATA)
+
+    def test_bz2_streams(self):
+        data = self._compress('bz2')
+        self.assertGreater(data.count(b"BZh9"), 1)
+        self.assertEqual(bz2.decompress(data), self.DATA)
+
+    def test_xz_streams(self):
+        data = self._compress('xz')
+        self.assertGreater(data.count(b"\xfd7zXZ\x00"), 1)
+        self.assertEqual(lzma.decompress(data), self.DATA)
+
+    def test_empty_stream_is_valid(self):
+        out = io.BytesIO()
+        with Parallelcompressor(out, 'gz', threads=2):
+            pass
+        self.assertEqual(gzip.decompress(out.getvalue()), b"")
+
+    def test_block_table(self):
+        out = io.BytesIO()
+        with Parallelcompressor(out, 'gz', threads=4, blocksize=4096) as stream:
+            stream.write(self.DATA)
+        data = out.getvalue()
+        self.assertEqual([start for start, _ in stream.blocks], list(range(0, len(self.DATA), 4096)))
+        for start, compressed_start in stream.blocks[::7]:
+            self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(data[compressed_start:])).read(100),
+                             self.DATA[start:start + 100])
+
+
+class TestParallelCompressTar(_CompressTestBase):
+    """compress_tar with threads > 1."""
+
+    def test_threaded_tar_methods(self):
+        with open(os.path.join(self.src, "big.txt"), "wb") as f:
+            f.write(TestParallelcompressor.DATA * 4)
+        for method in ("targz", "tarbz2", "tarxz"):
+            with self.subTest(method=method):
+                for f in os.listdir(self.out):
+                    os.remove(os.path.join(self.out, f))
+                self._run_backup(self._make_config(method=method).replace(
+                    f'method = "{method}"', f'method = "{method}"\nthreads = 3'))
+                archive = [f for f in os.listdir(self.out) if f.startswith("out_") and not f.endswith(".idx")][0]
+                with tarfile.open(os.path.join(self.out, archive)) as tf:
+                    data = tf.extractfile("src/big.txt").read()
+                self.assertEqual(data, TestParallelcompressor.DATA * 4)
+
+    def test_invalid_threads_exits(self):
+        cfg = self._make_config().replace('method = "targz"', 'method = "targz"\nthreads = "many"')
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(cfg))
+
+
+class TestZstdAndCompressionLevel(_CompressTestBase):
+    """tarzst method and compression_level option."""
+
+    def _config(self, method, extra):
+        return self._make_config(method=method).replace(f'method = "{method}"', f'method = "{method}"\n{extra}')
+
+    @unittest.skipUnless(backupy.zstd, "compression.zstd is not available (python 3.14+)")
+    def test_tarzst_archive(self):
+        with open(os.path.join(self.src, "file.txt"), "w") as f:
+            f.write("zstd " * 1000)
+        self._run_backup(self._config("tarzst", "threads = 2\ncompression_level = 10"))
+        archive = [f for f in os.listdir(self.out) if f.endswith(".tar.zst")][0]
+        with tarfile.open(os.path.join(self.out, archive)) as tf:
+            self.assertEqual(tf.extractfile("src/file.txt").read(), b"zstd " * 1000)
+
+    def test_tarzst_without_zstd_support_exits(self):
+        with unittest.mock.patch.object(backupy, "zstd", None):
+            with self.assertRaises(SystemExit):
+                Backupset(self._write_config(self._make_config(method="tarzst")))
+
+    def test_compression_level_applied(self):
+        with open(os.path.join(self.src, "file.txt"), "w") as f:
+            f.write("".join(f"{i} level test\n" for i in range(20000)))
+        sizes = {}
+        for level in (1, 9):
+            for f in os.listdir(self.out):
+                os.remove(os.path.join(self.out, f))
+            self._run_backup(self._config("targz", f"compression_level = {level}"))
+            self.assertTrue(any("file.txt" in n for n in self._get_tar_contents()))
+            sizes[level] = sum(os.path.getsize(os.path.join(self.out, f)) for f in os.listdir(self.out)
+                               if f.endswith(".tar.gz"))
+        self.assertGreater(sizes[1], sizes[9])
+
+    def test_compression_level_out_of_range_exits(self):
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(self._config("tarbz2", "compression_level = 0")))
+
+    def test_gzip_compression_level_zero(self):
+        self.assertEqual(Backupset(self._write_config(self._config("targz", "compression_level = 0")))
+                         .task_list[0].compression_level, 0)
+
+    def test_compression_level_with_plain_tar_exits(self):
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(self._config("tar", "compression_level = 5")))
+
+    def test_zip_compression_level_range(self):
+        self.assertEqual(Backupset(self._write_config(self._config("zip", "compression_level = 9")))
+                         .task_list[0].compression_level, 9)
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(self._config("zip", "compression_level = 10")))
+
+
+class TestIncrementalBackup(_CompressTestBase):
+    """incremental = true: only new/changed files after the first (full) run."""
+
+    def _config(self, method="tar", full_every=0):
+        return self._make_config(method=method).replace(
+            f'method = "{method}"', f'method = "{method}"\nincremental = true\nfull_every = {full_every}')
+
+    def _run_and_collect(self, cfg):
+        """Runs a backup, moves its archive away (names are unique per minute only), returns its member names."""
+        self._run_backup(cfg)
+        archive = [f for f in os.listdir(self.out) if f.startswith("out_") and not f.endswith((".deleted", ".idx"))][0]
+        path = os.path.join(self.out, archive)
+        if archive.endswith(".zip"):
+            with zipfile.ZipFile(path) as zf:
+                names = zf.namelist()
+        else:
+            with tarfile.open(path) as tf:
+                names = [m.name for m in tf.getmembers() if not m.isdir()]
+        deleted = []
+        if os.path.exists(path + ".deleted"):
+            with open(path + ".deleted") as f:
+                deleted = f.read().splitlines()
+            os.remove(path + ".deleted")
+        os.remove(path)
+        return sorted(names), deleted
+
+    def _write(self, name, content):
+        with open(os.path.join(self.src, name), "w") as f:
+            f.write(content)
+
+    def _check_incremental(self, method):
+        self._write("keep.txt", "keep")
+        self._write("change.txt", "v1")
+        self._write("remove.txt", "bye")
+        names, deleted = self._run_and_collect(self._config(method))
+        self.assertEqual(names, ["src/change.txt", "src/keep.txt", "src/remove.txt"])
+        self.assertEqual(deleted, [])
+
+        self._write("change.txt", "version 2")
+        self._write("new.txt", "new")
+        os.remove(os.path.join(self.src, "remove.txt"))
+        names, deleted = self._run_and_collect(self._config(method))
+        self.assertEqual(names, ["src/change.txt", "src/new.txt"])
+        self.assertEqual(deleted, [os.path.join(self.src, "remove.txt")])
+
+        names, deleted = self._run_and_collect(self._config(method))
+        self.assertEqual(names, [])
+
+    def test_incremental_tar(self):
+        self._check_incremental("tar")
+
+    def test_incremental_zip(self):
+        self._check_incremental("zip")
+
+    def test_full_every(self):
+        self._write("file.txt", "x")
+        runs = [self._run_and_collect(self._config(full_every=2))[0] for _ in range(3)]
+        self.assertEqual(runs, [["src/file.txt"], [], ["src/file.txt"]])
+
+    def test_corrupt_manifest_means_full_backup(self):
+        self._write("file.txt", "x")
+        self._run_and_collect(self._config())
+        snapshots = [f for f in os.listdir(self.out) if f.endswith(".snapshot")]
+        self.assertEqual(snapshots, ["out.snapshot"])
+        with open(os.path.join(self.out, "out.snapshot"), "wb") as f:
+            f.write(b"garbage")
+        self.assertEqual(self._run_and_collect(self._config())[0], ["src/file.txt"])
+
+
+class TestCasMethod(_CompressTestBase):
+    """method = "cas": deduplicated chunk store, snapshots, restore and gc."""
+
+    def setUp(self):
+        super().setUp()
+        # small chunks: several per test file
+        patcher = unittest.mock.patch.multiple(Chunkstore, MIN_CHUNK=4096, MAX_CHUNK=65536,
+                                               CUT_MASK=(1 << 8) - 1)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rng = random.Random(42)
+
+    def _run_cas(self):
+        """Runs a cas backup, returns the path of its snapshot object."""
+        before = set(os.listdir(self.out))
+        self.run_count = getattr(self, "run_count", 0) + 1
+        # archive names are unique per minute only
+        with unittest.mock.patch.object(backupy, "get_time_short", return_value=f"run{self.run_count}"):
+            self._run_backup(self._make_config(method="cas"))
+        snapshot, = [f for f in set(os.listdir(self.out)) - before if f.endswith(".cas")]
+        return os.path.join(self.out, snapshot)
+
+    def _chunk_files(self):
+        chunks_dir = os.path.join(self.out, "backupy-cas", "chunks")
+        return {f for _, _, files in os.walk(chunks_dir) for f in files}
+
+    def test_chunks_are_content_defined(self):
+        data = self.rng.randbytes(300 * 1024)
+        store = Chunkstore(self.out)
+        chunks = list(store.iter_chunks(io.BytesIO(data)))
+        self.assertEqual(b"".join(chunks), data)
+        self.assertTrue(all(len(c) <= Chunkstore.MAX_CHUNK for c in chunks))
+        shifted = list(store.iter_chunks(io.BytesIO(b"inserted" + data)))
+        self.assertGreater(len(set(chunks) & set(shifted)), len(chunks) - 3)
+
+    def test_second_run_stores_no_new_chunks_and_restores(self):
+        os.makedirs(os.path.join(self.src, "sub"))
+        with open(os.path.join(self.src, "sub", "big.bin"), "wb") as f:
+            f.write(self.rng.randbytes(200 * 1024))
+        with open(os.path.join(self.src, "small.txt"), "w") as f:
+            f.write("small")
+        os.symlink("small.txt", os.path.join(self.src, "link"))
+        first = self._run_cas()
+        chunks = self._chunk_files()
+        self.assertGreater(len(chunks), 2)
+        second = self._run_cas()
+        self.assertEqual(self._chunk_files(), chunks)
+
+        target = os.path.join(self.tmpdir, "restore")
+        Backupy.cas_restore(second, target)
+        with open(os.path.join(target, "src", "sub", "big.bin"), "rb") as f, \
+                open(os.path.join(self.src, "sub", "big.bin"), "rb") as g:
+            self.assertEqual(f.read(), g.read())
+        self.assertEqual(os.readlink(os.path.join(target, "src", "link")), "small.txt")
+        self.assertEqual(os.path.getmtime(os.path.join(target, "src", "small.txt")),
+                         os.path.getmtime(os.path.join(self.src, "small.txt")))
+        self.assertTrue(first)
+
+    def test_restore_does_not_follow_symlinks_in_target(self):
+        with open(os.path.join(self.src, "a.txt"), "w") as f:
+            f.write("restored")
+        snapshot = self._run_cas()
+        outside = os.path.join(self.tmpdir, "outside")
+        os.makedirs(outside)
+        with open(os.path.join(outside, "victim"), "w") as f:
+            f.write("untouched")
+        target = os.path.join(self.tmpdir, "restore")
+        os.makedirs(os.path.join(target, "src"))
+        os.symlink(os.path.join(outside, "victim"), os.path.join(target, "src", "a.txt"))
+        Chunkstore.find(self.out).restore(snapshot, target)
+        self.assertFalse(os.path.islink(os.path.join(target, "src", "a.txt")))
+        with open(os.path.join(target, "src", "a.txt")) as f:
+            self.assertEqual(f.read(), "restored")
+        with open(os.path.join(outside, "victim")) as f:
+            self.assertEqual(f.read(), "untouched")
+
+        shutil.rmtree(target)
+        os.makedirs(target)
+        os.symlink(outside, os.path.join(target, "src"))    # planted dir symlink: its entries are skipped
+        self.assertEqual(Chunkstore.find(self.out).restore(snapshot, target), 0)
+        self.assertEqual(os.listdir(outside), ["victim"])
+
+    def test_gc_removes_only_unreferenced_chunks(self):
+        with open(os.path.join(self.src, "a.bin"), "wb") as f:
+            f.write(self.rng.randbytes(100 * 1024))
+        first = self._run_cas()
+        with open(os.path.join(self.src, "a.bin"), "wb") as f:
+            f.write(self.rng.randbytes(100 * 1024))
+        second = self._run_cas()
+        store = Chunkstore.find(self.out)
+        self.assertEqual(store.gc(), (0, 0, []))
+        os.remove(first)
+        chunks = self._chunk_files()
+        self.assertEqual(store.gc(), (0, 0, [first]))    # deleted, but not forgotten
+        self.assertEqual(self._chunk_files(), chunks)
+        removed, freed, missing = store.gc(prune=True)
+        self.assertGreater(removed, 0)
+        self.assertGreater(freed, 0)
+        self.assertEqual(missing, [first])
+        referenced = {c for e in iter_cas_snapshot(second) for c in e.get("chunks", ())}
+        self.assertEqual(self._chunk_files(), referenced)
+        self.assertEqual(store.snapshot_paths(), [second])
+
+    def test_gc_keeps_chunks_of_moved_result_dir(self):
+        with open(os.path.join(self.src, "a.bin"), "wb") as f:
+            f.write(self.rng.randbytes(100 * 1024))
+        snapshot = self._run_cas()
+        chunks = self._chunk_files()
+        moved = os.path.join(self.tmpdir, "moved")
+        os.rename(self.out, moved)
+        self.out = moved
+        store = Chunkstore.find(moved)
+        self.assertEqual(store.gc(), (0, 0, []))
+        self.assertEqual(self._chunk_files(), chunks)
+        self.assertEqual(store.snapshot_paths(), [os.path.join(moved, os.path.basename(snapshot))])
+
+    def test_gc_locked_out_by_running_backup(self):
+        store = Chunkstore(os.path.join(self.out, "backupy-cas"))
+        with store.lock():
+            chunk_id, _ = store.put(b"not registered yet")
+            with self.assertRaises(BlockingIOError):
+                store.gc(prune=True)
+            with self.assertRaises(SystemExit) as cm:
+                Backupy(["--gc", self.out])
+            self.assertEqual(cm.exception.code, 1)
+        self.assertTrue(os.path.exists(store.chunk_path(chunk_id)))
+
+    def test_gc_removes_only_old_tmp_files(self):
+        store = Chunkstore(os.path.join(self.out, "backupy-cas"))
+        chunk_id, _ = store.put(b"payload")
+        old_tmp, new_tmp = store.chunk_path(chunk_id) + ".tmp1-1", store.chunk_path(chunk_id) + ".tmp2-2"
+        for path in (old_tmp, new_tmp):
+            open(path, "w").close()
+        os.utime(old_tmp, (1500000000, 1500000000))
+        os.utime(new_tmp, (time.time() + 60, time.time() + 60))    # written after gc took the lock
+        store.gc()
+        self.assertEqual((os.path.exists(old_tmp), os.path.exists(new_tmp)), (False, True))
+
+    def test_snapshot_of_empty_files(self):
+        open(os.path.join(self.src, "empty.txt"), "w").close()
+        snapshot = self._run_cas()
+        self.assertEqual(Chunkstore.find(self.out).snapshot_paths(), [snapshot])
+
+    def test_corrupt_chunk_detected(self):
+        store = Chunkstore(os.path.join(self.out, "backupy-cas"))
+        chunk_id, _ = store.put(b"payload")
+        with open(store.chunk_path(chunk_id), "wb") as f:
+            f.write(zlib.compress(b"tampered"))
+        with self.assertRaises(ValueError):
+            store.get(chunk_id)
+
+    def test_incremental_cas_exits(self):
+        cfg = self._make_config(method="cas").replace('method = "cas"', 'method = "cas"\nincremental = true')
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(cfg))
+
+
+class TestFilestatecache(_CompressTestBase):
+    """Per-file state kept between runs (opt-in: meta filestate_cache)."""
+
+    def setUp(self):
+        super().setUp()
+        self.db_path = os.path.join(self.tmpdir, "config", "filestate.sqlite")
+        patcher = unittest.mock.patch.object(Filestatecache, "default_path", return_value=self.db_path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _stat(self, ino, size=10, mtime_ns=1, ctime_ns=1):
+        return backupy.Planstat(0o100644, ino, 1, 1, 0, 0, size, 0, mtime_ns, ctime_ns, 0)
+
+    def test_lookup_needs_same_state(self):
+        with Filestatecache(self.db_path).open() as cache:
+            cache.store(self._stat(1), ["aa", "bb"])
+        with Filestatecache(self.db_path).open() as cache:
+            self.assertEqual(cache.lookup(self._stat(1))["chunks"], ["aa", "bb"])
+            self.assertIsNone(cache.lookup(self._stat(1, size=11)))
+            self.assertIsNone(cache.lookup(self._stat(1, mtime_ns=2)))
+            self.assertIsNone(cache.lookup(self._stat(1, ctime_ns=2)))
+            self.assertIsNone(cache.lookup(self._stat(2)))
+            self.assertEqual(cache.hits, 1)
+
+    def test_lru_eviction(self):
+        with unittest.mock.patch.object(Filestatecache, "MAX_ENTRIES", 3):
+            with Filestatecache(self.db_path).open() as cache:
+                for ino in range(3):
+                    cache.store(self._stat(ino))
+            with Filestatecache(self.db_path).open() as cache:
+                cache._now += 10
+                cache.lookup(self._stat(0))    # used again: the oldest ones go
+            with Filestatecache(self.db_path).open() as cache:
+                cache._now += 20
+                cache.store(self._stat(3))
+            with Filestatecache(self.db_path).open() as cache:
+                self.assertEqual([ino for ino in range(4) if cache.lookup(self._stat(ino))], [0, 2, 3])
+
+    def test_unusable_cache_is_skipped(self):
+        os.makedirs(self.db_path)    # a directory in place of the database
+        self.assertIsNone(Filestatecache(self.db_path).open())
+
+    def test_cas_skips_unchanged_files(self):
+        with open(os.path.join(self.src, "data.bin"), "wb") as f:
+            f.write(os.urandom(100 * 1024))
+        with open(os.path.join(self.src, "changed.txt"), "w") as f:
+            f.write("one")
+        config = self._make_config(method="cas").replace(
+            "enabled = true\n", "enabled = true\nfilestate_cache = true\n", 1)
+        with unittest.mock.patch.object(backupy, "get_time_short", return_value="run1"):
+            self._run_backup(config)
+        with open(os.path.join(self.src, "changed.txt"), "w") as f:
+            f.write("two")
+        with unittest.mock.patch.object(Backuptask, "_store_file_chunks",
+                                        wraps=Backuptask._store_file_chunks) as store_file, \
+                unittest.mock.patch.object(backupy, "get_time_short", return_value="run2"):
+            self._run_backup(config)
+        self.assertEqual([os.path.basename(c.args[1]) for c in store_file.call_args_list], ["changed.txt"])
+        snapshot, = [f for f in os.listdir(self.out) if f.endswith("run2.cas")]
+        target = os.path.join(self.tmpdir, "restored")
+        Chunkstore.find(self.out).restore(os.path.join(self.out, snapshot), target)
+        for name in ("data.bin", "changed.txt"):
+            with open(os.path.join(self.src, name), "rb") as a, open(os.path.join(target, "src", name), "rb") as b:
+                self.assertEqual(a.read(), b.read())
+
+
+class TestArchiveIndex(_CompressTestBase):
+    """Sidecar '<archive>.idx' index and --list."""
+
+    def _make_tree(self):
+        os.makedirs(os.path.join(self.src, "sub"))
+        for name, data in (("a.txt", b"alpha" * 100), ("sub/b.bin", os.urandom(5000)), ("sub/c.txt", b"")):
+            with open(os.path.join(self.src, name), "wb") as f:
+                f.write(data)
+
+    def _archive(self, suffix):
+        archive, = [f for f in os.listdir(self.out) if f.endswith(suffix)]
+        return os.path.join(self.out, archive)
+
+    def test_write_read_roundtrip(self):
+        path = os.path.join(self.tmpdir, "test.idx")
+        Archiveindex.write(path, [("src/b", tarfile.REGTYPE, 0o100644, 3, 1000, 512, 7),
+                                  ("src", tarfile.DIRTYPE, 0o40755, 0, 1000, 0, None),
+                                  ("src/\udcffá", tarfile.REGTYPE, 0o644, 1, 1000.7, 1536, 0),
+                                  ("srcx", tarfile.REGTYPE, 0o644, 1, 1000, 2048, 1)])
+        with Archiveindex(path) as index:
+            self.assertEqual([e.name for e in index], ["src", "src/b", "src/\udcffá", "srcx"])
+            self.assertEqual(index.find("src/b"), ("src/b", tarfile.REGTYPE, 0o644, 3, 1000, 512, 7))
+            self.assertIsNone(index.find("src")[6])
+            self.assertEqual(index.find("src/\udcffá").mtime, 1000)
+            self.assertIsNone(index.find("src/c"))
+            self.assertEqual([e.name for e in index.iter_prefix("src/")], ["src/b", "src/\udcffá"])
+            self.assertEqual(len(list(index.iter_prefix())), 4)
+
+    def test_not_an_index_raises(self):
+        path = os.path.join(self.tmpdir, "bogus.idx")
+        with open(path, "wb") as f:
+            f.write(b"bogus")
+        with self.assertRaises(ValueError):
+            Archiveindex(path)
+
+    def test_tar_index_offsets_and_crc(self):
+        self._make_tree()
+        self._run_backup(self._make_config(method="tar"))
+        archive = self._archive(".tar")
+        with Archiveindex(archive + ".idx") as index, tarfile.open(archive) as tf:
+            self.assertEqual(sorted(tf.getnames()), [e.name for e in index])
+            for entry in index:
+                tf.fileobj.seek(entry.offset)
+                member = tarfile.TarInfo.fromtarfile(tf)
+                self.assertEqual(member.name, entry.name)
+                if member.isreg():
+                    self.assertEqual(zlib.crc32(tf.extractfile(member).read()), entry.crc)
+                    self.assertEqual(member.size, entry.size)
+                else:
+                    self.assertIsNone(entry.crc)
+
+    def test_compressed_tar_index_matches_members(self):
+        self._make_tree()
+        self._run_backup(self._make_config(method="targz"))
+        archive = self._archive(".tar.gz")
+        with Archiveindex(archive + ".idx") as index, tarfile.open(archive) as tf:
+            offsets = {m.name: m.offset for m in tf.getmembers()}
+            self.assertEqual({e.name: e.offset for e in index}, offsets)
+
+    def test_zip_index(self):
+        self._make_tree()
+        self._run_backup(self._make_config(method="zip"))
+        archive = self._archive(".zip")
+        with Archiveindex(archive + ".idx") as index, zipfile.ZipFile(archive) as zf:
+            self.assertEqual({e.name: (e.offset, e.crc, e.size) for e in index},
+                             {i.filename: (i.header_offset, i.CRC, i.file_size) for i in zf.infolist()})
+
+    def test_list_archive(self):
+        self._make_tree()
+        self._run_backup(self._make_config(method="tarbz2"))
+        archive = self._archive(".tar.bz2")
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            Backupy.list_archive(archive)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[-1] for line in lines], ["src", "src/a.txt", "src/sub", "src/sub/b.bin", "src/sub/c.txt"])
+        self.assertTrue(lines[0].startswith("d"))
+        self.assertIn(" 500 ", lines[1])
+        with self.assertRaises(SystemExit):
+            Backupy.list_archive(os.path.join(self.out, "missing.tar"))
+
+
+class TestSelectiveRestore(_CompressTestBase):
+    """--restore ARCHIVE --path PATTERN --to DIR"""
+
+    def setUp(self):
+        super().setUp()
+        self.target = os.path.join(self.tmpdir, "restore")
+        os.makedirs(os.path.join(self.src, "sub"))
+        os.makedirs(os.path.join(self.src, "other"))
+        for name, data in (("a.txt", b"alpha"), ("sub/b.bin", os.urandom(3000)), ("sub/c.txt", b"gamma"),
+                           ("other/d.odt", b"delta")):
+            with open(os.path.join(self.src, name), "wb") as f:
+                f.write(data)
+        os.utime(os.path.join(self.src, "sub", "c.txt"), (1500000000, 1500000000))
+
+    def _backup(self, method):
+        self._run_backup(self._make_config(method=method))
+        archive, = [f for f in os.listdir(self.out) if f.startswith("out_") and not f.endswith(".idx")]
+        return os.path.join(self.out, archive)
+
+    def _restored(self):
+        return sorted(os.path.relpath(os.path.join(d, f), self.target)
+                      for d, _, files in os.walk(self.target) for f in files)
+
+    def _assert_same(self, name):
+        with open(os.path.join(self.src, name), "rb") as f, \
+                open(os.path.join(self.target, "src", name), "rb") as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_match_restore_path(self):
+        self.assertTrue(match_restore_path("src/sub/b.bin", ["src/sub"]))
+        self.assertTrue(match_restore_path("src/sub/b.bin", ["*.bin"]))
+        self.assertTrue(match_restore_path("src/sub", ["src/sub"]))
+        self.assertFalse(match_restore_path("src/subx/b.bin", ["src/sub"]))
+        self.assertFalse(match_restore_path("src", ["src/sub"]))
+        self.assertTrue(match_restore_path("anything", None))
+
+    def test_index_select_uses_literal_prefix(self):
+        archive = self._backup("tar")
+        with Archiveindex(archive + ".idx") as index:
+            self.assertEqual([e.name for e in index.select(["/src/sub/"])], ["src/sub", "src/sub/b.bin", "src/sub/c.txt"])
+            self.assertEqual([e.name for e in index.select(["src/*.txt", "src/other"])],
+                             ["src/a.txt", "src/other", "src/other/d.odt", "src/sub/c.txt"])
+            with unittest.mock.patch.object(index, "iter_prefix", wraps=index.iter_prefix) as iter_prefix:
+                index.select(["src/o*/d.odt"])
+            iter_prefix.assert_called_once_with("src/o")
+
+    def test_tar_restore_seeks_with_index(self):
+        archive = self._backup("tar")
+        with unittest.mock.patch.object(Archiverestorer, "_restore_tar_stream", side_effect=AssertionError):
+            self.assertEqual(Archiverestorer(archive, ["src/sub"]).restore(self.target), 3)
+        self.assertEqual(self._restored(), ["src/sub/b.bin", "src/sub/c.txt"])
+        self._assert_same("sub/b.bin")
+        self.assertEqual(os.path.getmtime(os.path.join(self.target, "src", "sub", "c.txt")), 1500000000)
+
+    def test_tar_restore_pulls_hardlink_target(self):
+        os.link(os.path.join(self.src, "a.txt"), os.path.join(self.src, "other", "hl.txt"))
+        archive = self._backup("tar")
+        with Archiveindex(archive + ".idx") as index:
+            link, = [e.name for e in index if e.type == tarfile.LNKTYPE]
+        Archiverestorer(archive, [link]).restore(self.target)
+        with open(os.path.join(self.target, link), "rb") as f:
+            self.assertEqual(f.read(), b"alpha")
+
+    def test_compressed_tar_stream_stops_early(self):
+        archive = self._backup("targz")
+        with Archiveindex(archive + ".idx") as index:
+            first = min((e for e in index if e.type == tarfile.REGTYPE), key=lambda e: e.offset)
+            total = len(index)
+        real_next = tarfile.TarFile.next
+        with unittest.mock.patch.object(tarfile.TarFile, "next", autospec=True, side_effect=real_next) as next_:
+            self.assertEqual(Archiverestorer(archive, [first.name]).restore(self.target), 1)
+        self.assertLess(next_.call_count, total)
+        self.assertEqual(self._restored(), [first.name])
+
+    def test_stream_restore_without_index(self):
+        archive = self._backup("tarbz2")
+        os.remove(archive + ".idx")
+        self.assertEqual(Archiverestorer(archive, ["*.txt"]).restore(self.target), 2)
+        self.assertEqual(self._restored(), ["src/a.txt", "src/sub/c.txt"])
+        self._assert_same("sub/c.txt")
+
+    def test_restore_threaded_archives(self):
+        with open(os.path.join(self.src, "sub", "big.txt"), "wb") as f:
+            f.write(TestParallelcompressor.DATA * 40)    # several compressed members
+        for method in ("targz", "tarbz2", "tarxz"):
+            for with_index in (True, False):
+                with self.subTest(method=method, with_index=with_index):
+                    shutil.rmtree(self.out)
+                    shutil.rmtree(self.target, ignore_errors=True)
+                    os.makedirs(self.out)
+                    self._run_backup(self._make_config(method=method).replace(
+                        f'method = "{method}"', f'method = "{method}"\nthreads = 4'))
+                    archive, = [os.path.join(self.out, f) for f in os.listdir(self.out)
+                                if f.startswith("out_") and not f.endswith(".idx")]
+                    if not with_index:
+                        os.remove(archive + ".idx")
+                    self.assertEqual(Archiverestorer(archive, ["src/sub", "src/other"]).restore(self.target), 6)
+                    self._assert_same("sub/big.txt")
+                    self._assert_same("other/d.odt")
+
+    def test_truncated_archive_reported(self):
+        archive = self._backup("tarbz2")
+        with open(archive, "r+b") as f:
+            f.truncate(os.path.getsize(archive) // 2)
+        output = io.StringIO()
+        with self.assertRaises(SystemExit) as cm, contextlib.redirect_stdout(output):
+            Backupy(["--restore", archive, "--to", self.target])
+        self.assertEqual(cm.exception.code, 1)
+        self.assertIn("Cannot read archive", output.getvalue())
+
+    def test_zip_restore(self):
+        archive = self._backup("zip")
+        self.assertEqual(Archiverestorer(archive, ["src/sub"]).restore(self.target), 2)
+        self.assertEqual(self._restored(), ["src/sub/b.bin", "src/sub/c.txt"])
+        self._assert_same("sub/b.bin")
+        self.assertEqual(os.path.getmtime(os.path.join(self.target, "src", "sub", "c.txt")), 1500000000)
+
+    def test_cas_restore_with_pattern(self):
+        archive = self._backup("cas")
+        with self.assertRaises(SystemExit) as cm:
+            Backupy(["--restore", archive, "--path", "src/other", "--to", self.target])
+        self.assertEqual(cm.exception.code, 0)
+        self.assertEqual(self._restored(), ["src/other/d.odt"])
+
+    def test_cli_restore(self):
+        archive = self._backup("tarxz")
+        with self.assertRaises(SystemExit) as cm:
+            Backupy(["--restore", archive, "--path", "src/a.txt", "--to", self.target])
+        self.assertEqual(cm.exception.code, 0)
+        self.assertEqual(self._restored(), ["src/a.txt"])
+        with self.assertRaises(SystemExit) as cm:
+            Backupy(["--restore", os.path.join(self.out, "missing.tar"), "--to", self.target])
+        self.assertEqual(cm.exception.code, 1)
+
+
+class TestSeekableTargz(_CompressTestBase):
+    """method = "targz-seekable": independent gzip blocks + block table in the index."""
+
+    def setUp(self):
+        super().setUp()
+        self.rng = random.Random(13)
+        self.files = {}
+        for i in range(6):
+            name = f"f{i}.bin"
+            self.files[name] = self.rng.randbytes(700 * 1024)
+            with open(os.path.join(self.src, name), "wb") as f:
+                f.write(self.files[name])
+
+    def _backup(self):
+        cfg = self._make_config(method="targz-seekable").replace(
+            'method = "targz-seekable"', 'method = "targz-seekable"\nseek_block_size = 1\nthreads = 2')
+        self._run_backup(cfg)
+        archive, = [f for f in os.listdir(self.out) if f.endswith(".tar.gz")]
+        return os.path.join(self.out, archive)
+
+    def test_standard_gzip_and_tar_can_read_it(self):
+        archive = self._backup()
+        with tarfile.open(archive) as tf:
+            self.assertEqual(tf.extractfile("src/f3.bin").read(), self.files["f3.bin"])
+        with Archiveindex(archive + ".idx") as index:
+            self.assertGreater(len(index.blocks), 3)
+            self.assertEqual(index.blocks[0], (0, 0))
+
+    def test_reader_seeks_by_block(self):
+        archive = self._backup()
+        with open(archive, "rb") as f:
+            plain = gzip.decompress(f.read())
+        with Archiveindex(archive + ".idx") as index, Seekablegzipreader(archive, index.blocks) as reader:
+            for offset in (3 * 2 ** 20 + 5, 100, 2 ** 20, len(plain) - 10, 1000):
+                reader.seek(offset)
+                self.assertEqual(reader.read(64), plain[offset:offset + 64])
+
+    def test_restore_decompresses_only_needed_blocks(self):
+        archive = self._backup()
+        with Archiveindex(archive + ".idx") as index:
+            last = max(index, key=lambda e: e.offset)
+        decompressed = []
+        real_read = gzip.GzipFile.read
+
+        def counting_read(stream, size=-1):
+            data = real_read(stream, size)
+            decompressed.append(len(data))
+            return data
+
+        target = os.path.join(self.tmpdir, "restore")
+        with unittest.mock.patch.object(gzip.GzipFile, "read", autospec=True, side_effect=counting_read), \
+                unittest.mock.patch.object(Archiverestorer, "_restore_tar_stream", side_effect=AssertionError):
+            self.assertEqual(Archiverestorer(archive, [last.name]).restore(target), 1)
+        with open(os.path.join(target, last.name), "rb") as f:
+            self.assertEqual(f.read(), self.files[os.path.basename(last.name)])
+        self.assertLess(sum(decompressed), 3 * 2 ** 20)
+
+    def test_invalid_seek_block_size_exits(self):
+        cfg = self._make_config(method="targz-seekable").replace(
+            'method = "targz-seekable"', 'method = "targz-seekable"\nseek_block_size = 0')
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(cfg))
+
+
+class TestSizeEstimation(_CompressTestBase):
+    """Pre-flight archive size prediction and on_insufficient_space."""
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.src, "sub", "skipme"))
+        self.sizes = {"a.txt": 4000, "b.JPG": 3000, "sub/c.bin": 2000, "sub/d.bak": 1000, "sub/skipme/e.txt": 500}
+        for name, size in self.sizes.items():
+            with open(os.path.join(self.src, name), "wb") as f:
+                f.write(b"x" * size)
+
+    def _config(self, method="tar", extra=""):
+        return self._make_config(method=method, task_endings='[".bak"]', task_dirs='["skipme"]').replace(
+            f'method = "{method}"', f'method = "{method}"\n{extra}')
+
+    def _model(self, task="out"):
+        with open(os.path.join(self.out, "backupy-estimate.json")) as f:
+            return json.load(f)[task]
+
+    def test_scan_honors_excludes(self):
+        task = Backupset(self._write_config(self._config())).task_list[0]
+        task.build_plan()
+        estimator = Sizeestimator(os.path.join(self.out, "model.json"), "tar", "out")
+        self.assertEqual(estimator.scan(task.plan), 9000)
+        self.assertEqual(estimator.ext_sizes, {".txt": 4000, ".jpg": 3000, ".bin": 2000})
+        self.assertEqual(estimator.file_count, 3)
+        self.assertEqual(estimator.predict(), 9000 + 3 * 1024)
+
+    def test_default_ratios(self):
+        estimator = Sizeestimator("unused", "tarxz", "out")
+        self.assertEqual(estimator.ratio(".jpg"), 1.0)
+        self.assertLess(estimator.ratio(".txt"), estimator.ratio(".bin"))
+        self.assertEqual(Sizeestimator("unused", "tar", "out").ratio(".txt"), 1.0)
+
+    def test_model_learns_from_runs(self):
+        self._run_backup(self._config("targz"))
+        model = self._model()["targz"]
+        self.assertEqual(model["runs"], 1)
+        self.assertLess(model["factor"], 1.0)    # 'x' * n compresses far better than the default ratios
+        archive, = [f for f in os.listdir(self.out) if f.endswith(".tar.gz")]
+        actual = os.path.getsize(os.path.join(self.out, archive))
+        estimator = Sizeestimator(os.path.join(self.out, "backupy-estimate.json"), "targz", "out")
+        estimator.load()
+        first_guess = Sizeestimator("unused", "targz", "out")
+        task = Backupset(self._write_config(self._config("targz"))).task_list[0]
+        task.build_plan()
+        for e in (estimator, first_guess):
+            e.scan(task.plan)
+        self.assertLess(abs(estimator.predict() - actual), abs(first_guess.predict() - actual))
+
+    def test_zip_learns_extension_ratios(self):
+        self._run_backup(self._config("zip"))
+        ratios = self._model()["zip"]["ratios"]
+        self.assertEqual(set(ratios), {".txt", ".jpg", ".bin"})
+        self.assertLess(ratios[".txt"], 0.1)
+
+    def test_tar_learns_extension_ratios(self):
+        for method in ("targz", "tarbz2", "tarxz"):
+            with self.subTest(method=method):
+                self._run_backup(self._config(method))
+                ratios = self._model()[method]["ratios"]
+                self.assertEqual(set(ratios), {".txt", ".jpg", ".bin"})
+                self.assertLess(ratios[".txt"], 0.1)
+
+    def test_models_kept_per_task(self):
+        cfg = self._config("targz")
+        self._run_backup(cfg)
+        other = cfg.replace('archive_name = "out"', 'archive_name = "other"').replace('[".bak"]', '[".bak", ".txt"]')
+        self._run_backup(other)
+        self.assertEqual(set(self._model()["targz"]["ratios"]), {".txt", ".jpg", ".bin"})
+        self.assertEqual(set(self._model("other")["targz"]["ratios"]), {".jpg", ".bin"})
+
+    def test_concurrent_learn_keeps_every_update(self):
+        path = os.path.join(self.out, "backupy-estimate.json")
+        os.makedirs(self.out, exist_ok=True)
+        estimators = [Sizeestimator(path, "targz", f"task{i}") for i in range(16)]
+
+        def learn(estimator):
+            estimator.ext_sizes = {".txt": 1000}
+            estimator.predict()
+            estimator.learn(500)
+
+        threads = [threading.Thread(target=learn, args=(estimator,)) for estimator in estimators]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with open(path) as f:
+            self.assertEqual(set(json.load(f)), {f"task{i}" for i in range(16)})
+
+    def test_insufficient_space_skip(self):
+        with unittest.mock.patch.object(backupy, "get_dir_free_bytes", return_value=100):
+            bs = self._run_backup(self._config(extra='on_insufficient_space = "skip"'))
+        self.assertEqual(bs.results[0].status, "skipped")
+        self.assertEqual([f for f in os.listdir(self.out) if f.endswith(".tar")], [])
+
+    def test_insufficient_space_fail(self):
+        with unittest.mock.patch.object(backupy, "get_dir_free_bytes", return_value=100), \
+                self.assertRaises(SystemExit):
+            self._run_backup(self._config(extra='on_insufficient_space = "fail"'))
+
+    def test_insufficient_space_warn(self):
+        for extra in ('on_insufficient_space = "warn"', ""):    # warn is the default
+            with self.subTest(extra=extra), \
+                    unittest.mock.patch.object(backupy, "get_dir_free_bytes", return_value=100):
+                bs = self._run_backup(self._config(extra=extra))
+                self.assertEqual(bs.results[0].status, "done")
+            shutil.rmtree(self.out)
+
+    def test_invalid_on_insufficient_space_exits(self):
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(self._config(extra='on_insufficient_space = "maybe"')))
+
+
+class TestScanplan(_CompressTestBase):
+    """One walk of the include dirs, shared by pre-flight checks and the archiver."""
+
+    def setUp(self):
+        super().setUp()
+        for d in ("a/b", "c"):
+            os.makedirs(os.path.join(self.src, d))
+        for i, d in enumerate(("", "a", "a/b", "c", "c")):
+            open(os.path.join(self.src, d, f"f{i}.txt"), "w").close()
+
+    def _config(self, method="tar"):
+        return self._make_config(method=method).replace(
+            "skip_if_permission_fail = false", "skip_if_permission_fail = true")
+
+    def test_large_directory_scanned_in_chunks(self):
+        root = os.path.join(self.tmpdir, "large")
+        os.makedirs(os.path.join(root, "sub"))
+        names = {f"f{i:02}" for i in range(25)}
+        for name in names:
+            open(os.path.join(root, name), "w").close()
+            open(os.path.join(root, "sub", name), "w").close()
+        chunks = []
+        scan_dir = Scanplan._scan_dir
+
+        def recording_scan_dir(plan, *args):
+            result = scan_dir(plan, *args)
+            chunks.append(len(result[2]))
+            return result
+        plans = []
+        with unittest.mock.patch.object(Scanplan, "SCAN_CHUNK", 4), \
+                unittest.mock.patch.object(Scanplan, "_scan_dir", recording_scan_dir):
+            for _ in range(2):
+                plan = Scanplan([root], False).build(lambda path, index: False, lambda path, index: False)
+                plans.append([path for _, path, _ in plan])
+        self.assertLessEqual(max(chunks), 4)
+        self.assertEqual(plans[0], plans[1])
+        self.assertEqual(len(plans[0]), 1 + 26 + 25)
+        self.assertEqual({os.path.basename(p) for p in plans[0] if os.path.dirname(p) == root}, names | {"sub"})
+        self.assertLess(plans[0].index(os.path.join(root, "sub")), plans[0].index(os.path.join(root, "sub", "f00")))
+
+    def test_member_order_is_deterministic(self):
+        root = os.path.join(self.tmpdir, "order")
+        for d in ("b", "a", "c/z", "c/y"):
+            os.makedirs(os.path.join(root, d))
+            for name in ("2.txt", "1.txt"):
+                open(os.path.join(root, d, name), "w").close()
+        names = []
+        for _ in range(3):
+            plan = Scanplan([root], False).build(lambda path, index: False, lambda path, index: False)
+            names.append([path[len(root):] for _, path, _ in plan])
+        self.assertEqual(names[0], ["", "/a", "/b", "/c", "/a/1.txt", "/a/2.txt", "/b/1.txt", "/b/2.txt",
+                                    "/c/y", "/c/z", "/c/y/1.txt", "/c/y/2.txt", "/c/z/1.txt", "/c/z/2.txt"])
+        self.assertEqual(names[0], names[1])
+        self.assertEqual(names[0], names[2])
+
+    def test_every_directory_scanned_once(self):
+        for method in ("tar", "zip", "cas"):
+            with self.subTest(method=method):
+                scanned = []
+                real_scandir = os.scandir
+
+                def recording_scandir(path="."):
+                    scanned.append(os.fspath(path))
+                    return real_scandir(path)
+
+                with unittest.mock.patch("os.scandir", recording_scandir), \
+                        unittest.mock.patch.object(backupy, "get_time_short", return_value=method):
+                    self._run_backup(self._config(method))
+                scanned = [p for p in scanned if p.startswith(self.src)]
+                self.assertEqual(sorted(scanned), sorted(set(scanned)))
+                self.assertEqual(len(scanned), 4)
+
+    def test_shared_include_dir_walked_once(self):
+        config = self._make_config(method="tar") + self._make_config(method="targz", task_dirs='["a"]').split(
+            "[[backup]]")[1].replace('name = "task1"', 'name = "task2"').join(("[[backup]]", ""))
+        scanned = []
+        real_scandir = os.scandir
+
+        def recording_scandir(path="."):
+            scanned.append(os.fspath(path))
+            return real_scandir(path)
+
+        with unittest.mock.patch("os.scandir", recording_scandir):
+            bs = self._run_backup(config)
+        self.assertEqual([r.status for r in bs.results], ["done", "done"])
+        scanned = [p for p in scanned if p.startswith(self.src)]
+        self.assertEqual(sorted(scanned), sorted(set(scanned)))
+        self.assertEqual(len(scanned), 4)
+        archives = {f.split(".", 1)[1]: os.path.join(self.out, f) for f in os.listdir(self.out)
+                    if f.endswith((".tar", ".tar.gz"))}
+        with tarfile.open(archives["tar"]) as tf:
+            self.assertEqual(len(tf.getnames()), 9)
+        with tarfile.open(archives["tar.gz"]) as tf:
+            names = tf.getnames()
+        self.assertEqual(sorted(names), ["src", "src/c", "src/c/f3.txt", "src/c/f4.txt", "src/f0.txt"])
+
+    def test_scancache_filters_per_plan(self):
+        cache = backupy.Scancache()
+        key = (self.src, False)
+        cache.register(key)
+        cache.register(key)
+        with unittest.mock.patch.object(Scanplan, "SPILL_ENTRIES", 3):
+            full = Scanplan([self.src], False).build(lambda p, i: False, lambda p, i: False, cache)
+            pruned = Scanplan([self.src], False).build(
+                lambda p, i: p.endswith("f3.txt"), lambda p, i: p.endswith("/a"), cache)
+        self.assertEqual(len(full), 9)
+        self.assertEqual(sorted(os.path.relpath(path, self.src) for _, path, _ in pruned),
+                         [".", "c", "c/f4.txt", "f0.txt"])
+        walk = cache.get(key)
+        cache.release(key)
+        self.assertIsNotNone(walk._spill)
+        cache.release(key)
+        self.assertIsNone(walk._spill)
+        full.close()
+        pruned.close()
+
+    def test_readable_by_mode(self):
+        st = backupy.Planstat(0o100640, 1, 1, 1, 1000, 100, 0, 0, 0, 0, 0)
+        self.assertTrue(readable_by_mode(st, 1000, {5}))
+        self.assertTrue(readable_by_mode(st, 1001, {100}))
+        self.assertFalse(readable_by_mode(st, 1001, {5}))
+        self.assertFalse(readable_by_mode(st._replace(st_mode=0o100044), 1000, {100}))    # owner class wins
+        self.assertTrue(readable_by_mode(st._replace(st_mode=0o100000), 0, set()))
+
+    def test_preflight_uses_plan(self):
+        with unittest.mock.patch.object(backupy, "readable_by_mode", lambda st, uid, gids: False):
+            bs = self._run_backup(self._config())
+        self.assertEqual(bs.results[0].status, "skipped")
+        self.assertEqual([f for f in os.listdir(self.out) if f.endswith(".tar")], [])
+
+    def test_spill_to_disk(self):
+        with unittest.mock.patch.object(Scanplan, "SPILL_ENTRIES", 3):
+            plan = Scanplan([self.src], False).build(lambda p, i: False, lambda p, i: False)
+            try:
+                self.assertIsNotNone(plan._spill)
+                first = [path for _, path, _ in plan]
+                self.assertEqual(first, [path for _, path, _ in plan])    # repeatable
+                self.assertEqual(len(first), len(plan))
+                self.assertEqual(len(first), 9)
+                for i, path in enumerate(first):    # parents come first
+                    self.assertIn(os.path.dirname(path), first[:i] + [os.path.dirname(self.src)])
+            finally:
+                plan.close()
+            self._run_backup(self._make_config(method="tar"))
+        self.assertEqual(len(self._get_tar_contents()), 9)
+
+
+class TestFanout(_CompressTestBase):
+    """Tasks with the same include dirs read every file once."""
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.src, "a"))
+        self.content = {"f0.txt": b"zero", "a/f1.bin": bytes(range(256)) * 300, "a/empty": b""}
+        for name, data in self.content.items():
+            with open(os.path.join(self.src, name), "wb") as f:
+                f.write(data)
+
+    def _config(self, meta="fanout = true\n", zip_dirs="[]"):
+        second = self._make_config(method="zip", task_dirs=zip_dirs).split("[[backup]]")[1]
+        config = self._make_config(method="tar", followsym="true") + "[[backup]]" + second.replace(
+            'name = "task1"', 'name = "task2"')
+        return config.replace("enabled = true\n", f"enabled = true\n{meta}", 1)
+
+    def _run_counting_opens(self, config):
+        opened = []
+        real_open = open
+
+        def recording_open(file, mode="r", *args, **kwargs):
+            if isinstance(file, str) and file.startswith(self.src):
+                opened.append(file)
+            return real_open(file, mode, *args, **kwargs)
+
+        with unittest.mock.patch("builtins.open", recording_open):
+            bs = self._run_backup(config)
+        self.assertEqual([r.status for r in bs.results], ["done", "done"])
+        return sorted(os.path.relpath(path, self.src) for path in opened)
+
+    def _archives(self):
+        tar = [os.path.join(self.out, f) for f in os.listdir(self.out) if f.endswith(".tar")][0]
+        zip_ = [os.path.join(self.out, f) for f in os.listdir(self.out) if f.endswith(".zip")][0]
+        with tarfile.open(tar) as tf:
+            tar_content = {m.name: tf.extractfile(m).read() for m in tf.getmembers() if m.isfile()}
+        with zipfile.ZipFile(zip_) as zf:
+            zip_content = {name: zf.read(name) for name in zf.namelist()}
+        return tar_content, zip_content
+
+    def test_each_file_read_once(self):
+        self.assertEqual(self._run_counting_opens(self._config()), sorted(self.content))
+        tar_content, zip_content = self._archives()
+        expected = {f"src/{name}": data for name, data in self.content.items()}
+        self.assertEqual(tar_content, expected)
+        self.assertEqual(zip_content, expected)
+
+    def test_own_exclusions_and_backpressure(self):
+        with unittest.mock.patch.object(backupy.Fanout, "CHUNK_SIZE", 1000), \
+                unittest.mock.patch.object(backupy.Fanout, "BUFFER_BYTES", 3000):
+            opened = self._run_counting_opens(self._config(zip_dirs='["a"]'))
+        self.assertEqual(opened, sorted(self.content))
+        tar_content, zip_content = self._archives()
+        self.assertEqual(tar_content, {f"src/{name}": data for name, data in self.content.items()})
+        self.assertEqual(zip_content, {"src/f0.txt": b"zero"})
+
+    def test_disabled(self):
+        for meta in ("fanout = false\n", ""):    # off by default
+            with self.subTest(meta=meta):
+                shutil.rmtree(self.out)
+                opened = self._run_counting_opens(self._config(meta=meta))
+                self.assertEqual(opened, sorted(list(self.content) * 2))
+
+    def test_batches(self):
+        bs = Backupset(self._write_config(self._config()))
+        tar_task, zip_task = bs.task_list
+        self.assertEqual(bs.fanout_batches([tar_task, zip_task]), [[tar_task, zip_task]])
+        tar_task.followsym = False    # tar stores symlinks, zip follows them: different walks
+        self.assertEqual(bs.fanout_batches([tar_task, zip_task]), [[tar_task], [zip_task]])
+
+
+class TestTaskstats(_CompressTestBase):
+    """Per-task counters and phase times, --stats and --profile."""
+
+    def setUp(self):
+        super().setUp()
+        with open(os.path.join(self.src, "a.txt"), "w") as f:
+            f.write("a" * 1000)
+        with open(os.path.join(self.src, "b.log"), "w") as f:
+            f.write("b" * 500)
+        os.makedirs(os.path.join(self.src, "sub"))
+        with open(os.path.join(self.src, "sub", "c.txt"), "w") as f:
+            f.write("c" * 200)
+        os.symlink(os.path.join(self.src, "missing"), os.path.join(self.src, "broken"))
+
+    def test_counters_and_phases(self):
+        for method in ("tar", "zip", "cas"):
+            with self.subTest(method=method):
+                bs = self._run_backup(self._make_config(method=method, followsym="true" if method == "tar" else "false",
+                                                        task_endings='[".log"]'))
+                stats = bs.results[0].stats
+                self.assertEqual(stats["files"], 2)
+                self.assertEqual(stats["bytes_in"], 1200)
+                self.assertEqual(stats["bytes_read"], 1200)
+                self.assertEqual(stats["bytes_out"], bs.results[0].size)
+                self.assertEqual(stats["skipped"]["excluded"], 1)
+                # tar (followsym) and zip follow the dangling symlink, cas stores it
+                self.assertEqual(stats["skipped"].get("broken symlink"), None if method == "cas" else 1)
+                for phase in ("scan", "archive", "read", "hash", "write", "index", "compress"):
+                    self.assertIn(phase, stats["phases"])
+                shutil.rmtree(self.out)
+                os.makedirs(self.out)
+
+    def test_unchanged_files_counted(self):
+        config = self._make_config(method="tar").replace("exclude_files = []", "exclude_files = []\nincremental = true")
+        with unittest.mock.patch.object(backupy, "get_time_short", return_value="run1"):
+            self._run_backup(config)
+        with unittest.mock.patch.object(backupy, "get_time_short", return_value="run2"):
+            bs = self._run_backup(config)
+        stats = bs.results[0].stats
+        self.assertEqual(stats["files"], 0)
+        self.assertEqual(stats["skipped"]["unchanged"], 4)    # 3 files and the symlink
+
+    def test_pickled_for_worker_processes(self):
+        stats = Taskstats()
+        stats.skip("excluded")
+        with stats.phase("scan"):
+            pass
+        import pickle
+        copy = pickle.loads(pickle.dumps(stats))
+        copy.skip("excluded")
+        self.assertEqual(copy.as_dict()["skipped"], {"excluded": 2})
+        self.assertIn("scan", copy.as_dict()["phases"])
+
+    def test_stats_file(self):
+        stats_path = os.path.join(self.tmpdir, "stats.json")
+        backupy_obj = Backupy(["--stats", stats_path, "-s", self._write_config(self._make_config(method="targz"))])
+        self.assertEqual(backupy_obj.execute_backupsets(), 0)
+        with open(stats_path) as f:
+            stats = json.load(f)
+        self.assertEqual(stats["backupy_stats"], 1)
+        backup_set, = stats["backup_sets"]
+        self.assertEqual((backup_set["name"], backup_set["exit_code"]), ("compress test", 0))
+        task, = backup_set["tasks"]
+        self.assertEqual((task["name"], task["status"], task["files"]), ("task1", "done", 3))
+        self.assertEqual(task["skipped"], {})
+
+    def test_profile_dir(self):
+        profile_dir = os.path.join(self.tmpdir, "profile")
+        backupy_obj = Backupy(["--profile", profile_dir, "-s", self._write_config(self._make_config(method="tar"))])
+        try:
+            self.assertEqual(backupy_obj.execute_backupsets(), 0)
+        finally:
+            Backupy.profile_dir = None
+        self.assertEqual(sorted(os.listdir(profile_dir)), ["compress_test-task1.prof", "compress_test-task1.txt"])
+        import pstats
+        self.assertTrue(pstats.Stats(os.path.join(profile_dir, "compress_test-task1.prof")).total_calls)
+        with open(os.path.join(profile_dir, "compress_test-task1.txt")) as f:
+            report = f.read()
+        self.assertIn("Peak traced memory", report)
+        self.assertIn("Top allocating lines", report)
+
+
+class TestProgressmeter(_CompressTestBase):
+    """--progress lines: rate limited, with ETA when the pre-scan totals are known."""
+
+    def test_format_with_totals(self):
+        meter = Progressmeter("docs", total_bytes=4000, total_files=4, tty=False)
+        self.assertEqual(meter.format(1000, 1, 500.0, 2.0),
+                         'progress task="docs" bytes=1000 total_bytes=4000 files=1 total_files=4 rate=500 elapsed=2.0 eta=6.0')
+        meter.tty = True
+        self.assertEqual(meter.format(1000, 1, 500.0, 2.0),
+                         "Progress: 25.0% 1000.0 B / 3.9 KiB, 1/4 files, 500.0 B/s, elapsed 00:00:02, ETA 00:00:06")
+
+    def test_format_without_totals(self):
+        meter = Progressmeter("docs", tty=False)
+        self.assertEqual(meter.format(1000, 1, 500.0, 2.0), 'progress task="docs" bytes=1000 files=1 rate=500 elapsed=2.0')
+        meter.tty = True
+        self.assertNotIn("ETA", meter.format(1000, 1, 500.0, 2.0))
+
+    def test_rate_limited(self):
+        meter = Progressmeter("docs", interval=3600, tty=False)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            for done in range(1000):
+                meter.update(done, 1)
+        self.assertEqual(output.getvalue(), "")
+
+    def test_progress_lines_of_a_task(self):
+        for i in range(3):
+            with open(os.path.join(self.src, f"f{i}.bin"), "wb") as f:
+                f.write(os.urandom(100000))
+        output = io.StringIO()
+        with unittest.mock.patch.object(Backupy, "progress_interval", 1e-9), contextlib.redirect_stdout(output):
+            self._run_backup(self._make_config(method="tar"))
+        lines = [line[line.index(" progress ") + 1:] for line in output.getvalue().splitlines() if " progress " in line]
+        self.assertTrue(lines)
+        fields = dict(field.split("=", 1) for field in lines[-1].split()[1:])
+        self.assertEqual((fields["task"], fields["total_bytes"], fields["total_files"]), ('"task1"', "300000", "3"))
+        self.assertIn("eta", fields)
+
+
+class TestLogger(_CompressTestBase):
+    """Leveled, buffered logger: lazy formatting, warning floods, JSON lines."""
+
+    def _log(self, log, *calls):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            for level, msg, args, kwargs in calls:
+                log.log(level, msg, args, **kwargs)
+            before_flush = output.getvalue()
+            log.flush()
+        return before_flush, output.getvalue()
+
+    def test_debug_not_formatted_below_level(self):
+        formatted = []
+
+        class Arg:
+            def __str__(self):
+                formatted.append(1)
+                return "arg"
+        log = Logger()
+        _, output = self._log(log, (Logger.DEBUG, "excluded: %s", (Arg(),), {}))
+        self.assertEqual((output, formatted), ("", []))
+        log.level = Logger.DEBUG
+        _, output = self._log(log, (Logger.DEBUG, "excluded: %s", (Arg(),), {}))
+        self.assertTrue(output.endswith("excluded: arg\n"))
+        self.assertEqual(formatted, [1])
+
+    def test_warnings_buffered_until_info(self):
+        log = Logger()
+        before_flush, _ = self._log(log, (Logger.WARNING, "first", (), {}))
+        self.assertEqual(before_flush, "")
+        before_flush, _ = self._log(log, (Logger.WARNING, "second", (), {}), (Logger.INFO, "third", (), {}))
+        self.assertEqual([line.split(" ", 1)[1] for line in before_flush.splitlines()], ["second", "third"])
+
+    def test_buffered_warnings_flushed_by_timer(self):
+        log = Logger()
+        output = io.StringIO()
+        with unittest.mock.patch.object(Logger, "FLUSH_SECONDS", 0.05), contextlib.redirect_stdout(output):
+            log.log(Logger.WARNING, "alone")
+            self.assertEqual(output.getvalue(), "")
+            deadline = time.monotonic() + 5
+            while not output.getvalue() and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertTrue(output.getvalue().endswith("alone\n"))
+        self.assertIsNone(log._timer)
+
+    def test_warning_flood_summarized(self):
+        log = Logger()
+        calls = [(Logger.WARNING, "Skip file (permission error): %s", (f"/src/{i}",),
+                  {"key": "Skip file (permission error)"}) for i in range(Logger.WARNING_LIMIT + 50)]
+        _, output = self._log(log, *calls)
+        self.assertEqual(len(output.splitlines()), Logger.WARNING_LIMIT)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            log.close_json()    # at exit
+        self.assertIn(f"Skip file (permission error): 50 more not logged ({Logger.WARNING_LIMIT + 50} in total)",
+                      output.getvalue())
+        self.assertEqual(log._warnings, {})
+
+    def test_json_lines(self):
+        path = os.path.join(self.tmpdir, "log.jsonl")
+        log = Logger()
+        log.open_json(path)
+        self._log(log, (Logger.ERROR, "disk %s", ("full",), {"color": backupy.Colors.colorred}),
+                  (Logger.WARNING, "careful", (), {}))
+        log.close_json()
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([(r["level"], r["message"]) for r in records], [("error", "disk full"), ("warning", "careful")])
+
+    def test_log_json_option(self):
+        path = os.path.join(self.tmpdir, "log.jsonl")
+        with open(os.path.join(self.src, "a.txt"), "w") as f:
+            f.write("a")
+        try:
+            backupy_obj = Backupy(["--log-json", path, "-s", self._write_config(self._make_config(method="tar"))])
+            self.assertEqual(backupy_obj.execute_backupsets(), 0)
+        finally:
+            backupy.logger.close_json()
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertTrue(any(r["message"] == "backupy finished" for r in records))
+        self.assertTrue(any(r["task"] == "task1" and r["set"] == "compress test" for r in records))
+
+
 class TestCompressZip(_CompressTestBase):
     """Integration tests for compress_zip."""
 
@@ -694,6 +2284,90 @@ class TestCompressZip(_CompressTestBase):
         self.assertTrue(any("real.txt" in n for n in names))
         self.assertFalse(any("broken" in n for n in names))
 
+    def _zip_compress_types(self, extra=""):
+        data = {"photo.JPG": b"text " * 20000, "random.bin": os.urandom(200 * 1024),
+                "text.txt": b"text " * 20000, "small.dat": os.urandom(1000)}
+        for name, content in data.items():
+            with open(os.path.join(self.src, name), "wb") as f:
+                f.write(content)
+        self._run_backup(self._make_config(method="zip").replace('method = "zip"', f'method = "zip"\n{extra}'))
+        archive = [f for f in os.listdir(self.out) if f.endswith(".zip")][0]
+        with zipfile.ZipFile(os.path.join(self.out, archive)) as zf:
+            for name, content in data.items():
+                self.assertEqual(zf.read(f"src/{name}"), content)
+            return {os.path.basename(info.filename): info.compress_type for info in zf.infolist()}
+
+    def test_zip_stores_incompressible_files(self):
+        self.assertEqual(self._zip_compress_types(), {
+            "photo.JPG": zipfile.ZIP_STORED,    # by extension
+            "random.bin": zipfile.ZIP_STORED,    # by sample
+            "text.txt": zipfile.ZIP_DEFLATED,
+            "small.dat": zipfile.ZIP_DEFLATED})    # too small to sample
+
+    def test_zip_compression_level(self):
+        types = self._zip_compress_types("compression_level = 0")
+        self.assertEqual(set(types.values()), {zipfile.ZIP_STORED})
+
+    def test_zip_compression_level_without_zipinfo_attribute(self):
+        with open(os.path.join(self.src, "text.txt"), "wb") as f:
+            f.write(b"text " * 20000)
+        config = self._make_config(method="zip").replace('method = "zip"', 'method = "zip"\ncompression_level = 9')
+        archives = []
+        for level_attr in (backupy.ZIPFILE_INTERNALS["level"], None):
+            shutil.rmtree(self.out)
+            with unittest.mock.patch.dict(backupy.ZIPFILE_INTERNALS, level=level_attr):
+                self._run_backup(config)
+            archive = [f for f in os.listdir(self.out) if f.endswith(".zip")][0]
+            with open(os.path.join(self.out, archive), "rb") as f:
+                archives.append(f.read())
+        self.assertEqual(archives[0], archives[1])
+        with zipfile.ZipFile(io.BytesIO(archives[0])) as zf:
+            self.assertEqual(zf.read("src/text.txt"), b"text " * 20000)
+
+    def _parallel_zip(self, threads):
+        for f in os.listdir(self.out):
+            os.remove(os.path.join(self.out, f))
+        config = self._make_config(method="zip").replace('method = "zip"', f'method = "zip"\nthreads = {threads}')
+        self._run_backup(config)
+        archive = [f for f in os.listdir(self.out) if f.endswith(".zip")][0]
+        with open(os.path.join(self.out, archive), "rb") as f:
+            return f.read()
+
+    def test_parallel_zip_ordered_and_deterministic(self):
+        rng = random.Random(7)
+        os.makedirs(os.path.join(self.src, "sub"))
+        data = {}
+        for i in range(30):
+            name = f"sub/f{i}.txt" if i % 3 else f"f{i}.bin"
+            data[name] = (f"line {i}\n" * rng.randrange(1, 5000)).encode() if i % 3 else rng.randbytes(200000)
+            with open(os.path.join(self.src, name), "wb") as f:
+                f.write(data[name])
+        serial = self._parallel_zip(1)
+        with unittest.mock.patch.multiple(backupy.Parallelzipwriter, STREAM_SIZE=150000, MAX_INFLIGHT=200000):
+            two, four = self._parallel_zip(2), self._parallel_zip(4)
+        self.assertEqual(two, four)
+        with zipfile.ZipFile(io.BytesIO(serial)) as zs, zipfile.ZipFile(io.BytesIO(four)) as zp:
+            self.assertIsNone(zp.testzip())
+            self.assertEqual(zp.namelist(), zs.namelist())
+            self.assertEqual([i.compress_type for i in zp.infolist()], [i.compress_type for i in zs.infolist()])
+            for name, content in data.items():
+                self.assertEqual(zp.read(f"src/{name}"), content)
+
+    def test_parallel_zip_without_zipfile_internals(self):
+        for i in range(10):
+            with open(os.path.join(self.src, f"f{i}.txt"), "w") as f:
+                f.write(f"line {i}\n" * 1000)
+        serial = self._parallel_zip(1)
+        with unittest.mock.patch.dict(backupy.ZIPFILE_INTERNALS, append=False), \
+                unittest.mock.patch.object(backupy.Parallelzipwriter, "append", side_effect=AssertionError):
+            self.assertEqual(self._parallel_zip(4), serial)
+
+    def test_parallel_zip_inflight_cap(self):
+        with zipfile.ZipFile(io.BytesIO(), "w") as archive, backupy.Parallelzipwriter(archive, 2, 100) as zipper:
+            due = [len(list(zipper.submit(i, 40, lambda: None))) for i in range(5)]
+            self.assertEqual(due, [0, 0, 1, 1, 1])    # the oldest entry goes once more than 100 bytes are queued
+            self.assertEqual([item for item, _ in zipper.drain()], [3, 4])
+
     def test_zip_permission_denied_skipped(self):
         open(os.path.join(self.src, "good.txt"), "w").close()
         noperm = os.path.join(self.src, "secret.txt")
@@ -726,6 +2400,177 @@ class TestCompressZip(_CompressTestBase):
         self.assertTrue(os.path.exists(md5_file))
 
 
+class TestExcludedDirPruning(_CompressTestBase):
+    """Excluded subtrees must not be listed at all."""
+
+    def setUp(self):
+        super().setUp()
+        for d in ("node_modules/pkg", "vendor/lib", "app"):
+            os.makedirs(os.path.join(self.src, d))
+            open(os.path.join(self.src, d, "f.txt"), "w").close()
+
+    def _scanned_dirs(self, func):
+        scanned = []
+        real_scandir = os.scandir
+
+        def recording_scandir(path="."):
+            scanned.append(os.fspath(path))
+            return real_scandir(path)
+
+        with unittest.mock.patch("os.scandir", recording_scandir):
+            func()
+        return scanned
+
+    def test_zip_prunes_excluded_dirs(self):
+        fullpath = os.path.join(self.src, "vendor")
+        cfg = self._make_config(method="zip", global_dirs='["node_modules"]', task_fullpaths=f'["{fullpath}"]')
+        scanned = self._scanned_dirs(lambda: self._run_backup(cfg))
+        self.assertIn(os.path.join(self.src, "app"), scanned)
+        self.assertFalse(any("node_modules" in p or "vendor" in p for p in scanned))
+        names = self._get_zip_contents()
+        self.assertTrue(any("app/f.txt" in n for n in names))
+        self.assertFalse(any("pkg" in n or "lib" in n for n in names))
+
+
+class TestParallelTasks(_CompressTestBase):
+    """Device grouping and parallel execution of backup tasks."""
+
+    def _two_task_config(self, workers):
+        src2 = os.path.join(self.tmpdir, "src2")
+        os.makedirs(src2, exist_ok=True)
+        open(os.path.join(self.src, "a.txt"), "w").close()
+        open(os.path.join(src2, "b.txt"), "w").close()
+        cfg = self._make_config().replace("enabled = true\n", f"enabled = true\nworkers = {workers}\n", 1)
+        second = cfg[cfg.index("[[backup]]"):].replace('name = "task1"', 'name = "task2"')
+        second = second.replace('archive_name = "out"', 'archive_name = "out2"').replace(self.src, src2)
+        return cfg + second
+
+    def test_tasks_sharing_a_device_are_grouped(self):
+        bs = Backupset(self._write_config(self._two_task_config(2)))
+        t1, t2 = bs.task_list
+        with unittest.mock.patch.object(Backuptask, "device_ids", lambda task: {1} if task is t1 else {1, 2}):
+            self.assertEqual(bs.group_tasks_by_device([t1, t2]), [[t1, t2]])
+        with unittest.mock.patch.object(Backuptask, "device_ids", lambda task: {1} if task is t1 else {2}):
+            self.assertEqual(bs.group_tasks_by_device([t1, t2]), [[t1], [t2]])
+
+    def test_independent_tasks_run_in_parallel(self):
+        bs = Backupset(self._write_config(self._two_task_config(2)))
+        threads = {}
+        real_execute = Backuptask.execute
+        both_running = threading.Barrier(2, timeout=10)
+
+        def recording_execute(task):
+            threads[task.name] = threading.current_thread().name
+            both_running.wait()    # breaks (timeout) if the tasks run one after the other
+            return real_execute(task)
+
+        with unittest.mock.patch.object(Backuptask, "device_ids", lambda task: {task.name}), \
+                unittest.mock.patch.object(Backuptask, "execute", recording_execute):
+            results = bs.execute()
+        self.assertNotEqual(threads["task1"], threads["task2"])
+        self.assertEqual(sorted((r.name, r.status) for r in results), [("task1", "done"), ("task2", "done")])
+        self.assertEqual(len([f for f in os.listdir(self.out) if f.endswith(".tar.gz")]), 2)
+
+    def test_workers_default_to_one(self):
+        self.assertEqual(Backupset(self._write_config(self._make_config())).workers, 1)
+
+    def test_failing_task_reported_in_its_result(self):
+        bs = Backupset(self._write_config(self._two_task_config(2)))
+        real_execute = Backuptask.execute
+
+        def failing_execute(task):
+            if task.name == "task1":
+                sys.exit(28)
+            return real_execute(task)
+
+        with unittest.mock.patch.object(Backuptask, "device_ids", lambda task: {task.name}), \
+                unittest.mock.patch.object(Backuptask, "execute", failing_execute), \
+                self.assertRaises(SystemExit) as raised:
+            bs.execute()
+        self.assertEqual(raised.exception.code, 28)
+        self.assertEqual(sorted((r.name, r.status, r.exit_code) for r in bs.results),
+                         [("task1", "failed", 28), ("task2", "done", 0)])
+        self.assertEqual(len([f for f in os.listdir(self.out) if f.endswith(".tar.gz")]), 1)
+
+    def test_invalid_workers_exits(self):
+        with self.assertRaises(SystemExit):
+            Backupset(self._write_config(self._two_task_config(-1)))
+
+    def test_available_cpu_count_respects_cgroup_quota(self):
+        with open(os.path.join(self.tmpdir, "cpu.max"), "w") as f:
+            f.write("150000 100000\n")
+        self.assertEqual(available_cpu_count(self.tmpdir), min(2, len(os.sched_getaffinity(0))))
+        with open(os.path.join(self.tmpdir, "cpu.max"), "w") as f:
+            f.write("max 100000\n")
+        self.assertEqual(available_cpu_count(self.tmpdir), len(os.sched_getaffinity(0)))
+
+
+class TestParallelBackupsets(_CompressTestBase):
+    """--jobs: backup sets executed in parallel processes."""
+
+    def setUp(self):
+        super().setUp()
+        # execute_backupset_process sets up the (worker) process: restored for the other tests
+        saved = (Backupy.debug, Backupy.profile_dir, Backupy.progress_interval, Backupy.log_prefix,
+                 backupy.logger.level)
+        line_buffering = getattr(sys.stdout, "line_buffering", None)
+
+        def restore():
+            (Backupy.debug, Backupy.profile_dir, Backupy.progress_interval, Backupy.log_prefix,
+             backupy.logger.level) = saved
+            if line_buffering is not None and hasattr(sys.stdout, "reconfigure"):
+                sys.stdout.reconfigure(line_buffering=line_buffering)
+        self.addCleanup(restore)
+
+    def _set_config(self, name):
+        src = os.path.join(self.tmpdir, f"src_{name}")
+        os.makedirs(src)
+        open(os.path.join(src, f"{name}.txt"), "w").close()
+        cfg = self._make_config().replace(self.src, src).replace('name = "compress test"', f'name = "{name}"')
+        cfg = cfg.replace('archive_name = "out"', f'archive_name = "{name}"')
+        path = os.path.join(self.tmpdir, f"{name}.toml")
+        with open(path, "w") as f:
+            f.write(cfg)
+        return path
+
+    def test_jobs_executes_all_sets(self):
+        paths = [self._set_config(name) for name in ("set1", "set2", "set3")]
+        backupy = Backupy(["-j", "2", "-s"] + paths)
+        self.assertEqual(backupy.execute_backupsets(), 0)
+        archives = sorted(f.split("_")[0] for f in os.listdir(self.out) if f.endswith(".tar.gz"))
+        self.assertEqual(archives, ["set1", "set2", "set3"])
+
+    def test_worker_returns_exit_code(self):
+        bs = Backupset(self._set_config("failing"))
+        with unittest.mock.patch.object(Backupset, "execute", side_effect=SystemExit(28)):
+            code, elapsed, results = execute_backupset_process(bs, False)
+        self.assertEqual(code, 28)
+        self.assertGreaterEqual(elapsed, 0)
+        self.assertEqual(results, [])
+
+    def test_failing_set_does_not_stop_the_others(self):
+        paths = [self._set_config(name) for name in ("set1", "set2", "set3")]
+        execute = Backupset.execute
+
+        def fails_first(backupset):
+            if backupset.name == "set1":
+                sys.exit(28)
+            execute(backupset)
+        for jobs in ("1", "2"):
+            with self.subTest(jobs=jobs):
+                for f in os.listdir(self.out):
+                    os.remove(os.path.join(self.out, f))
+                backupy = Backupy(["-j", jobs, "-s"] + paths)
+                with unittest.mock.patch.object(Backupset, "execute", fails_first):
+                    self.assertEqual(backupy.execute_backupsets(), 28)
+                archives = sorted(f.split("_")[0] for f in os.listdir(self.out) if f.endswith(".tar.gz"))
+                self.assertEqual(archives, ["set2", "set3"])
+
+    def test_invalid_jobs_exits(self):
+        with self.assertRaises(SystemExit):
+            Backupy(["-j", "0", "-s", self._set_config("set1")])
+
+
 class TestEdgeCases(_CompressTestBase):
     """Edge cases and unusual scenarios."""
 
@@ -896,5 +2741,50 @@ exclude_files = []
         bs.execute()
 
 
+class TestBenchmark(unittest.TestCase):
+    """benchmark_backupy: synthetic trees and the phase report (tiny scale, in-process)."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _tree(self, path):
+        return sorted((os.path.relpath(os.path.join(d, f), path), os.path.getsize(os.path.join(d, f))
+                       if not os.path.islink(os.path.join(d, f)) else os.readlink(os.path.join(d, f)))
+                      for d, _, files in os.walk(path) for f in files)
+
+    def test_trees_are_reproducible(self):
+        for profile in benchmark_backupy.PROFILES:
+            with self.subTest(profile=profile):
+                first, second = (os.path.join(self.tmpdir, f"{profile}{i}") for i in (1, 2))
+                benchmark_backupy.generate_tree(first, profile, 0.01)
+                benchmark_backupy.generate_tree(second, profile, 0.01)
+                self.assertEqual(self._tree(first), self._tree(second))
+                self.assertTrue(self._tree(first))
+
+    def test_text_corpus_vocabulary(self):
+        self.assertGreater(len(set(benchmark_backupy.WORDS)), 3500)
+        data = benchmark_backupy.text_data(random.Random(1), 2 ** 20)
+        self.assertGreater(len(zlib.compress(data, 6)) / len(data), 0.3)
+
+    def test_report(self):
+        with contextlib.redirect_stderr(io.StringIO()):
+            report = benchmark_backupy.run_benchmark(["excluded"], 0.01, ["tar", "zip"], 1, root=self.tmpdir,
+                                                     isolated=False)
+        json.dumps(report)
+        phases = report["profiles"]["excluded"]["phases"]
+        self.assertEqual(sorted(phases), ["exclude", "hash", "scan", "tar", "zip"])
+        self.assertEqual(phases["scan"]["files"], 100)
+        self.assertEqual(phases["exclude"]["excluded"], 72)    # 70 files + the 'node_modules' and 'cache' dirs
+        for phase in ("tar", "zip"):
+            self.assertGreater(phases[phase]["mb_per_s"], 0)
+            self.assertLess(phases[phase]["files"], 100)
+        self.assertEqual(sorted(phases["hash"]), ["blake2b", "md5", "sha256"])
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        slower = dict(report, profiles={"excluded": {"phases": {"tar": dict(phases["tar"], seconds=1000)}}})
+        self.assertEqual([p[:2] for p in benchmark_backupy.compare(slower, report, 0.1)], [("excluded", "tar")])
+        self.assertEqual(benchmark_backupy.compare(report, report, 0.1), [])
+
+
 if __name__ == '__main__':
     unittest.main()